@@ -7,6 +7,9 @@ from meshiphi import __version__ as version
 from meshiphi.utils import setup_logging, timed_call
 from meshiphi.mesh_generation.mesh_builder import MeshBuilder
 from meshiphi.mesh_generation.environment_mesh import EnvironmentMesh
+from meshiphi.mesh_generation.binary_mesh import is_binary_mesh
+from meshiphi.mesh_generation.mesh_writer import load_mesh_json
+from meshiphi.dataloaders.data_cache import get_data_cache, set_data_cache
 from meshiphi.test_automation.test_automater import TestAutomater
 
 @setup_logging
@@ -15,7 +18,10 @@ def get_args(
         config_arg: bool = True,
         mesh_arg: bool = False,
         format_arg: bool = False,
-        merge_arg: bool = False):
+        merge_arg: bool = False,
+        workers_arg: bool = False,
+        compact_arg: bool = False,
+        cache_arg: bool = False):
     """
     Adds required command line arguments to all CLI entry points.
 
@@ -23,6 +29,9 @@ def get_args(
         default_output (str): The default output file location.
         config_arg (bool): True if the CLI entry point requires a <config.json> file. Default is True.
         mesh_arg (bool): True if the CLI entry point requires a <mesh.json> file. Default is False.
+        workers_arg (bool): True if the CLI entry point builds a mesh, and can set the number of workers to aggregate with. Default is False.
+        compact_arg (bool): True if the CLI entry point saves a mesh, and can save it as compact JSON. Default is False.
+        cache_arg (bool): True if the CLI entry point loads data, and can cache it between runs. Default is False.
 
     Returns:
 
@@ -53,7 +62,7 @@ def get_args(
     if format_arg:
         ap.add_argument("format",
                         help = "Export format to transform a mesh into. Supported \
-                        formats are JSON, GEOJSON, Tif")
+                        formats are JSON, GEOJSON, Tif, PNG, BINARY")
         ap.add_argument( "-f", "--format_conf",
                         default = None,
                         help = "File location of Export to Tif configuration parameters")
@@ -68,10 +77,50 @@ def get_args(
                         to merge. If set, the merge file is expected to be a directory of \
                         meshes to merge with the input mesh. The output will be a single merged mesh.")
 
+    if workers_arg:
+        ap.add_argument("-w", "--workers",
+                    default=None,
+                    type=int,
+                    help="Number of worker processes to aggregate cellboxes with. \
+                        Overrides 'aggregation_workers' in the config if set.")
 
+    if compact_arg:
+        ap.add_argument("-c", "--compact",
+                    default=False,
+                    action="store_true",
+                    help="Save the mesh as compact JSON, without indentation. \
+                        The output is compressed if the output file ends in .gz or .zst")
+
+    if cache_arg:
+        ap.add_argument("--data_cache",
+                    default=None,
+                    help="Directory to cache the data loaded from files in, so that it \
+                        is reused by later runs with the same inputs. \
+                        Overrides the MESHIPHI_DATA_CACHE environment variable if set.")
+        ap.add_argument("--no_data_cache",
+                    default=False,
+                    action="store_true",
+                    help="Load all data from files, without reading or writing the data cache")
+        ap.add_argument("--clear_data_cache",
+                    default=False,
+                    action="store_true",
+                    help="Remove all data from the data cache before loading data")
 
     return ap.parse_args()
 
+def setup_data_cache(args):
+    """
+        Sets up the cache of data loaded from files from the command line arguments
+    """
+    if args.data_cache is not None:
+        set_data_cache(args.data_cache)
+
+    data_cache = get_data_cache()
+    if data_cache is not None and args.clear_data_cache:
+        data_cache.clear()
+    if args.no_data_cache:
+        set_data_cache(None)
+
 @timed_call
 def rebuild_mesh_cli():
     """
@@ -79,19 +128,20 @@ def rebuild_mesh_cli():
     """
 
     default_output = "rebuild_mesh.output.json"
-    args = get_args(default_output, mesh_arg=True, config_arg=False)
+    args = get_args(default_output, mesh_arg=True, config_arg=False, workers_arg=True,
+                    compact_arg=True, cache_arg=True)
     logging.info("{} {}".format(inspect.stack()[0][3][:-4], version))
+    setup_data_cache(args)
 
-    mesh_json = json.load(args.mesh)
+    mesh_json = load_mesh_json(args.mesh.name)
     config = mesh_json['config']['mesh_info']
 
     # rebuilding mesh...
-    rebuilt_mesh = MeshBuilder(config).build_environmental_mesh()
-    rebuilt_mesh_json = rebuilt_mesh.to_json()
+    rebuilt_mesh = MeshBuilder(config).build_environmental_mesh(workers=args.workers)
 
     logging.info("Saving mesh to {}".format(args.output))
     
-    json.dump(rebuilt_mesh_json, open(args.output, "w"), indent=4)
+    rebuilt_mesh.save(args.output, compact=args.compact)
 
 
 
@@ -102,17 +152,17 @@ def create_mesh_cli():
     """
     
     default_output = "create_mesh.output.json"
-    args = get_args(default_output)
+    args = get_args(default_output, workers_arg=True, compact_arg=True, cache_arg=True)
     logging.info("{} {}".format(inspect.stack()[0][3][:-4], version))
+    setup_data_cache(args)
 
     config = json.load(args.config)
 
     # Discrete Meshing
-    cg = MeshBuilder(config).build_environmental_mesh()
+    cg = MeshBuilder(config).build_environmental_mesh(workers=args.workers)
 
     logging.info("Saving mesh to {}".format(args.output))
-    info = cg.to_json()
-    json.dump(info, open(args.output, "w"), indent=4)
+    cg.save(args.output, compact=args.compact)
     
 
 @timed_call
@@ -144,11 +194,21 @@ def export_mesh_cli():
                     config_arg = False, 
                     mesh_arg = True, 
                     format_arg = True)
+
+    elif args.format.upper() == "BINARY":
+        args = get_args("mesh.bin", 
+                    config_arg = False, 
+                    mesh_arg = True, 
+                    format_arg = True)
     
     logging.info("{} {}".format(inspect.stack()[0][3][:-4], version))
 
-    mesh = json.load(args.mesh)
-    env_mesh = EnvironmentMesh.load_from_json(mesh)
+    # Input mesh may be JSON, compressed JSON or binary
+    if is_binary_mesh(args.mesh.name):
+        env_mesh = EnvironmentMesh.load_from_binary(args.mesh.name)
+    else:
+        mesh = load_mesh_json(args.mesh.name)
+        env_mesh = EnvironmentMesh.load_from_json(mesh)
 
     logging.info(f"exporting mesh to {args.output} in format {args.format}")
 
@@ -164,11 +224,11 @@ def merge_mesh_cli():
     from os.path import isfile, join
 
     default_output = "merged_mesh.output.json"
-    args = get_args(default_output, config_arg = False, mesh_arg=True, merge_arg=True)
+    args = get_args(default_output, config_arg = False, mesh_arg=True, merge_arg=True,
+                    compact_arg=True)
     logging.info("{} {}".format(inspect.stack()[0][3][:-4], version))
 
-    with open(args.mesh.name, "r") as f:
-        mesh1 = json.load(args.mesh)
+    mesh1 = load_mesh_json(args.mesh.name)
     env_mesh1 = EnvironmentMesh.load_from_json(mesh1)
     
     if args.directory:
@@ -177,25 +237,22 @@ def merge_mesh_cli():
         merge_dir = args.merge
         merge_meshes = [f for f in listdir(merge_dir) if isfile(join(merge_dir, f))]
 
-        for mesh in merge_meshes:
-            path = join(merge_dir, mesh)
-            with open(path, "r") as f:
-                merge_mesh = json.load(f)
-            env_mesh_merge = EnvironmentMesh.load_from_json(merge_mesh)
+        def load_merge_meshes():
+            # Load each mesh as it is merged, rather than all of them at once
+            for mesh in merge_meshes:
+                merge_mesh = load_mesh_json(join(merge_dir, mesh))
+                yield EnvironmentMesh.load_from_json(merge_mesh)
 
-            env_mesh1.merge_mesh(env_mesh_merge)
+        env_mesh1.merge_meshes(load_merge_meshes())
     else:
     
-        with open(args.merge, "r") as f:
-            mesh2 = json.load(f)    
+        mesh2 = load_mesh_json(args.merge)
         env_mesh2 = EnvironmentMesh.load_from_json(mesh2)
 
         env_mesh1.merge_mesh(env_mesh2)
        
-    merged_mesh_json = env_mesh1.to_json()
-
     logging.info("Saving merged mesh to {}".format(args.output))
-    json.dump(merged_mesh_json, open(args.output, "w"), indent=4)
+    env_mesh1.save(args.output, compact=args.compact)
 
 
 
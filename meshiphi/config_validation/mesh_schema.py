@@ -34,10 +34,21 @@ splitting_schema = {
     "additionalProperties": False,
     "properties":{
         "split_depth": {"type": "integer"},
-        "minimum_datapoints": {"type": "integer"}
+        "minimum_datapoints": {"type": "integer"},
+        "split_mode": {"type": "string", "enum": ["depth_first", "breadth_first"]}
     } 
 }
 
+parallel_schema = {
+    "type": "object",
+    "additionalProperties": False,
+    "properties":{
+        "dataloader_workers": {"type": "integer", "minimum": 1},
+        "aggregation_workers": {"type": "integer", "minimum": 1},
+        "pool": {"type": "string", "enum": ["process", "thread"]}
+    }
+}
+
 mesh_schema = {
     "type": "object",
     "required": ["region", "data_sources", "splitting"],
@@ -53,9 +64,13 @@ mesh_schema = {
         },
         "splitting": {
             "$ref": "#/splitting_schema"
+        },
+        "parallel": {
+            "$ref": "#/parallel_schema"
         }
     },
     "region_schema": region_schema,
     "dataloader_schema": dataloader_schema,
-    "splitting_schema": splitting_schema
+    "splitting_schema": splitting_schema,
+    "parallel_schema": parallel_schema
 }
\ No newline at end of file
@@ -0,0 +1,336 @@
+"""
+On-disk cache of the standardised datasets created by dataloaders, shared
+between runs.
+
+Initialising a dataloader from files (importing, downsampling, reprojecting,
+renaming and trimming the data to the initial boundary) is repeated every time
+a mesh is created or rebuilt, even if none of its inputs have changed. Each
+entry is keyed on a hash of the dataloader name, the params that affect its
+data, the paths, sizes and modification times of its files, and the initial
+boundary, so that entries are never reused once any of these change.
+xr.Dataset's are stored as NetCDF and pd.DataFrame's as Parquet (which
+requires the 'pyarrow' package, otherwise DataFrames aren't cached). Entries
+that can't be read are treated as missing and removed.
+
+Small sets of arrays derived from the data, such as reprojection index maps,
+can also be stored in the cache, under the 'arrays' subdirectory. The least
+recently used entries and arrays are removed once the cache is larger than
+its size cap.
+
+The cache is disabled unless a directory is set, either with the
+MESHIPHI_DATA_CACHE environment variable or set_data_cache().
+"""
+
+import hashlib
+import json
+import logging
+import os
+import tempfile
+
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+
+# Params that only affect how the data is used once loaded, not the data itself
+IGNORED_PARAMS = ['splitting_conditions', 'value_fill_type', 'min_dp',
+                  'trim_cache_mb', 'hom_tables', 'agg_tables', 'chunks']
+
+# Default size cap of the cache, in megabytes
+DEFAULT_MAX_MB = 10240
+
+# Extensions of the files of an entry. '.pkl' entries written by earlier
+# versions are never read, only removed
+ENTRY_EXTENSIONS = ['.json', '.nc', '.parquet', '.pkl']
+
+# Prefix of the keys of sets of arrays, as listed by DataCache.entries()
+ARRAYS_PREFIX = 'arrays/'
+
+_data_cache_settings = {'directory': os.environ.get('MESHIPHI_DATA_CACHE') or None,
+                        'max_mb': float(os.environ.get('MESHIPHI_DATA_CACHE_MB',
+                                                       DEFAULT_MAX_MB))}
+
+
+def set_data_cache(directory, max_mb=None):
+    '''
+    Sets the directory of the data cache used by all dataloaders
+
+    Args:
+        directory (str or None): Directory to store the cache in. None disables the cache
+        max_mb (float or None): Size cap of the cache in megabytes. Unchanged if None
+    '''
+    _data_cache_settings['directory'] = directory
+    if max_mb is not None:
+        _data_cache_settings['max_mb'] = max_mb
+
+
+def get_data_cache():
+    '''
+    Returns the data cache used by all dataloaders
+
+    Returns:
+        DataCache or None: Data cache, or None if the cache is disabled
+    '''
+    if not _data_cache_settings['directory']:
+        return None
+    return DataCache(_data_cache_settings['directory'],
+                     int(_data_cache_settings['max_mb'] * 1024**2))
+
+
+class DataCache:
+    '''
+    Directory of standardised datasets, each stored as a data file and a JSON
+    file describing it, named by the key of the entry.
+
+    Attributes:
+        directory (str): Directory the cache is stored in
+        max_bytes (int): Size cap of the cache, in bytes
+    '''
+    def __init__(self, directory, max_bytes):
+        '''
+        Args:
+            directory (str): Directory the cache is stored in. Created if it doesn't exist
+            max_bytes (int): Size cap of the cache, in bytes
+        '''
+        self.directory = directory
+        self.max_bytes = max_bytes
+        os.makedirs(directory, exist_ok=True)
+
+    @staticmethod
+    def key(loader_name, params, bounds):
+        '''
+        Creates a key for the data of a dataloader
+
+        Args:
+            loader_name (str): Name of the dataloader
+            params (dict): Params of the dataloader, including a list of 'files'
+            bounds (Boundary): Initial boundary the data is trimmed to
+
+        Returns:
+            str: Hash of everything the standardised data depends on
+        '''
+        files = [(os.path.abspath(file), os.stat(file).st_size, os.stat(file).st_mtime_ns)
+                 for file in params['files']]
+        data_params = {key: val for key, val in params.items()
+                       if key not in IGNORED_PARAMS and key != 'files'}
+        key_json = json.dumps({'loader': loader_name,
+                               'params': data_params,
+                               'files': files,
+                               'bounds': [bounds.get_lat_min(), bounds.get_lat_max(),
+                                          bounds.get_long_min(), bounds.get_long_max(),
+                                          bounds.get_time_range()]},
+                              sort_keys=True, default=str)
+        return hashlib.sha256(key_json.encode('utf-8')).hexdigest()
+
+    def _path(self, key, extension):
+        '''
+        Returns the location of a file of an entry
+        '''
+        return os.path.join(self.directory, key + extension)
+
+    def get(self, key, chunks=None):
+        '''
+        Retrieves a dataset from the cache
+
+        Args:
+            key (str): Key of the entry
+            chunks (dict or str or None):
+                If not None, xr.Dataset's are opened lazily with these chunks
+                rather than loaded into memory
+
+        Returns:
+            (pd.DataFrame or xr.Dataset, str, list<str>) or None:
+                Dataset, name of its data variable(s) and the files it was
+                read from, or None if there is no entry, or the entry can't
+                be read. Entries that can't be read are removed
+        '''
+        info_path = self._path(key, '.json')
+        if not os.path.exists(info_path):
+            return None
+        try:
+            with open(info_path, 'r') as fp:
+                info = json.load(fp)
+            data_path = self._path(key, info['extension'])
+            if info['extension'] == '.nc':
+                if chunks is None:  data = xr.load_dataset(data_path)
+                else:               data = xr.open_dataset(data_path, chunks=chunks)
+            elif info['extension'] == '.parquet':
+                data = pd.read_parquet(data_path)
+            else:
+                raise ValueError(f"Unknown format '{info['extension']}'")
+            data_name, files = info['data_name'], info['files']
+        # Any entry that can't be read, for whatever reason (truncated, 
+        # written by another version, missing packages), counts as missing
+        except Exception as err:
+            logging.warning(f'\tUnable to read cached data {key}: {err}')
+            self.remove(key)
+            return None
+        # Mark entry as recently used
+        os.utime(info_path)
+        return data, data_name, files
+
+    def put(self, key, data, data_name, files):
+        '''
+        Adds a dataset to the cache, then evicts the least recently used
+        entries if the size cap is exceeded. Datasets that can't be stored
+        (e.g. with attributes that can't be written to NetCDF) are not cached.
+
+        Args:
+            key (str): Key of the entry
+            data (pd.DataFrame or xr.Dataset): Dataset to cache
+            data_name (str): Name of the data variable(s) in data
+            files (list<str>): 
+                Files the data was read from, which can be fewer than the
+                files in the params if the dataloader filters them
+        '''
+        if type(data) == xr.core.dataset.Dataset:
+            extension = '.nc'
+            # Don't re-encode values with the packing of the original files
+            data = data.copy()
+            for variable in data.variables.values():
+                variable.encoding = {}
+            write = data.to_netcdf
+        elif type(data) == pd.core.frame.DataFrame:
+            extension = '.parquet'
+            write = data.to_parquet
+        else:
+            return
+
+        # Write to temporary file first, so that incomplete entries aren't read
+        fd, temp_path = tempfile.mkstemp(dir=self.directory, suffix=extension)
+        os.close(fd)
+        try:
+            write(temp_path)
+        except (OSError, ValueError, TypeError, ImportError) as err:
+            logging.warning(f'\tUnable to cache data: {err}')
+            os.remove(temp_path)
+            return
+        os.replace(temp_path, self._path(key, extension))
+        with open(self._path(key, '.json'), 'w') as fp:
+            json.dump({'data_name': data_name, 'extension': extension,
+                       'files': list(files)}, fp)
+
+        self.evict()
+
+    def _arrays_path(self, key):
+        '''
+        Returns the location of a set of arrays
+        '''
+        return os.path.join(self.directory, 'arrays', key + '.npz')
+
+    def get_arrays(self, key):
+        '''
+        Retrieves a set of arrays from the cache
+
+        Args:
+            key (str): Key of the arrays
+
+        Returns:
+            dict<str, np.array> or None:
+                Arrays by name, or None if there is no such set of arrays
+        '''
+        path = self._arrays_path(key)
+        if not os.path.exists(path):
+            return None
+        try:
+            with np.load(path) as arrays:
+                arrays = dict(arrays)
+        except Exception as err:
+            logging.warning(f'\tUnable to read cached arrays {key}: {err}')
+            os.remove(path)
+            return None
+        # Mark arrays as recently used
+        os.utime(path)
+        return arrays
+
+    def put_arrays(self, key, **arrays):
+        '''
+        Adds a set of arrays to the cache, then evicts the least recently 
+        used entries and arrays if the size cap is exceeded
+
+        Args:
+            key (str): Key of the arrays
+            **arrays (np.array): Arrays to cache, by name
+        '''
+        os.makedirs(os.path.dirname(self._arrays_path(key)), exist_ok=True)
+        # Write to temporary file first, so that incomplete arrays aren't read
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(self._arrays_path(key)),
+                                         suffix='.npz')
+        with os.fdopen(fd, 'wb') as fp:
+            np.savez(fp, **arrays)
+        os.replace(temp_path, self._arrays_path(key))
+
+        self.evict()
+
+    def remove(self, key):
+        '''
+        Removes an entry, or a set of arrays, from the cache
+
+        Args:
+            key (str): 
+                Key of the entry, or of the arrays prefixed with ARRAYS_PREFIX
+        '''
+        if key.startswith(ARRAYS_PREFIX):
+            paths = [self._arrays_path(key[len(ARRAYS_PREFIX):])]
+        else:
+            paths = [self._path(key, extension) for extension in ENTRY_EXTENSIONS]
+        for path in paths:
+            if os.path.exists(path):
+                os.remove(path)
+
+    def entries(self):
+        '''
+        Returns the entries and sets of arrays in the cache, least recently 
+        used first
+
+        Returns:
+            list<(str, int)>: 
+                Key and size in bytes of each entry. Keys of sets of arrays
+                are prefixed with ARRAYS_PREFIX
+        '''
+        entries = []
+        for filename in os.listdir(self.directory):
+            key, extension = os.path.splitext(filename)
+            if extension != '.json':
+                continue
+            info_path = os.path.join(self.directory, filename)
+            size = sum(os.path.getsize(self._path(key, ext))
+                       for ext in ENTRY_EXTENSIONS
+                       if os.path.exists(self._path(key, ext)))
+            entries.append((os.path.getmtime(info_path), key, size))
+        arrays_dir = os.path.join(self.directory, 'arrays')
+        if os.path.isdir(arrays_dir):
+            for filename in os.listdir(arrays_dir):
+                key, extension = os.path.splitext(filename)
+                if extension != '.npz':
+                    continue
+                path = os.path.join(arrays_dir, filename)
+                entries.append((os.path.getmtime(path), ARRAYS_PREFIX + key,
+                                os.path.getsize(path)))
+        return [(key, size) for _, key, size in sorted(entries)]
+
+    def evict(self):
+        '''
+        Removes the least recently used entries and arrays until the cache is
+        within its size cap
+        '''
+        entries = self.entries()
+        nbytes = sum(size for _, size in entries)
+        for key, size in entries:
+            if nbytes <= self.max_bytes:
+                break
+            logging.debug(f'\tEvicting cached data {key}')
+            self.remove(key)
+            nbytes -= size
+
+    def clear(self):
+        '''
+        Removes all entries and arrays from the cache
+        '''
+        logging.info(f'Clearing data cache in {self.directory}')
+        for key, _ in self.entries():
+            self.remove(key)
+        arrays_dir = os.path.join(self.directory, 'arrays')
+        if os.path.isdir(arrays_dir):
+            for filename in os.listdir(arrays_dir):
+                os.remove(os.path.join(arrays_dir, filename))
@@ -0,0 +1,122 @@
+"""
+Downsampling of point data (pd.DataFrame) by binning.
+
+Gridded data (xr.Dataset) is downsampled by merging blocks of neighbouring
+grid points. Point data has no grid, so instead points are grouped into
+lat/long bins as wide as a block of that many neighbouring points would be,
+and each bin is reduced to a single point. The spacing of the points is
+found from their distinct coordinates, so points read from a grid (e.g. a
+CSV of a gridded dataset) are binned in the same blocks as the grid would be.
+Binning is a single vectorised groupby, so it costs much less than splitting
+and aggregating cellboxes over all of the original points.
+"""
+
+import numpy as np
+import pandas as pd
+
+
+def point_spacing(lat, long):
+    '''
+    Estimates the spacing between neighbouring points along each axis
+
+    Args:
+        lat (np.array): Latitude of each point
+        long (np.array): Longitude of each point
+
+    Returns:
+        (float, float):
+            Typical distance between neighbouring points along latitude
+            and longitude. 0 along an axis if all points have the same
+            coordinate, or along both if there are no points with coordinates
+    '''
+    unique_lat = np.unique(lat[~np.isnan(lat)])
+    unique_long = np.unique(long[~np.isnan(long)])
+    if len(unique_lat) == 0 or len(unique_long) == 0:
+        return 0., 0.
+    if len(unique_lat) < 2 or len(unique_long) < 2:
+        return (unique_lat[-1] - unique_lat[0]) / max(len(unique_lat) - 1, 1), \
+               (unique_long[-1] - unique_long[0]) / max(len(unique_long) - 1, 1)
+    # Points on a grid share coordinates with the other points in their row
+    # and column, so the spacing is that of the distinct coordinates
+    if len(unique_lat) * len(unique_long) <= 4 * len(lat):
+        return np.median(np.diff(unique_lat)), np.median(np.diff(unique_long))
+    # Scattered points are assumed to be spread evenly over their extent
+    lat_extent = unique_lat[-1] - unique_lat[0]
+    long_extent = unique_long[-1] - unique_long[0]
+    spacing = np.sqrt(lat_extent * long_extent / len(lat))
+    return spacing, spacing
+
+
+def downsample_points(data, ds, agg_type, lat_col='lat', long_col='long'):
+    '''
+    Downsamples point data by reducing the points within each lat/long bin
+    to a single point
+
+    Args:
+        data (pd.DataFrame):
+            Points to downsample, with coordinate columns lat_col and
+            long_col, optionally 'time', and data columns
+        ds (int, int):
+            Downsampling factors. Each bin is as wide as ds[0] points
+            along longitude and ds[1] points along latitude.
+        agg_type (str):
+            Aggregation method to reduce each bin with. 'MIN', 'MAX',
+            'MEAN', 'MEDIAN' and 'STD' reduce each data column, and the
+            coordinates of the bin are the mean of those of its points.
+            'COUNT' keeps the first point in each bin.
+        lat_col (str): Name of the latitude coordinate column
+        long_col (str): Name of the longitude coordinate column
+
+    Returns:
+        pd.DataFrame:
+            Downsampled data, with one point per bin (and time, if the
+            data has a 'time' column). Points with NaN coordinates are
+            dropped. Returned unchanged if agg_type is not one of the above
+    '''
+    reductions = {'MIN':    lambda groups: groups.min(),
+                  'MAX':    lambda groups: groups.max(),
+                  'MEAN':   lambda groups: groups.mean(),
+                  'MEDIAN': lambda groups: groups.median(),
+                  'STD':    lambda groups: groups.std(ddof=0)}
+    if agg_type not in reductions and agg_type != 'COUNT':
+        return data
+    # Points without coordinates can't be binned
+    data = data.dropna(subset=[lat_col, long_col])
+    if len(data) == 0:
+        return data
+
+    lat = data[lat_col].to_numpy(dtype=float)
+    long = data[long_col].to_numpy(dtype=float)
+
+    lat_spacing, long_spacing = point_spacing(lat, long)
+
+    def bin_index(coords, spacing, factor):
+        '''
+        Index of the bin each point is in along one axis. Bins start half a
+        point spacing before the first point, so that points on a grid are
+        never on a bin edge
+        '''
+        if spacing == 0:
+            return np.zeros(len(coords), dtype=np.int64)
+        return np.floor((coords - np.nanmin(coords) + spacing / 2) /
+                        (factor * spacing)).astype(np.int64)
+
+    # Combine lat and long bin indices into a single key, which is faster to group by
+    lat_bin = bin_index(lat, lat_spacing, ds[1])
+    long_bin = bin_index(long, long_spacing, ds[0])
+    keys = [pd.Series(lat_bin * (long_bin.max() + 1) + long_bin,
+                      index=data.index, name='bin')]
+    if 'time' in data.columns:
+        keys.append(data['time'])
+    groups = data.groupby(keys, sort=True)
+
+    if agg_type == 'COUNT':
+        # Returns every first point in bin
+        return groups.head(1).reset_index(drop=True)
+
+    data_cols = [col for col in data.columns
+                 if col not in [lat_col, long_col, 'time']]
+    downsampled = groups[[lat_col, long_col]].mean()\
+                        .join(reductions[agg_type](groups[data_cols]))
+    # Drop bin index, keeping time
+    return downsampled.reset_index()[list(data.columns)]
@@ -0,0 +1,293 @@
+"""
+Index structures for dataloaders, used to find the data within a Boundary
+without scanning the whole dataset for every cellbox.
+
+For data stored on a regular grid (xr.Dataset with 1D 'lat' and 'long'
+dimension coordinates), these translate a Boundary into integer index ranges
+of the grid, and answer range-sum queries over the grid in constant time.
+
+For point data (pd.DataFrame with 'lat' and 'long' columns), rows are kept
+sorted by latitude so that the rows within a latitude range can be found
+with a binary search.
+"""
+
+import numpy as np
+import xarray as xr
+
+
+class GridIndex:
+    '''
+    Sorted coordinate vectors of a gridded dataset, used to convert a Boundary
+    into integer slices along each dimension. Slices follow the same conventions
+    as the dataloaders' trim_datapoints methods, i.e. exclusive of the spatial
+    lower bound, inclusive of the spatial upper bound, and inclusive of both
+    time bounds.
+    '''
+    def __init__(self, data):
+        '''
+        Args:
+            data (xr.Dataset):
+                Gridded dataset with 1D 'lat' and 'long' dimension coordinates,
+                both in ascending order, and optionally a 'time' coordinate
+        '''
+        self.lat = np.asarray(data.lat.values)
+        self.long = np.asarray(data.long.values)
+        if 'time' in data.indexes:
+            self.time = data.indexes['time']
+        else:
+            self.time = None
+
+    @classmethod
+    def from_dataset(cls, data):
+        '''
+        Creates a GridIndex from a dataset if the dataset is on a regular
+        lat/long grid that can be indexed.
+
+        Args:
+            data (xr.Dataset): Dataset to index
+
+        Returns:
+            GridIndex or None:
+                Index of the dataset, or None if the dataset does not have
+                ascending 1D 'lat' and 'long' dimension coordinates
+        '''
+        for coord in ['lat', 'long']:
+            if coord not in data.indexes:
+                return None
+            index = data.indexes[coord]
+            if not (index.is_monotonic_increasing and index.is_unique):
+                return None
+        return cls(data)
+
+    def lat_slice(self, bounds):
+        '''
+        Returns the slice of latitude indices within (lat_min, lat_max]
+        '''
+        start = np.searchsorted(self.lat, bounds.get_lat_min(), side='right')
+        stop = np.searchsorted(self.lat, bounds.get_lat_max(), side='right')
+        return slice(int(start), int(max(start, stop)))
+
+    def long_slices(self, bounds):
+        '''
+        Returns a list of slices of longitude indices within the boundary.
+        If the boundary crosses the antimeridian, two slices are returned;
+        [-180, long_max] followed by (long_min, 180], matching the order
+        the data is concatenated in by trim_datapoints.
+        '''
+        long_min = bounds.get_long_min()
+        long_max = bounds.get_long_max()
+        if long_min < long_max:
+            start = np.searchsorted(self.long, long_min, side='right')
+            stop = np.searchsorted(self.long, long_max, side='right')
+            return [slice(int(start), int(max(start, stop)))]
+        else:
+            lhs_start = np.searchsorted(self.long, -180, side='left')
+            lhs_stop = np.searchsorted(self.long, long_max, side='right')
+            rhs_start = np.searchsorted(self.long, long_min, side='right')
+            rhs_stop = np.searchsorted(self.long, 180, side='right')
+            return [slice(int(lhs_start), int(max(lhs_start, lhs_stop))),
+                    slice(int(rhs_start), int(max(rhs_start, rhs_stop)))]
+
+    def time_slice(self, bounds):
+        '''
+        Returns the slice of time indices within [time_min, time_max], or
+        None if the dataset has no time coordinate
+        '''
+        if self.time is None:
+            return None
+        return self.time.slice_indexer(bounds.get_time_min(),
+                                       bounds.get_time_max())
+
+    def covers_time(self, bounds):
+        '''
+        Determines whether the time range of a boundary includes every time
+        step in the dataset, in which case the time dimension can be ignored
+        when selecting data within the boundary
+        '''
+        if self.time is None:
+            return True
+        time_slice = self.time_slice(bounds)
+        start, stop, _ = time_slice.indices(len(self.time))
+        return start == 0 and stop == len(self.time)
+
+    def size(self, bounds):
+        '''
+        Returns the number of lat/long grid points within a boundary
+        '''
+        lat_slice = self.lat_slice(bounds)
+        n_lat = lat_slice.stop - lat_slice.start
+        n_long = sum(s.stop - s.start for s in self.long_slices(bounds))
+        return n_lat * n_long
+
+
+class GridIndexMixin:
+    '''
+    Gives a dataloader a GridIndex of its self.data, built once and reused
+    for every boundary
+    '''
+    def get_grid_index(self, data=None):
+        '''
+        Retrieves a GridIndex of a dataset. The index of self.data is built
+        on first use and rebuilt only if self.data is replaced, any other
+        dataset is indexed on each call.
+
+        Args:
+            data (xr.Dataset or None):
+                Dataset to index. None for the entire dataset
+
+        Returns:
+            GridIndex or None:
+                Index of the dataset, or None if it isn't a xr.Dataset on a
+                regular lat/long grid
+        '''
+        if data is None or data is getattr(self, 'data', None):
+            # (Re)build index if data has changed since it was last built
+            if getattr(self, '_grid_index_data', None) is not self.data:
+                self._grid_index_data = self.data
+                self._grid_index = GridIndex.from_dataset(self.data) \
+                                   if type(self.data) == xr.core.dataset.Dataset else None
+            return self._grid_index
+        return GridIndex.from_dataset(data)
+
+
+class SummedAreaTable:
+    '''
+    2D summed-area (prefix-sum) table, which returns the sum of any
+    rectangular block of the array it was built from in constant time.
+    '''
+    def __init__(self, values, dtype=np.int64):
+        '''
+        Args:
+            values (np.ndarray):
+                2D array of (lat, long) values to be summed
+            dtype (np.dtype):
+                Type of the accumulated sums
+        '''
+        values = np.asarray(values)
+        self.table = np.zeros((values.shape[0] + 1, values.shape[1] + 1),
+                              dtype=dtype)
+        np.cumsum(np.cumsum(values, axis=0, dtype=dtype), axis=1,
+                  dtype=dtype, out=self.table[1:, 1:])
+
+    def sum(self, lat_slice, long_slices):
+        '''
+        Returns the sum of values within the given index slices
+
+        Args:
+            lat_slice (slice): Slice of latitude indices
+            long_slices (list<slice>): Slices of longitude indices
+
+        Returns:
+            Sum of all values within the slices
+        '''
+        t = self.table
+        i0, i1 = lat_slice.start, lat_slice.stop
+        total = 0
+        for long_slice in long_slices:
+            j0, j1 = long_slice.start, long_slice.stop
+            total += t[i1, j1] - t[i0, j1] - t[i1, j0] + t[i0, j0]
+        return total
+
+
+class SparseTable:
+    '''
+    2D sparse table of a reduction (e.g. minimum or maximum) over square
+    blocks of an array, of every power of two size. The reduction of any
+    rectangular block is found from the few largest square blocks that
+    cover it, which may overlap, so only idempotent reductions can be used.
+    '''
+    def __init__(self, values, reduce=np.fmin):
+        '''
+        Args:
+            values (np.ndarray):
+                2D array of (lat, long) values to be reduced
+            reduce (np.ufunc):
+                Idempotent binary function to reduce values with, e.g.
+                np.fmin or np.fmax, which ignore NaN's
+        '''
+        self.reduce = reduce
+        # levels[k] holds the reduction of the 2^k x 2^k block starting at each index
+        self.levels = [np.asarray(values)]
+        size = 1
+        while size * 2 <= min(self.levels[0].shape):
+            prev = self.levels[-1]
+            self.levels.append(reduce(reduce(prev[:-size, :-size], prev[size:, :-size]),
+                                      reduce(prev[:-size, size:], prev[size:, size:])))
+            size *= 2
+
+    def query(self, lat_slice, long_slices):
+        '''
+        Returns the reduction of values within the given index slices
+
+        Args:
+            lat_slice (slice): Slice of latitude indices
+            long_slices (list<slice>): Slices of longitude indices
+
+        Returns:
+            Reduction of all values within the slices, or None if the
+            slices are empty
+        '''
+        result = None
+        i0, i1 = lat_slice.start, lat_slice.stop
+        for long_slice in long_slices:
+            j0, j1 = long_slice.start, long_slice.stop
+            if i1 <= i0 or j1 <= j0:
+                continue
+            # Cover block with the largest square blocks that fit within it
+            k = int(np.log2(min(i1 - i0, j1 - j0)))
+            size = 2 ** k
+            rows = list(range(i0, i1 - size, size)) + [i1 - size]
+            cols = list(range(j0, j1 - size, size)) + [j1 - size]
+            value = self.reduce.reduce(self.levels[k][np.ix_(rows, cols)], axis=None)
+            result = value if result is None else self.reduce(result, value)
+        return result
+
+
+# Flag stored in pd.DataFrame.attrs to mark data as sorted by latitude.
+# attrs are carried over to subsets created by .loc/.iloc, so subsets of
+# sorted data are also known to be sorted.
+LAT_SORTED_ATTR = 'lat_sorted'
+
+
+def sort_by_lat(data):
+    '''
+    Sorts point data by latitude and flags it as sorted, so that it can be
+    trimmed with trim_lat_sorted(). Rows with equal latitudes keep their
+    original order.
+
+    Args:
+        data (pd.DataFrame): Point data with a 'lat' column
+
+    Returns:
+        pd.DataFrame:
+            Data sorted by latitude, with index reset to row numbers
+    '''
+    data = data.sort_values('lat', kind='mergesort').reset_index(drop=True)
+    data.attrs[LAT_SORTED_ATTR] = True
+    return data
+
+
+def is_lat_sorted(data):
+    '''
+    Returns True if point data has been sorted by sort_by_lat(), or is a
+    subset of data that has
+    '''
+    return data.attrs.get(LAT_SORTED_ATTR, False) is True
+
+
+def trim_lat_sorted(data, bounds):
+    '''
+    Returns the rows of latitude sorted point data within (lat_min, lat_max]
+    of a boundary, found with a binary search rather than a mask over all rows.
+
+    Args:
+        data (pd.DataFrame): Point data sorted by sort_by_lat()
+        bounds (Boundary): Boundary to select latitudes within
+
+    Returns:
+        pd.DataFrame: Rows of data within the latitude range of bounds
+    '''
+    lat = data['lat'].to_numpy()
+    start = np.searchsorted(lat, bounds.get_lat_min(), side='right')
+    stop = np.searchsorted(lat, bounds.get_lat_max(), side='right')
+    return data.iloc[start:max(start, stop)]
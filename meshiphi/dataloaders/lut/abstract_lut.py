@@ -6,6 +6,7 @@ from pyproj import Transformer, CRS
 import logging
 import numpy as np
 import pandas as pd
+import shapely
 from shapely.geometry import MultiPolygon, Point, LineString
 from shapely.strtree import STRtree
 from shapely.ops import unary_union
@@ -203,30 +204,125 @@ class LutDataLoader(DataLoaderInterface):
             return overlap_area / total_area
         
 
-    def trim_datapoints(self, bounds, data=None):
+    def get_spatial_index(self):
         '''
-        Trims datapoints from self.data within boundary defined by 'bounds'.
-        self.data can be pd.DataFrame or xr.Dataset
-        
+        Retrieves a spatial index of the polygons in self.data, along with the
+        polygons and their boundaries, prepared so that repeated predicates
+        against them are fast. Built on first use and reused for every 
+        boundary afterwards, and for any subset of self.data. Rebuilt if 
+        self.data is replaced.
+
+        Returns:
+            (STRtree, np.array, np.array):
+                Spatial index, polygons and polygon boundaries of self.data,
+                in the order of its rows
+        '''
+        # (Re)build index if data has changed since it was last built
+        if getattr(self, '_spatial_index_data', None) is not self.data:
+            logging.debug(f"\tBuilding spatial index for '{self.data_name}'")
+            geometries = self.data['geometry'].to_numpy()
+            boundaries = shapely.boundary(geometries)
+            shapely.prepare(geometries)
+            shapely.prepare(boundaries)
+            self._spatial_index = (STRtree(geometries), geometries, boundaries)
+            self._spatial_index_data = self.data
+        return self._spatial_index
+
+    def get_subset_positions(self, data):
+        '''
+        Finds the positions in self.data of each row of a subset of it. Rows
+        are matched by their index labels, and must hold the same polygon
+        objects as self.data, so that a separate dataframe with the same
+        labels isn't mistaken for a subset. The last subset matched is kept,
+        as it's usually queried more than once.
+
+        Args:
+            data (pd.DataFrame): Possible subset of self.data
+
+        Returns:
+            np.array or None:
+                Position in self.data of each row of data, or None if data
+                isn't a subset of self.data
+        '''
+        if getattr(self, '_subset_data', None) is data and \
+           getattr(self, '_subset_of', None) is self.data:
+            return self._subset_positions
+
+        positions = None
+        if self.data.index.is_unique and data.index.is_unique:
+            _, geometries, _ = self.get_spatial_index()
+            matched = self.data.index.get_indexer(data.index)
+            if (matched >= 0).all() and \
+               all(datum is geometry for datum, geometry in 
+                   zip(data['geometry'].to_numpy(), geometries[matched])):
+                positions = matched
+
+        self._subset_data = data
+        self._subset_of = self.data
+        self._subset_positions = positions
+        return positions
+
+    def trim_with_positions(self, bounds, data=None):
+        '''
+        Trims datapoints from data within boundary defined by 'bounds', using
+        the spatial index of self.data if data is a subset of it.
+
         Args:
             bounds (Boundary): Limits of lat/long/time to select data from
+            data (pd.DataFrame): 
+                Data to select from. Defaults to self.data
 
         Returns:
-            pd.DataFrame: 
-                Trimmed dataset in same format as self.data
+            (pd.DataFrame, np.array or None):
+                Trimmed dataset, in the same order as data, and the positions
+                of its rows in self.data. If data isn't a subset of self.data,
+                a spatial index is built for data alone, and positions are None.
         '''
         if data is None:
             data = self.data
         # Limit time to boundary
         if 'time' in data.index.names:
             data = data.loc[bounds.get_time_min():bounds.get_time_max()]
-            
+        bounds_polygon = bounds.to_polygon()
+
+        if data is self.data:
+            tree, _, _ = self.get_spatial_index()
+            hits = np.sort(tree.query(bounds_polygon, predicate='intersects'))
+            return data.iloc[hits], hits
+
+        positions = self.get_subset_positions(data)
+        if positions is not None:
+            tree, _, _ = self.get_spatial_index()
+            if len(positions) == 0:
+                return data, positions
+            hits = tree.query(bounds_polygon, predicate='intersects')
+            # Keep only the rows within the subset, in its order
+            sorter = np.argsort(positions)
+            found = np.searchsorted(positions, hits, sorter=sorter)
+            found = sorter[np.clip(found, 0, len(positions) - 1)]
+            rows = np.sort(found[positions[found] == hits])
+            return data.iloc[rows], positions[rows]
+
         # Find intersection of each polygon to the boundary
-        bounds_polygon = bounds.to_polygon()    
-        lut_polys = STRtree(list(data['geometry']))
-        intersections = lut_polys.query(bounds_polygon, predicate='intersects').tolist()
+        lut_polys = STRtree(data['geometry'].to_numpy())
+        intersections = np.sort(lut_polys.query(bounds_polygon, predicate='intersects'))
+        return data.iloc[intersections], None
+
+    def trim_datapoints(self, bounds, data=None):
+        '''
+        Trims datapoints from self.data within boundary defined by 'bounds'.
+        self.data can be pd.DataFrame or xr.Dataset
+        
+        Args:
+            bounds (Boundary): Limits of lat/long/time to select data from
+
+        Returns:
+            pd.DataFrame: 
+                Trimmed dataset in same format as self.data
+        '''
         # Return only rows intersecting with cellbox boundary
-        return data.iloc[intersections]
+        trimmed_data, _ = self.trim_with_positions(bounds, data=data)
+        return trimmed_data
     
     def get_value(self, bounds, agg_type=None, skipna=False, data=None):
         '''
@@ -273,15 +369,20 @@ class LutDataLoader(DataLoaderInterface):
             # Skipna not easily parsed to remaining calculations, so force it here
             if skipna: polygons = polygons.dropna()
             # Mean, median, and std dev need to be weighted by size of polygons
-            polygons = polygons.assign(weights=lambda row: 
-                                        self.calculate_coverage(bounds, 
-                                                                row['geometry']))
+            # within bounds, as a fraction of the area of bounds
+            bounds_polygon = bounds.to_polygon()
+            overlaps = shapely.intersection(polygons['geometry'].to_numpy(), bounds_polygon)
+            polygons = polygons.assign(weights=shapely.area(overlaps) / bounds_polygon.area)
+            # Polygons only touching bounds have no area within them
+            if polygons['weights'].sum() == 0:
+                polygons['weights'] = 1.
             if agg_type == 'MEAN':
                 ret_val = np.average(polygons[self.data_name], 
                                 weights=polygons['weights'])
             
             elif agg_type == 'MEDIAN':
-                # Chunk by cumulative weight
+                # Chunk by cumulative weight, in order of value
+                polygons = polygons.sort_values(self.data_name, kind='stable')
                 polygons['cumulative_weights'] = polygons['weights'].cumsum(
                                                                     skipna=skipna)
                 # Find middle of cumulative weight
@@ -289,7 +390,7 @@ class LutDataLoader(DataLoaderInterface):
                 median_pos = total_weight/2
                 # Extract top half and return lowest value (value closest to halfway)
                 top_half = polygons.loc[polygons['cumulative_weights'] >= median_pos]
-                ret_val = top_half.iloc[0]
+                ret_val = top_half.iloc[0][self.data_name]
             
             elif agg_type == 'STD':
                 # Calculate std dev manually to account for weight
@@ -332,16 +433,21 @@ class LutDataLoader(DataLoaderInterface):
         '''
         bounds_polygon = bounds.to_polygon()
         # Extract polygons that overlap the boundary
-        polygons = self.trim_datapoints(bounds, data=data)['geometry'].tolist()
+        polygons, positions = self.trim_with_positions(bounds, data=data)
+        if positions is None:
+            boundaries = shapely.boundary(polygons['geometry'].to_numpy())
+        else:
+            _, _, boundaries = self.get_spatial_index()
+            boundaries = boundaries[positions]
         
         hom_type = 'CLR'
         # If there's no polygon that overlaps with bounds        
-        if not any([polygon.intersects(bounds_polygon) for polygon in polygons]):
+        if len(polygons) == 0:
             if splitting_conds['split_lock'] == True: 
                 hom_type = "HOM"
         # If we want to split on the boundary
         elif splitting_conds['boundary']:
-            if any(p.boundary.intersects(bounds_polygon) for p in polygons):
+            if shapely.intersects(boundaries, bounds_polygon).any():
                 hom_type = 'HET'
             
         # Otherwise no boundaries intersected bounds
@@ -0,0 +1,224 @@
+"""
+Index maps that reproject gridded data from a projected CRS onto a regular
+lat/long grid by gathering the nearest source grid point of each lat/long
+grid point.
+
+Products such as AMSR arrive on the same projected grid every day, so the
+transformation of that grid into lat/long only has to be calculated once.
+Index maps are keyed on the CRS's, shape and coordinates of the source grid,
+and the most recently used are kept in memory for the rest of the run. If
+the data cache is enabled, they are also stored in its directory, so that
+they are shared between runs.
+Applying a map is a single vectorised gather, and produces a xr.Dataset on
+a regular 'lat'/'long' grid, so the regular grid fast paths of the
+dataloaders still apply to the reprojected data.
+"""
+
+import hashlib
+import json
+import logging
+from collections import OrderedDict
+
+import numpy as np
+import xarray as xr
+from pyproj import Transformer, CRS
+
+from meshiphi.dataloaders.data_cache import get_data_cache
+
+
+# Maximum number of index maps kept in memory
+MAX_INDEX_MAPS = 8
+
+# Index maps calculated or loaded during this run, by key, least recently used first
+_index_maps = OrderedDict()
+
+
+def clear_index_maps():
+    '''
+    Removes all index maps kept in memory
+    '''
+    _index_maps.clear()
+
+
+def nearest_index(coords, values):
+    '''
+    Finds the index of the nearest coordinate to each value
+
+    Args:
+        coords (np.array): 1D coordinates of a grid, ascending or descending
+        values (np.array): Values to find the nearest coordinate of
+
+    Returns:
+        np.array:
+            Index of the nearest coordinate to each value, or -1 if the
+            value is more than half a grid spacing outside of the grid. A
+            grid of a single coordinate has no spacing, so is nearest to
+            every value.
+    '''
+    if len(coords) == 1:
+        return np.where(np.isnan(values), -1, 0)
+    order = np.argsort(coords)
+    sorted_coords = coords[order]
+    pos = np.clip(np.searchsorted(sorted_coords, values), 1, len(coords) - 1)
+    # Step back to the lower coordinate if it is nearer
+    pos -= (values - sorted_coords[pos - 1]) < (sorted_coords[pos] - values)
+    half_spacing = (sorted_coords[-1] - sorted_coords[0]) / (len(coords) - 1) / 2
+    outside = (values < sorted_coords[0] - half_spacing) | \
+              (values > sorted_coords[-1] + half_spacing) | \
+              np.isnan(values)
+    return np.where(outside, -1, order[pos])
+
+
+class ReprojectionMap:
+    '''
+    Nearest neighbour map from a regular lat/long grid to the grid of a
+    dataset in a projected CRS
+
+    Attributes:
+        lat (np.array): Latitudes of the lat/long grid
+        long (np.array): Longitudes of the lat/long grid
+        x_index (np.array):
+            Index along x of the source grid point nearest to each lat/long
+            grid point, shape (len(lat), len(long)). -1 if outside source grid
+        y_index (np.array): Index along y, as x_index
+    '''
+    def __init__(self, lat, long, x_index, y_index):
+        self.lat = lat
+        self.long = long
+        self.x_index = x_index
+        self.y_index = y_index
+
+    @staticmethod
+    def key(in_proj, out_proj, x, y, shape):
+        '''
+        Creates a key for the map of a source grid
+
+        Args:
+            in_proj (str): CRS of the source grid
+            out_proj (str): CRS of the lat/long grid
+            x (np.array): x coordinates of the source grid
+            y (np.array): y coordinates of the source grid
+            shape (tuple<int>): Shape of the lat/long grid
+
+        Returns:
+            str: Hash of everything the map depends on
+        '''
+        coords_hash = hashlib.sha256()
+        for coords in [x, y]:
+            coords_hash.update(np.ascontiguousarray(coords, dtype=np.float64).tobytes())
+        key_json = json.dumps({'in_proj': in_proj,
+                               'out_proj': out_proj,
+                               'shape': list(shape),
+                               'coords': coords_hash.hexdigest()},
+                              sort_keys=True)
+        return hashlib.sha256(key_json.encode('utf-8')).hexdigest()
+
+    @classmethod
+    def create(cls, in_proj, out_proj, x, y, shape):
+        '''
+        Calculates the map of a source grid
+
+        Args:
+            in_proj (str): CRS of the source grid
+            out_proj (str): CRS of the lat/long grid
+            x (np.array): x coordinates of the source grid
+            y (np.array): y coordinates of the source grid
+            shape (tuple<int>): Shape of the lat/long grid, (n_lat, n_long)
+
+        Returns:
+            ReprojectionMap: Map covering the extent of the source grid
+        '''
+        # Extent of the source grid in lat/long
+        xv, yv = np.meshgrid(x, y)
+        long, lat = Transformer\
+                    .from_crs(CRS(in_proj), CRS(out_proj), always_xy=True)\
+                    .transform(xv.ravel(), yv.ravel())
+        lat = np.linspace(np.nanmin(lat), np.nanmax(lat), shape[0])
+        long = np.linspace(np.nanmin(long), np.nanmax(long), shape[1])
+
+        # Source grid point nearest to each lat/long grid point
+        longv, latv = np.meshgrid(long, lat)
+        xv, yv = Transformer\
+                    .from_crs(CRS(out_proj), CRS(in_proj), always_xy=True)\
+                    .transform(longv.ravel(), latv.ravel())
+        x_index = nearest_index(np.asarray(x, dtype=float), xv).reshape(shape)
+        y_index = nearest_index(np.asarray(y, dtype=float), yv).reshape(shape)
+        # Lat/long grid points must be within the source grid along both axes
+        outside = (x_index == -1) | (y_index == -1)
+        x_index[outside] = -1
+        y_index[outside] = -1
+
+        return cls(lat, long, x_index, y_index)
+
+    @classmethod
+    def get(cls, in_proj, out_proj, x, y, shape):
+        '''
+        Retrieves the map of a source grid from memory or the data cache, or
+        calculates it if it hasn't been before
+
+        Args:
+            in_proj (str): CRS of the source grid
+            out_proj (str): CRS of the lat/long grid
+            x (np.array): x coordinates of the source grid
+            y (np.array): y coordinates of the source grid
+            shape (tuple<int>): Shape of the lat/long grid, (n_lat, n_long)
+
+        Returns:
+            ReprojectionMap: Map covering the extent of the source grid
+        '''
+        key = cls.key(in_proj, out_proj, x, y, shape)
+        if key in _index_maps:
+            _index_maps.move_to_end(key)
+            return _index_maps[key]
+
+        data_cache = get_data_cache()
+        index_map = None
+        if data_cache is not None:
+            arrays = data_cache.get_arrays(key)
+            if arrays is not None:
+                logging.debug('\tUsing cached reprojection index map')
+                index_map = cls(arrays['lat'], arrays['long'],
+                                arrays['x_index'], arrays['y_index'])
+        if index_map is None:
+            logging.debug('\tCalculating reprojection index map')
+            index_map = cls.create(in_proj, out_proj, x, y, shape)
+            if data_cache is not None:
+                data_cache.put_arrays(key, lat=index_map.lat, long=index_map.long,
+                                      x_index=index_map.x_index, y_index=index_map.y_index)
+
+        _index_maps[key] = index_map
+        while len(_index_maps) > MAX_INDEX_MAPS:
+            _index_maps.popitem(last=False)
+        return index_map
+
+    def apply(self, data, x_col, y_col):
+        '''
+        Reprojects a dataset by gathering the values of the nearest source
+        grid point to each lat/long grid point
+
+        Args:
+            data (xr.Dataset): Data on the source grid, with coordinates x_col, y_col
+            x_col (str): Name of the x coordinate of the source grid
+            y_col (str): Name of the y coordinate of the source grid
+
+        Returns:
+            xr.Dataset:
+                Data on the lat/long grid, with coordinates 'lat', 'long'
+                replacing x_col and y_col. Other dimensions, such as 'time',
+                are kept. Grid points outside the source grid are NaN
+        '''
+        outside = xr.DataArray(self.x_index == -1, dims=('lat', 'long'))
+        x_index = xr.DataArray(np.where(self.x_index == -1, 0, self.x_index), dims=('lat', 'long'))
+        y_index = xr.DataArray(np.where(self.y_index == -1, 0, self.y_index), dims=('lat', 'long'))
+
+        # Only variables on the source grid can be reprojected
+        data = data.drop_vars([name for name, var in data.variables.items()
+                               if name not in [x_col, y_col] and
+                               (x_col in var.dims) != (y_col in var.dims)])
+        data = data.isel({x_col: x_index, y_col: y_index})
+        data = data.drop_vars([x_col, y_col])
+        data = data.assign_coords(lat=self.lat, long=self.long)
+        for name, var in data.data_vars.items():
+            if 'lat' in var.dims:
+                data[name] = var.where(~outside)
+        return data
@@ -10,10 +10,16 @@ import pandas as pd
 from rasterio.enums import Resampling
 
 from meshiphi.mesh_generation.boundary import Boundary
+from meshiphi.dataloaders.grid_index import GridIndexMixin, SummedAreaTable, SparseTable, \
+                                             sort_by_lat, is_lat_sorted, trim_lat_sorted
+from meshiphi.dataloaders.trim_cache import TrimCacheMixin
+from meshiphi.dataloaders.data_cache import get_data_cache
+from meshiphi.dataloaders.reprojection_map import ReprojectionMap
+from meshiphi.dataloaders.downsampling import downsample_points
 
 
 
-class ScalarDataLoader(DataLoaderInterface):
+class ScalarDataLoader(TrimCacheMixin, GridIndexMixin, DataLoaderInterface):
     '''
     Abstract class for all scalar Datasets.
     '''
@@ -48,9 +54,26 @@ class ScalarDataLoader(DataLoaderInterface):
         # Creates a class attribute for all keys in params
         for key, val in params.items():
             setattr(self, key, val)
+
+        # Reuse data standardised by a previous run, if its inputs are unchanged
+        data_cache = get_data_cache() if 'files' in params else None
+        if data_cache is not None:
+            cache_key = data_cache.key(params['dataloader_name'], params, bounds)
+            cached_data = data_cache.get(cache_key, chunks=self.chunks)
+            if cached_data is not None:
+                logging.info('\tUsing cached data from previous run')
+                self.data, self.data_name, self.files = cached_data
+                # Sorted flag isn't always kept in the cache, so set it again
+                # (rows are already in order, so this is cheap)
+                if type(self.data) == pd.core.frame.DataFrame:
+                    self.data = sort_by_lat(self.data)
+                return
             
         # Read in and manipulate data to standard form
         self.data = self.import_data(bounds)
+        # Keep data out of memory, in chunks, if lazy loading requested
+        if self.chunks is not None and type(self.data) == xr.core.dataset.Dataset:
+            self.data = self.data.chunk(self.chunks)
         if 'files' in params:
             logging.info('\tFiles read:')
             for file in self.files:
@@ -94,6 +117,13 @@ class ScalarDataLoader(DataLoaderInterface):
             
             self.data = self.trim_datapoints(bounds)
 
+        # Sort point data by latitude so it can be trimmed by binary search
+        if type(self.data) == pd.core.frame.DataFrame:
+            self.data = sort_by_lat(self.data)
+
+        if data_cache is not None:
+            data_cache.put(cache_key, self.data, self.data_name, self.files)
+
     @abstractmethod
     def import_data(self, bounds):
         '''
@@ -115,6 +145,32 @@ class ScalarDataLoader(DataLoaderInterface):
         '''
         pass
         
+    def open_dataset(self, files, compute=False):
+        '''
+        Opens NetCDF files as a single xr.Dataset. If the 'chunks' param is 
+        set, the data is opened lazily as dask arrays, so that only the chunks 
+        within each cellbox are read from disk when it is split or aggregated.
+        
+        Args:
+            files (list<str>): Files to open
+            compute (bool): 
+                Whether to load data spread across multiple files into memory.
+                Ignored if data is being opened lazily
+        
+        Returns:
+            xr.Dataset: Data from all files, combined by coordinates
+        '''
+        # Open with the chunks of the files, rechunked to 'chunks' in __init__()
+        if self.chunks is not None:
+            if len(files) == 1:     return xr.open_dataset(files[0], chunks={})
+            else:                   return xr.open_mfdataset(files, chunks={})
+        
+        if len(files) == 1:     data = xr.open_dataset(files[0])
+        else:                   data = xr.open_mfdataset(files)
+        if compute and len(files) > 1:
+            data = data.compute()
+        return data
+
     def add_default_params(self, params):
         '''
         Set default values for all scalar dataloaders. This function should be
@@ -159,6 +215,21 @@ class ScalarDataLoader(DataLoaderInterface):
             
         if 'fast_reprojection' not in params:
             params['fast_reprojection'] = False
+
+        if 'reprojection_index_map' not in params:
+            params['reprojection_index_map'] = False
+
+        if 'hom_tables' not in params:
+            params['hom_tables'] = False
+
+        if 'trim_cache_mb' not in params:
+            params['trim_cache_mb'] = 64
+
+        if 'chunks' not in params:
+            params['chunks'] = None
+
+        if 'agg_tables' not in params:
+            params['agg_tables'] = False
             
         return params
 
@@ -243,7 +314,9 @@ class ScalarDataLoader(DataLoaderInterface):
 
         Returns:
             pd.DataFrame or xr.Dataset: 
-                Trimmed dataset in same format as self.data
+                Trimmed dataset in same format as self.data. May be shared 
+                with other callers through the trim cache, so must not be 
+                modified
         '''
         def trim_datapoints_from_df(data, bounds):
             '''
@@ -262,16 +335,22 @@ class ScalarDataLoader(DataLoaderInterface):
                     exclusive of spatial lower bound. Inclusive of both
                     upper and lower time bounds
             '''
+            # If rows are sorted by latitude, binary search for rows within
+            # latitude range, so only those rows need to be masked
+            if is_lat_sorted(data):
+                data = trim_lat_sorted(data, bounds)
+                lat_mask = True
+            else:
+                lat_mask = (data['lat']  > bounds.get_lat_min())  & \
+                           (data['lat']  <= bounds.get_lat_max())
             # Mask off any positions not within spatial bounds
             # If not going through antimeridian
             if bounds.get_long_min() < bounds.get_long_max():
-                mask = (data['lat']  > bounds.get_lat_min())  & \
-                    (data['lat']  <= bounds.get_lat_max())  & \
+                mask = lat_mask & \
                     (data['long'] > bounds.get_long_min()) & \
                     (data['long'] <= bounds.get_long_max())
             else:
-                mask = (data['lat']  > bounds.get_lat_min())  & \
-                    (data['lat']  <= bounds.get_lat_max())  & \
+                mask = lat_mask & \
                     (data['long'] <= bounds.get_long_min()) & \
                     (data['long'] > bounds.get_long_max())
             # Mask with time if time column exists
@@ -297,8 +376,25 @@ class ScalarDataLoader(DataLoaderInterface):
                 xr.Dataset:
                     Trimmed dataset inclusive of spatial upper bound, and 
                     exclusive of spatial lower bound. Inclusive of both
-                    upper and lower time bounds
+                    upper and lower time bounds. If the lat/long coordinates
+                    are sorted, this is a view of the original dataset
             '''
+            # If coordinates are sorted, select by integer index ranges
+            # rather than by label, which avoids copying the data
+            grid_index = self.get_grid_index(data)
+            if grid_index is not None:
+                lat_slice = grid_index.lat_slice(bounds)
+                long_slices = grid_index.long_slices(bounds)
+                if len(long_slices) == 1:
+                    data = data.isel(lat=lat_slice, long=long_slices[0])
+                else:
+                    data = xr.concat([data.isel(lat=lat_slice, long=long_slice)
+                                      for long_slice in long_slices], 'long')
+                # Select data region within temporal bounds if time exists as a coordinate
+                if 'time' in data.coords.keys():
+                    data = data.sel(time=slice(bounds.get_time_min(),  bounds.get_time_max()))
+                return data
+
             # Select data region within spatial bounds
             # NOTE slice in xarray is inclusive of bounds
             data = data.sel(lat=slice(bounds.get_lat_min(), bounds.get_lat_max()))
@@ -322,14 +418,27 @@ class ScalarDataLoader(DataLoaderInterface):
             # Return column of data from within bounds
             return data
         
+        # Reuse trimmed data if already trimmed to these bounds
+        cache = self.get_trim_cache(data, bounds, exact=False)
+        if cache is not None:
+            trimmed_data = cache.get('trim', bounds)
+            if trimmed_data is not None:
+                return trimmed_data
+
         # If no specific data passed in, default to entire dataset
         if data is None:
             data = self.data
         
         if type(data) == pd.core.frame.DataFrame:
-            return trim_datapoints_from_df(data, bounds)
+            trimmed_data = trim_datapoints_from_df(data, bounds)
         elif type(data) == xr.core.dataset.Dataset:
-            return trim_datapoints_from_xr(data, bounds)
+            trimmed_data = trim_datapoints_from_xr(data, bounds)
+        else:
+            return None
+
+        if cache is not None:
+            cache.put('trim', bounds, trimmed_data)
+        return trimmed_data
     
     def get_value(self, bounds, data=None, agg_type=None, skipna=True):
         '''
@@ -453,17 +562,30 @@ class ScalarDataLoader(DataLoaderInterface):
         # Set to params if no specific aggregate type specified
         if agg_type is None:
             agg_type = self.aggregate_type
-            
-        # Limit data series to just the data, excluding coords/index
-        dps = self.trim_datapoints(bounds, data=data)[self.data_name]
 
-        if type(self.data) == pd.core.frame.DataFrame:
-            value = get_value_from_df(dps, bounds, agg_type, skipna)
-        elif type(self.data) == xr.core.dataset.Dataset:
-            value = get_value_from_xr(dps, bounds, agg_type, skipna)
-            
+        # Reuse value if already aggregated within these bounds
+        cache = self.get_trim_cache(data, bounds)
+        if cache is not None:
+            value = cache.get('value', bounds, (agg_type, skipna))
+            if value is not None:
+                return {self.data_name: value}
+
+        # Look up value from precomputed tables if data is gridded
+        value = self.get_value_from_tables(bounds, agg_type, skipna, data=data)
+        if value is None:
+            # Limit data series to just the data, excluding coords/index
+            dps = self.trim_datapoints(bounds, data=data)[self.data_name]
+
+            if type(self.data) == pd.core.frame.DataFrame:
+                value = get_value_from_df(dps, bounds, agg_type, skipna)
+            elif type(self.data) == xr.core.dataset.Dataset:
+                value = get_value_from_xr(dps, bounds, agg_type, skipna)
+        
         # Cast to regular float before returning so can be saved in JSON later
-        return {self.data_name: float(value)}
+        value = float(value)
+        if cache is not None:
+            cache.put('value', bounds, value, (agg_type, skipna))
+        return {self.data_name: value}
 
     def get_hom_condition(self, bounds, splitting_conds, data=None):
         '''
@@ -558,13 +680,41 @@ class ScalarDataLoader(DataLoaderInterface):
                     Homogeneity condition of dataset, as described in 
                     get_hom_condition() docstring
             '''
-            if dps.size < self.min_dp: 
+            # Determine number of datapoints over threshold value
+            num_over_threshold = lambda: np.count_nonzero(dps > splitting_conds['threshold'])
+            num_non_nan = lambda: np.count_nonzero(~np.isnan(dps))
+            
+            return get_hom_condition_from_counts(dps.size, num_over_threshold, 
+                                                 num_non_nan, splitting_conds)
+        
+        def get_hom_condition_from_counts(size, num_over_threshold, num_non_nan, 
+                                          splitting_conds):
+            '''
+            Determined homogeneity condition from counts of datapoints. 
+            
+            Args:
+                size (int):
+                    Total number of datapoints, including NaN's
+                num_over_threshold (callable):
+                    Returns number of datapoints over the threshold value
+                num_non_nan (callable):
+                    Returns number of datapoints that are not NaN
+                splitting_conds (dict):
+                    Key/Value pairs for threshold, upper_bound and lower_bound. 
+                    More details in get_hom_condition() docstring
+            
+            Returns:
+                str:
+                    Homogeneity condition of dataset, as described in 
+                    get_hom_condition() docstring
+            '''
+            if size < self.min_dp: 
                 hom_type = "CLR"
-                logging.debug(f"\t{dps.size} datapoints found for attribute '{self.data_name}' within bounds '{bounds}'")
+                logging.debug(f"\t{size} datapoints found for attribute '{self.data_name}' within bounds '{bounds}'")
             else:
                 # Determine fraction of datapoints over threshold value
-                num_over_threshold = np.count_nonzero(dps > splitting_conds['threshold'])
-                num_non_nan = np.count_nonzero(~np.isnan(dps))
+                num_over_threshold = num_over_threshold()
+                num_non_nan = num_non_nan()
                 if num_non_nan > 0:
                     frac_over_threshold = num_over_threshold/num_non_nan
                 else:
@@ -582,23 +732,248 @@ class ScalarDataLoader(DataLoaderInterface):
             
             return hom_type
         
+        def get_hom_condition_from_data(data, splitting_conds):
+            '''
+            Determines homogeneity condition from the summed-area tables if 
+            the data is gridded, otherwise from the datapoints within bounds.
+            
+            Args:
+                data (pd.DataFrame or xr.Dataset or None):
+                    Datapoints within bounds, or None to trim them from self.data
+                splitting_conds (dict):
+                    Key/Value pairs for threshold, upper_bound and lower_bound. 
+                    More details in get_hom_condition() docstring
+            
+            Returns:
+                str:
+                    Homogeneity condition of dataset, as described in 
+                    get_hom_condition() docstring
+            '''
+            # Look up counts from summed-area tables if data is gridded
+            hom_tables = self.get_hom_tables(bounds, splitting_conds['threshold'])
+            if hom_tables is not None:
+                size, over_table, non_nan_table = hom_tables
+                # Only valid if the data passed in is the loader's own trim to bounds
+                if data is None or self.is_trim_of(data, bounds):
+                    lat_slice = self.get_grid_index().lat_slice(bounds)
+                    long_slices = self.get_grid_index().long_slices(bounds)
+                    return get_hom_condition_from_counts(
+                        size,
+                        lambda: over_table.sum(lat_slice, long_slices),
+                        lambda: non_nan_table.sum(lat_slice, long_slices),
+                        splitting_conds)
+
+            if data is None:
+                dps = self.trim_datapoints(bounds)[self.data_name]
+            else:
+                dps = data[self.data_name]
+
+            # Retrieve datapoints to analyse
+            if type(dps) == pd.core.series.Series:
+                return get_hom_condition_from_df(dps, splitting_conds)
+            elif type(dps) == xr.core.dataarray.DataArray:
+                return get_hom_condition_from_xr(dps, splitting_conds)
+            else:
+                raise TypeError(f'Unknown type {type(dps)}')
+
         # Set default values for splitting_conds if not provided
         if 'split_lock' not in splitting_conds:
             splitting_conds['split_lock'] = False
-        if data is None:
-            dps = self.trim_datapoints(bounds)[self.data_name]
-        else:
-            dps = data[self.data_name]
 
-        # Retrieve datapoints to analyse
-        if type(dps) == pd.core.series.Series:
-            return get_hom_condition_from_df(dps, splitting_conds)
-        elif type(dps) == xr.core.dataarray.DataArray:
-            return get_hom_condition_from_xr(dps, splitting_conds)
-        else:
-            raise TypeError(f'Unknown type {type(dps)}')
+        # Reuse homogeneity condition if already found within these bounds
+        cache = self.get_trim_cache(data, bounds)
+        cache_args = tuple(sorted(splitting_conds.items()))
+        if cache is not None:
+            hom_type = cache.get('hom_condition', bounds, cache_args)
+            if hom_type is not None:
+                return hom_type
+
+        hom_type = get_hom_condition_from_data(data, splitting_conds)
+
+        if cache is not None:
+            cache.put('hom_condition', bounds, hom_type, cache_args)
+        return hom_type
+
+
+    def get_hom_tables(self, bounds, threshold):
+        '''
+        Retrieves summed-area tables of the number of datapoints above a 
+        threshold, and the number of non-NaN datapoints, over the lat/long grid 
+        of self.data. Tables are built on first use for each threshold and 
+        reused for every boundary afterwards, so that homogeneity conditions 
+        can be determined without scanning the data within a boundary.
+        
+        Args:
+            bounds (Boundary): Boundary the homogeneity condition is for
+            threshold (float): Threshold value datapoints are compared against
+        
+        Returns:
+            (int, SummedAreaTable, SummedAreaTable) or None:
+                Number of datapoints within bounds, and tables of datapoints 
+                over threshold and non-NaN datapoints. None if self.data is not
+                a regular grid, tables are disabled in the params, data is 
+                lazily loaded, or the time range of bounds doesn't cover the 
+                whole dataset.
+        '''
+        if not self.hom_tables:
+            return None
+        # Tables span the whole grid, so would load lazily loaded data into memory
+        if self.chunks is not None:
+            return None
+        if type(self.data) != xr.core.dataset.Dataset:
+            return None
+        
+        # Discard tables if data has changed since they were last built
+        if getattr(self, '_hom_tables_data', None) is not self.data:
+            self._hom_tables_data = self.data
+            self._hom_tables = {}
+            self._non_nan_table = None
+            
+        grid_index = self.get_grid_index()
+        if grid_index is None:
+            return None
+        if not grid_index.covers_time(bounds):
+            return None
 
+        dps = self.data[self.data_name]
+        if 'lat' not in dps.dims or 'long' not in dps.dims:
+            return None
         
+        if threshold not in self._hom_tables:
+            logging.debug(f"\tBuilding homogeneity tables for '{self.data_name}' with threshold {threshold}")
+            # Collapse any other dimensions (e.g. time) onto lat/long grid
+            values = dps.transpose(..., 'lat', 'long').values
+            values = values.reshape((-1,) + values.shape[-2:])
+            if self._non_nan_table is None:
+                self._non_nan_table = SummedAreaTable(
+                    np.count_nonzero(~np.isnan(values), axis=0))
+            self._hom_tables[threshold] = SummedAreaTable(
+                np.count_nonzero(values > threshold, axis=0))
+        
+        # Size of data within bounds, including any other dimensions
+        other_size = dps.size // (dps.sizes['lat'] * dps.sizes['long']) \
+                     if dps.size > 0 else 0
+        size = grid_index.size(bounds) * other_size
+        
+        return size, self._hom_tables[threshold], self._non_nan_table
+
+    def get_value_from_tables(self, bounds, agg_type, skipna, data=None):
+        '''
+        Aggregates a value within bounds from precomputed tables over the 
+        lat/long grid of self.data, rather than by scanning the data within 
+        bounds. Summed-area tables of the count, sum and sum of squares of 
+        non-NaN datapoints give the COUNT, MEAN, STD and RMSE, and sparse 
+        tables of block minima/maxima give the MIN and MAX. Tables are built 
+        on first use for each kind and reused for every boundary afterwards.
+        
+        Args:
+            bounds (Boundary): Boundary to aggregate value within
+            agg_type (str): Method of aggregation, as in get_value()
+            skipna (bool): Defines whether to propogate NaN's or not
+            data (xr.Dataset or None): 
+                Data being aggregated, if not the entire dataset
+        
+        Returns:
+            float or None:
+                Aggregated value within bounds. None if tables are disabled 
+                in the params, self.data is not a regular grid or is lazily 
+                loaded, the time range of bounds doesn't cover the whole 
+                dataset, data isn't the trim of self.data to bounds held by 
+                the trim cache, or agg_type can't be found from the tables 
+                (i.e. 'MEDIAN').
+        '''
+        if not self.agg_tables:
+            return None
+        # Tables span the whole grid, so would load lazily loaded data into memory
+        if self.chunks is not None:
+            return None
+        if agg_type not in ['MIN', 'MAX', 'MEAN', 'STD', 'RMSE', 'COUNT']:
+            return None
+        if type(self.data) != xr.core.dataset.Dataset:
+            return None
+
+        # Discard tables if data has changed since they were last built
+        if getattr(self, '_agg_tables_data', None) is not self.data:
+            self._agg_tables_data = self.data
+            self._agg_tables = {}
+
+        grid_index = self.get_grid_index()
+        if grid_index is None:
+            return None
+        if not grid_index.covers_time(bounds):
+            return None
+
+        dps = self.data[self.data_name]
+        if 'lat' not in dps.dims or 'long' not in dps.dims:
+            return None
+
+        # Size of data within bounds, including any other dimensions
+        other_size = dps.size // (dps.sizes['lat'] * dps.sizes['long']) \
+                     if dps.size > 0 else 0
+        size = grid_index.size(bounds) * other_size
+        # Only valid if the data passed in is the loader's own trim to bounds
+        if data is not None and not self.is_trim_of(data, bounds):
+            return None
+
+        def get_table(kind):
+            '''
+            Retrieves table of 'count', 'sum', 'sum_sq', 'min' or 'max', 
+            building it if it doesn't exist yet
+            '''
+            if kind not in self._agg_tables:
+                logging.debug(f"\tBuilding '{kind}' aggregation table for '{self.data_name}'")
+                # Collapse any other dimensions (e.g. time) onto lat/long grid
+                values = dps.transpose(..., 'lat', 'long').values
+                values = values.reshape((-1,) + values.shape[-2:])
+                if kind == 'count':
+                    table = SummedAreaTable(np.count_nonzero(~np.isnan(values), axis=0))
+                elif kind in ['sum', 'sum_sq']:
+                    # Centre values on the overall mean so that sums of 
+                    # squares don't lose precision when taking the variance
+                    if 'offset' not in self._agg_tables:
+                        offset = np.nanmean(values) if np.any(~np.isnan(values)) else 0.
+                        self._agg_tables['offset'] = float(offset)
+                    centred = values.astype(np.float64) - self._agg_tables['offset']
+                    if kind == 'sum_sq':
+                        centred = centred ** 2
+                    table = SummedAreaTable(np.nansum(centred, axis=0), dtype=np.float64)
+                elif kind == 'min':
+                    table = SparseTable(np.fmin.reduce(values, axis=0), np.fmin)
+                elif kind == 'max':
+                    table = SparseTable(np.fmax.reduce(values, axis=0), np.fmax)
+                self._agg_tables[kind] = table
+            return self._agg_tables[kind]
+
+        logging.debug(f"\t{size} datapoints found for attribute '{self.data_name}' within bounds '{bounds}'")
+        # If want the number of datapoints
+        if agg_type == 'COUNT':
+            return size
+        # If no data
+        elif size == 0:
+            return np.nan
+
+        lat_slice = grid_index.lat_slice(bounds)
+        long_slices = grid_index.long_slices(bounds)
+
+        num_non_nan = get_table('count').sum(lat_slice, long_slices)
+        # If all NaN, or propogating NaN's
+        if num_non_nan == 0:
+            return np.nan
+        elif not skipna and num_non_nan < size:
+            return np.nan
+        # Return aggregated value
+        elif agg_type == 'MIN':
+            return get_table('min').query(lat_slice, long_slices)
+        elif agg_type == 'MAX':
+            return get_table('max').query(lat_slice, long_slices)
+
+        mean = get_table('sum').sum(lat_slice, long_slices) / num_non_nan
+        if agg_type == 'MEAN':
+            return self._agg_tables['offset'] + mean
+        # STD and RMSE are both the population standard deviation
+        mean_sq = get_table('sum_sq').sum(lat_slice, long_slices) / num_non_nan
+        return np.sqrt(max(mean_sq - mean ** 2, 0.))
+
     def reproject(self, in_proj='EPSG:4326', out_proj='EPSG:4326', 
                         x_col='lat', y_col='long'):
         '''
@@ -661,7 +1036,8 @@ class ScalarDataLoader(DataLoaderInterface):
             
             return data
             
-        def reproject_xr(data, in_proj, out_proj, x_col, y_col, fast=False):
+        def reproject_xr(data, in_proj, out_proj, x_col, y_col, fast=False,
+                         index_map=False):
             '''
             Reprojects a xr.Dataset
             
@@ -681,12 +1057,26 @@ class ScalarDataLoader(DataLoaderInterface):
                 y_col (str):
                     Coordinate that original dataset includes that will be 
                     projected. Will be replaces with latitude values
+                fast (bool):
+                    Whether to interpolate onto a lat/long grid with rioxarray
+                index_map (bool):
+                    Whether to gather the nearest grid point to each point of
+                    a lat/long grid, using an index map calculated once per
+                    source grid
                 
             Returns:
-                pd.DataFrame:
+                pd.DataFrame or xr.Dataset:
                     Reprojected dataset, with columns 'lat', 'long', 
-                    ('time' if in original dataset), and data_name
+                    ('time' if in original dataset), and data_name.
+                    xr.Dataset on a lat/long grid if fast or index_map
             '''
+            if index_map and not fast:
+            # If want results on a lat/long grid without interpolating
+                max_size = data.sizes[x_col] + data.sizes[y_col]
+                reprojection_map = ReprojectionMap.get(in_proj, out_proj,
+                                                       data[x_col].values, data[y_col].values,
+                                                       (max_size, max_size))
+                return reprojection_map.apply(data, x_col, y_col)
             if fast:
             # If want fast results (uses interpolation)
                 max_size = sum(data.sizes.values())
@@ -718,7 +1108,8 @@ class ScalarDataLoader(DataLoaderInterface):
             return reproject_df(self.data, in_proj, out_proj, x_col, y_col)
         elif type(self.data) == xr.core.dataset.Dataset:
             return reproject_xr(self.data, in_proj, out_proj, x_col, y_col, 
-                                fast=self.fast_reprojection)
+                                fast=self.fast_reprojection,
+                                index_map=self.reprojection_index_map)
     
     def downsample(self, agg_type=None):
         '''
@@ -784,15 +1175,31 @@ class ScalarDataLoader(DataLoaderInterface):
     
         def downsample_df(data, ds, agg_type):
             '''
-            Downsample pandas dataframe
-            Not implemented as it just adds to processing time, 
-            defeating the purpose
+            Downsample pandas dataframe by binning points according to 
+            aggregation type
+            
+            Args:
+                data (pd.DataFrame):
+                    Dataset containing data to be downsampled. Must have 
+                    columns 'lat' and 'long', or x_col and y_col if not yet 
+                    reprojected
+                ds (int, int):
+                    Downsampling factors. 
+                    ds[0] is longitude
+                    ds[1] is latitude
+                agg_type (str):
+                    Aggregation method to use for binning. Default is same as 
+                    set in config, passed in by parent
+            
+            Returns:
+                pd.DataFrame:
+                    Downsampled data
             '''
-            logging.warning(
-                '\tDownsampling called on pd.DataFrame! Downsampling a df' \
-                'too computationally expensive, returning original df'
-                )
-            return data
+            if 'lat' in data.columns and 'long' in data.columns:
+                return downsample_points(data, ds, agg_type)
+            # x_col is reprojected into longitude, y_col into latitude
+            return downsample_points(data, ds, agg_type,
+                                     lat_col=self.y_col, long_col=self.x_col)
 
         # Set to params if no specific aggregate type specified
         if agg_type is None:
@@ -18,8 +18,7 @@ class BalticSeaIceDataLoader(ScalarDataLoader):
                 Dataset has coordinates 'lat', 'long', and variable 'SIC'         
         '''
         # Open Dataset
-        if len(self.files) == 1:    data = xr.open_dataset(self.files[0])
-        else:                       data = xr.open_mfdataset(self.files)
+        data = self.open_dataset(self.files)
         # Change column names
         data = data.rename({'ice_concentration': 'SIC',
                             'lon': 'long'})
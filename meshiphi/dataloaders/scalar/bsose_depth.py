@@ -18,8 +18,7 @@ class BSOSEDepthDataLoader(ScalarDataLoader):
                 Dataset has coordinates 'lat', 'long', and variable 'elevation'
         """
         # Open Dataset
-        if len(self.files) == 1:    data = xr.open_dataset(self.files[0])
-        else:                       data = xr.open_mfdataset(self.files)
+        data = self.open_dataset(self.files)
         # Change column names
         data = data.rename({'Depth': 'elevation',
                             'YC': 'lat',
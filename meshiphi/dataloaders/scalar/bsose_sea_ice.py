@@ -25,8 +25,7 @@ class BSOSESeaIceDataLoader(ScalarDataLoader):
                 and value not 'fraction' or 'percentage'
         """
         # Open Dataset
-        if len(self.files) == 1:    data = xr.open_dataset(self.files[0])
-        else:                       data = xr.open_mfdataset(self.files)
+        data = self.open_dataset(self.files)
         # Change column names
         data = data.rename({'SIarea': 'SIC',
                             'YC': 'lat',
@@ -25,8 +25,7 @@ class ERA5MeanWaveDirDataLoader(ScalarDataLoader):
                       <= datetime.strptime(basename(file)[10:-3], "%Y-%m-%d") \
                       <= time_range[1]]
         # Open Dataset
-        if len(self.files) == 1:    data = xr.open_dataset(self.files[0])
-        else:                       data = xr.open_mfdataset(self.files).compute()
+        data = self.open_dataset(self.files, compute=True)
         # Change column names
         data = data.rename({'latitude': 'lat',
                             'longitude': 'long'})
@@ -18,8 +18,7 @@ class GEBCODataLoader(ScalarDataLoader):
                 Dataset has coordinates 'lat', 'long', and variable 'elevation'         
         '''
         # Import data from files defined in config
-        if len(self.files) == 1:    data = xr.open_dataset(self.files[0])
-        else:                       data = xr.open_mfdataset(self.files)
+        data = self.open_dataset(self.files)
         # Rename columns to standard format
         data = data.rename({'lon':'long'})
         # Trim to initial datapoints
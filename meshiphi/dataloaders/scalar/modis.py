@@ -20,8 +20,7 @@ class MODISDataLoader(ScalarDataLoader):
         '''
         logging.info(f"- Opening file {self.file}")
         # Open Dataset
-        if len(self.files) == 1:    data = xr.open_dataset(self.files[0])
-        else:                       data = xr.open_mfdataset(self.files)
+        data = self.open_dataset(self.files)
         # Change column name
         data = data.rename({'iceArea': 'SIC'})
 
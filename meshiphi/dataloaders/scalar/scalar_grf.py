@@ -101,11 +101,12 @@ class ScalarGRFDataLoader(ScalarDataLoader):
             
             return grf
         
-        # Set seed for generation. If not specified, will be 'random'
-        np.random.seed(self.seed)
+        # Set seed for generation. If not specified, will be 'random'.
+        # Own random state so that loaders can be created concurrently
+        random_state = np.random.RandomState(self.seed)
         
         # Create a GRF
-        grf = gaussian_random_field(self.size, self.alpha)
+        grf = gaussian_random_field(self.size, self.alpha, random_state)
         
         # Set it to a binary mask if chosen in config
         if self.binary == True:
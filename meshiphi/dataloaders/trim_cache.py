@@ -0,0 +1,322 @@
+"""
+Cache of data trimmed to a boundary, and of the statistics derived from it,
+shared by a dataloader across the splitting and aggregation of a mesh.
+
+The same cellbox bounds are trimmed and analysed several times while a mesh
+is built; when a cellbox is split, when its homogeneity condition is checked
+(once per data source for depth-first splitting), when it is aggregated, and
+again when its children fill in missing values from their parent. Entries are
+keyed on the exact lat/long/time limits of the boundary, and the least
+recently used entries are evicted once the cache holds more than its memory cap.
+
+Cached trims are shared by every caller that trims to the same boundary, and 
+for sorted gridded data are views of the dataset itself, so they must be 
+treated as read-only. Copy a trim before modifying it.
+"""
+
+import sys
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+
+def boundary_key(bounds):
+    '''
+    Returns a hashable key of the exact lat/long/time limits of a boundary
+
+    Args:
+        bounds (Boundary): Boundary to create key for
+
+    Returns:
+        tuple: (lat_min, lat_max, long_min, long_max, time_min, time_max)
+    '''
+    time_range = bounds.get_time_range()
+    if time_range:
+        time_min, time_max = bounds.get_time_min(), bounds.get_time_max()
+    else:
+        time_min, time_max = None, None
+    return (bounds.get_lat_min(), bounds.get_lat_max(),
+            bounds.get_long_min(), bounds.get_long_max(),
+            time_min, time_max)
+
+
+def boundary_key_contains(outer, inner):
+    '''
+    Determines whether the limits of one boundary key lie within another, 
+    i.e. whether trimming data already trimmed to 'outer' to 'inner' gives 
+    the same data as trimming the entire dataset to 'inner'
+
+    Args:
+        outer (tuple): Key of boundary data has been trimmed to, as boundary_key()
+        inner (tuple): Key of boundary being trimmed to, as boundary_key()
+
+    Returns:
+        bool: True if inner lies within outer
+    '''
+    if outer == inner:
+        return True
+    lat_min, lat_max, long_min, long_max, time_min, time_max = outer
+    if not (lat_min <= inner[0] and inner[1] <= lat_max):
+        return False
+    # Boundaries crossing the antimeridian are only contained by themselves
+    if long_min >= long_max or inner[2] >= inner[3]:
+        return False
+    if not (long_min <= inner[2] and inner[3] <= long_max):
+        return False
+    # Outer data was not trimmed in time
+    if time_min is None:
+        return True
+    return inner[4] is not None and time_min <= inner[4] and inner[5] <= time_max
+
+
+def estimate_nbytes(value):
+    '''
+    Returns the approximate memory used by a cached value, in bytes
+    '''
+    if type(value) == pd.core.frame.DataFrame:
+        return int(value.memory_usage(index=True).sum())
+    elif type(value) == xr.core.dataset.Dataset:
+        return int(value.nbytes)
+    elif isinstance(value, np.ndarray):
+        return int(value.nbytes)
+    return sys.getsizeof(value)
+
+
+class TrimCache:
+    '''
+    Bounded least-recently-used cache of trimmed datasets and derived
+    statistics, keyed on (kind, boundary, args). 'kind' separates the type of
+    entry, e.g. 'trim' for trimmed data or 'value' for aggregated values, and
+    'args' holds any other arguments the entry depends on. Cached values are 
+    returned as is, not copied, so must not be modified by the caller.
+
+    Attributes:
+        max_bytes (int): Memory cap of the cache, in bytes
+        hits (int): Number of lookups that found an entry
+        misses (int): Number of lookups that did not find an entry
+    '''
+    def __init__(self, max_bytes):
+        '''
+        Args:
+            max_bytes (int): Memory cap of the cache, in bytes
+        '''
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self.nbytes = 0
+        self._entries = OrderedDict()
+        # Cached trims by object id, to recognise them when passed back in
+        self._trim_ids = {}
+        # Cache may be shared by threads aggregating cellboxes in parallel
+        self._lock = threading.Lock()
+
+    def get(self, kind, bounds, args=()):
+        '''
+        Retrieves an entry from the cache
+
+        Args:
+            kind (str): Type of entry
+            bounds (Boundary): Boundary the entry was created for
+            args (tuple): Any other arguments the entry depends on
+
+        Returns:
+            Cached value, or None if there is no entry
+        '''
+        key = (kind, boundary_key(bounds), args)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry[0]
+
+    def put(self, kind, bounds, value, args=()):
+        '''
+        Adds an entry to the cache, evicting the least recently used entries
+        if the memory cap is exceeded. Values larger than the memory cap, and
+        None, are not cached.
+
+        Args:
+            kind (str): Type of entry
+            bounds (Boundary): Boundary the entry was created for
+            value: Value to cache
+            args (tuple): Any other arguments the entry depends on
+        '''
+        if value is None:
+            return
+        nbytes = estimate_nbytes(value)
+        if nbytes > self.max_bytes:
+            return
+        key = (kind, boundary_key(bounds), args)
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = (value, nbytes)
+            self.nbytes += nbytes
+            if kind == 'trim':
+                self._trim_ids[id(value)] = key
+            while self.nbytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+
+    def _remove(self, key):
+        '''
+        Removes an entry from the cache
+        '''
+        value, nbytes = self._entries.pop(key)
+        self.nbytes -= nbytes
+        if self._trim_ids.get(id(value)) == key:
+            del self._trim_ids[id(value)]
+
+    def trim_key(self, data):
+        '''
+        Finds the boundary a dataset was trimmed to, if it is one of the trims
+        held by the cache
+
+        Args:
+            data (pd.DataFrame or xr.Dataset): Dataset to look for
+
+        Returns:
+            tuple or None:
+                Key of the boundary data holds all of the data within, as 
+                boundary_key(), or None if data is not a trim held by the cache
+        '''
+        with self._lock:
+            key = self._trim_ids.get(id(data))
+            if key is None or self._entries[key][0] is not data:
+                return None
+            return key[1]
+
+    def contains_trim(self, data):
+        '''
+        Determines whether a dataset is one of the trims held by the cache,
+        i.e. all of the data within the boundary it was trimmed to
+
+        Args:
+            data (pd.DataFrame or xr.Dataset): Dataset to look for
+
+        Returns:
+            bool: True if data is a trim held by the cache
+        '''
+        return self.trim_key(data) is not None
+
+    def clear(self):
+        '''
+        Removes all entries from the cache and resets the hit/miss counters
+        '''
+        with self._lock:
+            self._entries.clear()
+            self._trim_ids.clear()
+            self.nbytes = 0
+            self.hits = 0
+            self.misses = 0
+
+    def info(self):
+        '''
+        Returns a summary of the cache usage
+
+        Returns:
+            dict: Number of hits, misses and entries, and the memory used
+                and memory cap in bytes
+        '''
+        return {'hits': self.hits,
+                'misses': self.misses,
+                'entries': len(self._entries),
+                'nbytes': self.nbytes,
+                'max_bytes': self.max_bytes}
+
+    def __len__(self):
+        return len(self._entries)
+
+
+class TrimCacheMixin:
+    '''
+    Gives a dataloader a TrimCache of its self.data, sized by the
+    'trim_cache_mb' param. 0 or None disables the cache.
+    '''
+    def get_trim_cache(self, data=None, bounds=None, exact=True):
+        '''
+        Retrieves the cache of data trimmed to boundaries, and of values and 
+        homogeneity conditions found within them. Entries are keyed on their 
+        boundary, so are only valid if they were found from all of the data 
+        within it. The cache is only returned for 'data' that gives the same 
+        result as the entire dataset within 'bounds'; None (the entire 
+        dataset), or the trim the cache holds for exactly 'bounds'. If not 
+        'exact', e.g. when trimming 'data' down to 'bounds', the entire 
+        dataset itself, or a trim the cache holds for a boundary containing 
+        'bounds', are valid too. The cache is emptied if self.data is replaced.
+        
+        Args:
+            data (pd.DataFrame or xr.Dataset or None): 
+                Data being trimmed or analysed. None for the entire dataset
+            bounds (Boundary or None): 
+                Boundary entries are being found within. Only required if 
+                data is given
+            exact (bool): 
+                Whether data must be exactly the data within bounds
+        
+        Returns:
+            TrimCache or None:
+                Cache for self.data, or None if caching is disabled in the
+                params or entries found from data are not valid for bounds
+        '''
+        if not self.trim_cache_mb:
+            return None
+        # No cache while data is being imported, before self.data is set
+        if not hasattr(self, 'data'):
+            return None
+        
+        # (Re)create cache if data has changed since it was last used
+        if getattr(self, '_trim_cache_data', None) is not self.data:
+            self._trim_cache_data = self.data
+            self._trim_cache = TrimCache(int(self.trim_cache_mb * 1024**2))
+
+        if data is None:
+            return self._trim_cache
+        if bounds is None:
+            return None
+        if not exact and data is self.data:
+            return self._trim_cache
+        trim_key = self._trim_cache.trim_key(data)
+        if trim_key is None:
+            return None
+        if exact and trim_key != boundary_key(bounds):
+            return None
+        if not exact and not boundary_key_contains(trim_key, boundary_key(bounds)):
+            return None
+        return self._trim_cache
+
+    def is_trim_of(self, data, bounds):
+        '''
+        Determines whether data is the loader's own trim of self.data to 
+        bounds, as held by the cache
+
+        Args:
+            data (pd.DataFrame or xr.Dataset): Data to check
+            bounds (Boundary): Boundary data should be the trim of
+
+        Returns:
+            bool: 
+                True if data is the cached trim for exactly bounds. False if 
+                it isn't, or if caching is disabled
+        '''
+        return data is not None and self.get_trim_cache(data, bounds) is not None
+
+    def trim_cache_info(self):
+        '''
+        Returns a summary of the usage of the cache of self.data, as 
+        TrimCache.info()
+
+        Returns:
+            dict or None:
+                Number of hits, misses and entries, and the memory used and
+                memory cap in bytes, or None if caching is disabled
+        '''
+        cache = self.get_trim_cache()
+        if cache is None:
+            return None
+        return cache.info()
@@ -10,9 +10,15 @@ import pandas as pd
 from rasterio.enums import Resampling
 
 from meshiphi.mesh_generation.boundary import Boundary
+from meshiphi.dataloaders.grid_index import GridIndex, GridIndexMixin, \
+                                             sort_by_lat, is_lat_sorted, trim_lat_sorted
+from meshiphi.dataloaders.trim_cache import TrimCacheMixin
+from meshiphi.dataloaders.data_cache import get_data_cache
+from meshiphi.dataloaders.reprojection_map import ReprojectionMap
+from meshiphi.dataloaders.downsampling import downsample_points
 
 
-class VectorDataLoader(DataLoaderInterface):
+class VectorDataLoader(TrimCacheMixin, GridIndexMixin, DataLoaderInterface):
     '''
     Abstract class for all vector Datasets.
     '''
@@ -44,8 +50,26 @@ class VectorDataLoader(DataLoaderInterface):
         # Creates a class attribute for all keys in params
         for key, val in params.items():
             setattr(self, key, val)
+
+        # Reuse data standardised by a previous run, if its inputs are unchanged
+        data_cache = get_data_cache() if 'files' in params else None
+        if data_cache is not None:
+            cache_key = data_cache.key(params['dataloader_name'], params, bounds)
+            cached_data = data_cache.get(cache_key, chunks=self.chunks)
+            if cached_data is not None:
+                logging.info('\tUsing cached data from previous run')
+                self.data, self.data_name, self.files = cached_data
+                self.data_name_list = self.data_name.split(',')
+                # Sorted flag isn't always kept in the cache, so set it again
+                # (rows are already in order, so this is cheap)
+                if type(self.data) == pd.core.frame.DataFrame:
+                    self.data = sort_by_lat(self.data)
+                return
             
         self.data = self.import_data(bounds)
+        # Keep data out of memory, in chunks, if lazy loading requested
+        if self.chunks is not None and type(self.data) == xr.core.dataset.Dataset:
+            self.data = self.data.chunk(self.chunks)
         # Read in and manipulate data to standard form
         if 'files' in params:
             logging.info('\tFiles read:')
@@ -96,6 +120,13 @@ class VectorDataLoader(DataLoaderInterface):
             
             self.data = self.trim_datapoints(bounds)
 
+        # Sort point data by latitude so it can be trimmed by binary search
+        if type(self.data) == pd.core.frame.DataFrame:
+            self.data = sort_by_lat(self.data)
+
+        if data_cache is not None:
+            data_cache.put(cache_key, self.data, self.data_name, self.files)
+
     @abstractmethod
     def import_data(self, bounds):
         '''
@@ -117,6 +148,32 @@ class VectorDataLoader(DataLoaderInterface):
         '''
         pass
     
+    def open_dataset(self, files, compute=False):
+        '''
+        Opens NetCDF files as a single xr.Dataset. If the 'chunks' param is 
+        set, the data is opened lazily as dask arrays, so that only the chunks 
+        within each cellbox are read from disk when it is split or aggregated.
+        
+        Args:
+            files (list<str>): Files to open
+            compute (bool): 
+                Whether to load data spread across multiple files into memory.
+                Ignored if data is being opened lazily
+        
+        Returns:
+            xr.Dataset: Data from all files, combined by coordinates
+        '''
+        # Open with the chunks of the files, rechunked to 'chunks' in __init__()
+        if self.chunks is not None:
+            if len(files) == 1:     return xr.open_dataset(files[0], chunks={})
+            else:                   return xr.open_mfdataset(files, chunks={})
+        
+        if len(files) == 1:     data = xr.open_dataset(files[0])
+        else:                   data = xr.open_mfdataset(files)
+        if compute and len(files) > 1:
+            data = data.compute()
+        return data
+
     def add_default_params(self, params):
         '''
         Set default values for all scalar dataloaders. This function should be
@@ -162,6 +219,15 @@ class VectorDataLoader(DataLoaderInterface):
 
         if 'fast_reprojection' not in params:
             params['fast_reprojection'] = False
+
+        if 'reprojection_index_map' not in params:
+            params['reprojection_index_map'] = False
+
+        if 'trim_cache_mb' not in params:
+            params['trim_cache_mb'] = 64
+
+        if 'chunks' not in params:
+            params['chunks'] = None
             
         return params
     
@@ -311,22 +377,30 @@ class VectorDataLoader(DataLoaderInterface):
 
         Returns:
             pd.DataFrame or xr.Dataset: 
-                Trimmed dataset in same format as self.data
+                Trimmed dataset in same format as self.data. May be shared 
+                with other callers through the trim cache, so must not be 
+                modified
         '''
         def trim_datapoints_from_df(data, bounds):
             '''
             Extracts data from a pd.DataFrame
             '''
+            # If rows are sorted by latitude, binary search for rows within
+            # latitude range, so only those rows need to be masked
+            if is_lat_sorted(data):
+                data = trim_lat_sorted(data, bounds)
+                lat_mask = True
+            else:
+                lat_mask = (data['lat']  > bounds.get_lat_min())  & \
+                           (data['lat']  <= bounds.get_lat_max())
             # Mask off any positions not within spatial bounds
             # If not going through antimeridian
             if bounds.get_long_min() < bounds.get_long_max():
-                mask = (data['lat']  > bounds.get_lat_min())  & \
-                    (data['lat']  <= bounds.get_lat_max())  & \
+                mask = lat_mask & \
                     (data['long'] > bounds.get_long_min()) & \
                     (data['long'] <= bounds.get_long_max())
             else:
-                mask = (data['lat']  > bounds.get_lat_min())  & \
-                    (data['lat']  <= bounds.get_lat_max())  & \
+                mask = lat_mask & \
                     (data['long'] <= bounds.get_long_min()) & \
                     (data['long'] > bounds.get_long_max())
             # Mask with time if time column exists
@@ -341,6 +415,21 @@ class VectorDataLoader(DataLoaderInterface):
             '''
             Extracts data from a xr.Dataset
             '''
+            # If coordinates are sorted, select by integer index ranges
+            # rather than by label, which avoids copying the data
+            grid_index = self.get_grid_index(data)
+            if grid_index is not None:
+                lat_slice = grid_index.lat_slice(bounds)
+                long_slices = grid_index.long_slices(bounds)
+                if len(long_slices) == 1:
+                    data = data.isel(lat=lat_slice, long=long_slices[0])
+                else:
+                    data = xr.concat([data.isel(lat=lat_slice, long=long_slice)
+                                      for long_slice in long_slices], 'long')
+                # Select data region within temporal bounds if time exists as a coordinate
+                if 'time' in data.coords.keys():
+                    data = data.sel(time=slice(bounds.get_time_min(),  bounds.get_time_max()))
+                return data
 
             # Select data region within spatial bounds
             # NOTE slice in xarray is inclusive of bounds
@@ -365,14 +454,27 @@ class VectorDataLoader(DataLoaderInterface):
             # Return column of data from within bounds
             return data
         
+        # Reuse trimmed data if already trimmed to these bounds
+        cache = self.get_trim_cache(data, bounds, exact=False)
+        if cache is not None:
+            trimmed_data = cache.get('trim', bounds)
+            if trimmed_data is not None:
+                return trimmed_data
+
         # If no specific data passed in, default to entire dataset
         if data is None:
             data = self.data
         
         if type(data) == pd.core.frame.DataFrame:
-            return trim_datapoints_from_df(data, bounds)
+            trimmed_data = trim_datapoints_from_df(data, bounds)
         elif type(data) == xr.core.dataset.Dataset:
-            return trim_datapoints_from_xr(data, bounds)
+            trimmed_data = trim_datapoints_from_xr(data, bounds)
+        else:
+            return None
+
+        if cache is not None:
+            cache.put('trim', bounds, trimmed_data)
+        return trimmed_data
     
     def get_value(self, bounds, agg_type=None, skipna=True, data=None):
         '''
@@ -463,6 +565,8 @@ class VectorDataLoader(DataLoaderInterface):
                 dict:
                     {variable_name: np.float64}: Aggregated value in a dictionary
             '''
+            # Read datapoints into memory once if data is lazily loaded
+            dps = dps.compute()
             # Info on size of array
             data_count = dps._magnitude.size 
             logging.debug(f"\t{data_count} datapoints found for attribute '{self.data_name}' within bounds '{bounds}'")
@@ -509,6 +613,13 @@ class VectorDataLoader(DataLoaderInterface):
         # Set to params if no specific aggregate type specified
         if agg_type is None:
             agg_type = self.aggregate_type
+
+        # Reuse values if already aggregated within these bounds
+        cache = self.get_trim_cache(data, bounds)
+        if cache is not None:
+            values = cache.get('value', bounds, (agg_type, skipna))
+            if values is not None:
+                return {self.data_name_list[i]: values[i] for i in range(len(self.data_name_list))}
             
         # Limit data to boundary
         if data is None:
@@ -520,6 +631,9 @@ class VectorDataLoader(DataLoaderInterface):
             values = get_value_from_df(dps, self.data_name_list, bounds, agg_type, skipna)
         elif type(self.data) == xr.core.dataset.Dataset:
             values = get_value_from_xr(dps, self.data_name_list, bounds, agg_type, skipna)
+
+        if cache is not None:
+            cache.put('value', bounds, tuple(values), (agg_type, skipna))
             
         # Put in dict to map variable to values
         return {self.data_name_list[i]: values[i] for i in range(len(self.data_name_list))}
@@ -544,14 +658,22 @@ class VectorDataLoader(DataLoaderInterface):
                 'HET' = Threshold values defined in config are exceeded \n
                 'CLR' = None of the HET conditions were triggered \n
         '''
+        # Reuse homogeneity condition if already found within these bounds
+        cache = self.get_trim_cache(data, bounds)
+        cache_args = (agg_type, repr(sorted(splitting_conds.items())))
+        if cache is not None:
+            hom_type = cache.get('hom_condition', bounds, cache_args)
+            if hom_type is not None:
+                return hom_type
+
         if data is None:
             data = self.trim_datapoints(bounds)
 
         # Get length of dataset in bounds  
         if type(self.data) == pd.core.frame.DataFrame:
-            num_dp = len(self.trim_datapoints(bounds))
+            num_dp = len(data)
         elif type(self.data) == xr.core.dataset.Dataset:
-            num_dp = min(self.trim_datapoints(bounds).count().values())
+            num_dp = min(data.count().values())
 
         # Set default homogeneity 
         hom_type = 'CLR'
@@ -564,11 +686,11 @@ class VectorDataLoader(DataLoaderInterface):
             # To allow multiple modes of splitting, chuck them in the splitting conditions
             # Split if magnitude of curl(data) is larger than threshold 
             if 'curl' in splitting_conds:
-                flow = self.calc_curl(bounds, collapse=False)
+                flow = self.calc_curl(bounds, data=data, collapse=False)
                 sc = splitting_conds['curl']
             # Split if max magnitude(any_vector - ave_vector) is larger than threshold
             elif 'dmag' in splitting_conds:
-                flow = self.calc_dmag(bounds, collapse=False)
+                flow = self.calc_dmag(bounds, data=data, collapse=False)
                 sc = splitting_conds['dmag']
 
             if 'split_lock' not in sc:
@@ -596,7 +718,9 @@ class VectorDataLoader(DataLoaderInterface):
                 
 
         logging.debug(f"\thom_condition for attribute: '{self.data_name}' in bounds:'{bounds}' returned '{hom_type}'")
-        
+
+        if cache is not None:
+            cache.put('hom_condition', bounds, hom_type, cache_args)
         return hom_type
 
     def reproject(self, in_proj='EPSG:4326', out_proj='EPSG:4326', 
@@ -661,7 +785,8 @@ class VectorDataLoader(DataLoaderInterface):
             
             return data
             
-        def reproject_xr(data, in_proj, out_proj, x_col, y_col, fast=False):
+        def reproject_xr(data, in_proj, out_proj, x_col, y_col, fast=False,
+                         index_map=False):
             '''
             Reprojects a xr.Dataset
             
@@ -681,12 +806,26 @@ class VectorDataLoader(DataLoaderInterface):
                 y_col (str):
                     Coordinate that original dataset includes that will be 
                     projected. Will be replaces with latitude values
+                fast (bool):
+                    Whether to interpolate onto a lat/long grid with rioxarray
+                index_map (bool):
+                    Whether to gather the nearest grid point to each point of
+                    a lat/long grid, using an index map calculated once per
+                    source grid
                 
             Returns:
-                pd.DataFrame:
+                pd.DataFrame or xr.Dataset:
                     Reprojected dataset, with columns 'lat', 'long', 
-                    ('time' if in original dataset), and data_name
+                    ('time' if in original dataset), and data_name.
+                    xr.Dataset on a lat/long grid if fast or index_map
             '''
+            if index_map and not fast:
+            # If want results on a lat/long grid without interpolating
+                max_size = data.sizes[x_col] + data.sizes[y_col]
+                reprojection_map = ReprojectionMap.get(in_proj, out_proj,
+                                                       data[x_col].values, data[y_col].values,
+                                                       (max_size, max_size))
+                return reprojection_map.apply(data, x_col, y_col)
             if fast:
             # If want fast results (uses interpolation)
                 max_size = sum(data.sizes.values())
@@ -718,7 +857,8 @@ class VectorDataLoader(DataLoaderInterface):
             return reproject_df(self.data, in_proj, out_proj, x_col, y_col)
         elif type(self.data) == xr.core.dataset.Dataset:
             return reproject_xr(self.data, in_proj, out_proj, x_col, y_col,
-                                fast=self.fast_reprojection)
+                                fast=self.fast_reprojection,
+                                index_map=self.reprojection_index_map)
     
     def downsample(self, agg_type=None):
         '''
@@ -784,15 +924,31 @@ class VectorDataLoader(DataLoaderInterface):
     
         def downsample_df(data, ds, agg_type):
             '''
-            Downsample pandas dataframe
-            Not implemented as it just adds to processing time, 
-            defeating the purpose
+            Downsample pandas dataframe by binning points according to 
+            aggregation type
+            
+            Args:
+                data (pd.DataFrame):
+                    Dataset containing data to be downsampled. Must have 
+                    columns 'lat' and 'long', or x_col and y_col if not yet 
+                    reprojected
+                ds (int, int):
+                    Downsampling factors. 
+                    ds[0] is longitude
+                    ds[1] is latitude
+                agg_type (str):
+                    Aggregation method to use for binning. Default is same as 
+                    set in config, passed in by parent
+            
+            Returns:
+                pd.DataFrame:
+                    Downsampled data
             '''
-            logging.warning(
-                '\tDownsampling called on pd.DataFrame! Downsampling a df' \
-                'too computationally expensive, returning original df'
-                )
-            return data
+            if 'lat' in data.columns and 'long' in data.columns:
+                return downsample_points(data, ds, agg_type)
+            # x_col is reprojected into longitude, y_col into latitude
+            return downsample_points(data, ds, agg_type,
+                                     lat_col=self.y_col, long_col=self.x_col)
 
         # Set to params if no specific aggregate type specified
         if agg_type is None:
@@ -949,10 +1105,13 @@ class VectorDataLoader(DataLoaderInterface):
         Raises:
             ValueError: If agg_type is not 'MAX' or 'MEAN'
         '''
-        if data is None:    dps = self.trim_datapoints(bounds, data=data)
-        else:               dps = data
-        # Create a meshgrid of vectors from the data
-        vector_field = self._create_vector_meshgrid(dps, self.data_name_list)
+        # Slice meshgrid of vectors from the grid of the whole dataset if possible
+        vector_field = self.get_vector_field(bounds, data=data)
+        if vector_field is None:
+            if data is None:    dps = self.trim_datapoints(bounds, data=data)
+            else:               dps = data
+            # Create a meshgrid of vectors from the data
+            vector_field = self._create_vector_meshgrid(dps, self.data_name_list)
         # Get component values for each vector
         fx, fy = vector_field[:, :, 0], vector_field[:, :, 1]
         # If not enough datapoints to compute gradient
@@ -1007,12 +1166,27 @@ class VectorDataLoader(DataLoaderInterface):
         Raises:
             ValueError: If agg_type is not 'MAX' or 'MEAN'
         '''
-        if data is None:    dps = self.trim_datapoints(bounds, data=data)
-        else:               dps = data
-            
         data_names = self.data_name_list
-        each_vector = dps[data_names].to_numpy()
-        ave_vector = list(self.get_value(bounds, agg_type=agg_type).values())
+        # Slice vectors from the grid of the whole dataset if possible
+        vector_field = self.get_vector_field(bounds, data=data)
+        if vector_field is not None:
+            # Points missing from the grid are NaN, so are ignored like NaN data
+            each_vector = vector_field.reshape(-1, len(data_names))
+            if np.isnan(each_vector).all():
+                logging.debug('\tAll NaN cellbox encountered')
+                return np.nan
+            if agg_type == 'MEAN':
+                ave_vector = np.nanmean(each_vector, axis=0)
+            else:
+                ave_vector = list(self.get_value(bounds, agg_type=agg_type, data=data).values())
+        else:
+            if data is None:    dps = self.trim_datapoints(bounds, data=data)
+            else:               dps = data
+            if type(dps) == xr.core.dataset.Dataset:
+                each_vector = np.column_stack([dps[name].values.ravel() for name in data_names])
+            else:
+                each_vector = dps[data_names].to_numpy()
+            ave_vector = list(self.get_value(bounds, agg_type=agg_type, data=dps).values())
         
         delta_vector = each_vector - ave_vector
         
@@ -1033,6 +1207,120 @@ class VectorDataLoader(DataLoaderInterface):
         # Else return field
         else:          return d_mag
 
+    def get_vector_field(self, bounds, data=None):
+        '''
+        Retrieves the meshgrid of vectors within bounds, in the same form as 
+        _create_vector_meshgrid() of the data within bounds, by slicing a grid 
+        of vectors built once over the whole of self.data. This avoids 
+        rebuilding (and for pd.DataFrame, pivoting) the meshgrid for every 
+        cellbox when calculating the curl or dmag.
+        
+        Args:
+            bounds (Boundary): Boundary to retrieve vectors within
+            data (pd.DataFrame or xr.Dataset or None): 
+                Data within bounds that the meshgrid is for. None for the 
+                entire dataset trimmed to bounds
+        
+        Returns:
+            np.array or None:
+                Table containing vectors as np.arrays at each coord. None if 
+                self.data can't be gridded (e.g. it has a time dimension) or
+                is lazily loaded, bounds cross the antimeridian for 
+                pd.DataFrame data, or data isn't the data within bounds.
+        '''
+        # Grid spans the whole dataset, so would load lazily loaded data into memory
+        if self.chunks is not None:
+            return None
+
+        # (Re)build grid if data has changed since it was last built
+        if getattr(self, '_vector_grid_data', None) is not self.data:
+            self._vector_grid_data = self.data
+            self._vector_grid = self._create_vector_grid(self.data, self.data_name_list)
+
+        if self._vector_grid is None:
+            return None
+        grid_index, vector_grid, present = self._vector_grid
+
+        lat_slice = grid_index.lat_slice(bounds)
+        long_slices = grid_index.long_slices(bounds)
+
+        if present is None:
+            vector_field = np.concatenate([vector_grid[lat_slice, long_slice] 
+                                           for long_slice in long_slices], axis=1)
+            # Only valid if the data passed in is the data within bounds
+            if data is not None and \
+               data[self.data_name_list[0]].shape != vector_field.shape[:2]:
+                return None
+            return vector_field
+        else:
+            # DataFrames are trimmed by masking, which doesn't wrap around the antimeridian
+            if bounds.get_long_min() >= bounds.get_long_max():
+                return None
+            vector_field = vector_grid[lat_slice, long_slices[0]]
+            present = present[lat_slice, long_slices[0]]
+            # Only valid if the data passed in is the data within bounds
+            if data is not None and len(data) != np.count_nonzero(present):
+                return None
+            # Pivoting only creates rows/columns for coordinates in the data
+            vector_field = vector_field[np.ix_(present.any(axis=1), present.any(axis=0))]
+            return np.swapaxes(vector_field, 0, 1)
+
+    @staticmethod
+    def _create_vector_grid(data, data_name_list):
+        '''
+        Creates a regular lat/long grid of 2D vectors over a whole dataset
+        
+        Args:
+            data (pd.DataFrame or xr.Dataset): 
+                Dataset with 'lat' and 'long' columns/dimensions with vectors
+            data_name_list (list): 
+                List of strings containing the vector component names
+        
+        Returns:
+            (GridIndex, np.array, np.array or None) or None:
+                Index of the grid, table containing vectors at each (lat, long)
+                coord, and for pd.DataFrame data, a table of which coords have
+                a datapoint. None if data can't be gridded
+        '''
+        def grid_from_df(data, data_name_list):
+            if 'time' in data.columns:
+                return None
+            if data.duplicated(subset=['lat', 'long']).any():
+                return None
+            # Scattered points would create a grid of every distinct lat by 
+            # every distinct long, almost all of it empty. Same test as 
+            # downsampling.point_spacing() for points on a grid
+            if data['lat'].nunique() * data['long'].nunique() > 4 * len(data):
+                return None
+            # Coords missing from the data are filled with NaN
+            grid = data[['lat', 'long'] + data_name_list].assign(_present=1.0) \
+                                                         .set_index(['lat', 'long']) \
+                                                         .to_xarray()
+            grid_index = GridIndex.from_dataset(grid)
+            if grid_index is None:
+                return None
+            vector_grid = np.dstack([grid[name].values for name in data_name_list])
+            present = ~np.isnan(grid['_present'].values)
+            return grid_index, vector_grid, present
+
+        def grid_from_xr(data, data_name_list):
+            if 'time' in data.coords:
+                return None
+            grid_index = GridIndex.from_dataset(data)
+            if grid_index is None:
+                return None
+            if any(data[name].dims != ('lat', 'long') for name in data_name_list):
+                return None
+            vector_grid = np.dstack([data[name].values for name in data_name_list])
+            return grid_index, vector_grid, None
+
+        logging.debug('\tCreating grid of vectors over whole dataset')
+        if type(data) == pd.core.frame.DataFrame:
+            return grid_from_df(data, data_name_list)
+        elif type(data) == xr.core.dataset.Dataset:
+            return grid_from_xr(data, data_name_list)
+        return None
+
     @staticmethod
     def _create_vector_meshgrid(data, data_name_list):
         '''
@@ -72,12 +72,13 @@ class VectorGRFDataLoader(VectorDataLoader):
             
             return dx, dy
         
-        # Set seed for generation. If not specified, will be 'random'
-        np.random.seed(self.seed)
+        # Set seed for generation. If not specified, will be 'random'.
+        # Own random state so that loaders can be created concurrently
+        random_state = np.random.RandomState(self.seed)
         
         # Create a GRF of magnitudes and angles
-        magnitudes = gaussian_random_field(self.size, self.alpha)
-        directions = gaussian_random_field(self.size, self.alpha)
+        magnitudes = gaussian_random_field(self.size, self.alpha, random_state)
+        directions = gaussian_random_field(self.size, self.alpha, random_state)
         directions = np.radians(360*directions)
         
         vec_x, vec_y = grf_to_vector(magnitudes, directions, self.min, self.max)
@@ -0,0 +1,408 @@
+"""
+Columnar binary file format for environmental meshes.
+
+A binary mesh file stores the same information as the mesh JSON format,
+laid out so that it can be memory-mapped rather than parsed:
+
+    - the bounds of every cellbox, as lat_min, lat_max, long_min and long_max arrays
+    - one array per cellbox field (id and each agg_data value)
+    - the neighbour graph in compressed sparse row (CSR) form
+
+The file starts with an 8 byte magic string, followed by the length of a
+JSON header, the header itself, and then the raw array data. The header holds
+the mesh config and the dtype, shape and offset of every array. Each array
+starts on a 64 byte boundary so it can be memory-mapped in place.
+
+Cellbox fields are stored according to the type of their values:
+    - 'float': all values are floats, stored as float64
+    - 'int': all values are ints, stored as int64
+    - 'str': all values are strings, stored as fixed width unicode
+    - 'json': any other values, stored as JSON encoded UTF-8 text with
+      an array of offsets into the text for each cellbox
+Fields that are missing from some cellboxes also have a 'present' mask, with
+a placeholder value stored for the cellboxes that don't have the field.
+"""
+
+import json
+import struct
+from collections.abc import MutableSequence
+
+import numpy as np
+
+from meshiphi.mesh_generation.boundary import Boundary
+from meshiphi.mesh_generation.aggregated_cellbox import AggregatedCellBox
+from meshiphi.mesh_generation.neighbour_graph import NeighbourGraph
+
+
+MAGIC = b'MESHIPHI'
+FORMAT_VERSION = 1
+ALIGNMENT = 64
+BOUNDS_ARRAYS = ['lat_min', 'lat_max', 'long_min', 'long_max']
+# Values stored for cellboxes missing a field, by kind of field
+PLACEHOLDERS = {'float': np.nan, 'int': 0, 'str': '', 'json': None}
+
+
+def is_binary_mesh(path):
+    '''
+    Determines whether a file is a binary mesh file from its magic string
+
+    Args:
+        path (str): Location of the file
+
+    Returns:
+        bool: True if the file is a binary mesh file
+    '''
+    try:
+        with open(path, 'rb') as fp:
+            return fp.read(len(MAGIC)) == MAGIC
+    except OSError:
+        return False
+
+
+def _column_kind(values):
+    '''
+    Determines how a column of cellbox field values is stored
+    '''
+    if all(isinstance(value, float) for value in values):
+        return 'float'
+    if all(isinstance(value, (int, np.integer)) and not isinstance(value, (bool, np.bool_))
+           for value in values):
+        return 'int'
+    # Fixed width unicode arrays can't hold trailing null characters
+    if all(isinstance(value, str) and not value.endswith('\x00') for value in values):
+        return 'str'
+    return 'json'
+
+
+def _encode_column(values, kind):
+    '''
+    Converts a column of cellbox field values to the arrays that store them
+
+    Returns:
+        dict: {array suffix (str): array (np.ndarray)}
+    '''
+    if kind == 'float':
+        return {'': np.array(values, dtype=np.float64)}
+    elif kind == 'int':
+        return {'': np.array(values, dtype=np.int64)}
+    elif kind == 'str':
+        if len(values) == 0:
+            return {'': np.array(values, dtype='<U1')}
+        return {'': np.array(values, dtype=str)}
+    else:
+        encoded = [json.dumps(value).encode('utf-8') for value in values]
+        offsets = np.zeros(len(encoded) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(text) for text in encoded])
+        return {'': np.frombuffer(b''.join(encoded), dtype=np.uint8),
+                '#offsets': offsets}
+
+
+def write_binary_mesh(path, mesh):
+    '''
+    Writes an EnvironmentMesh to a binary mesh file
+
+    Args:
+        path (str): Location to save the binary mesh file to
+        mesh (EnvironmentMesh): Mesh to save
+    '''
+    arrays = {}
+    num_cellboxes = len(mesh.agg_cellboxes)
+
+    # Bounds of each cellbox
+    bounds = np.empty((4, num_cellboxes), dtype=np.float64)
+    # Values of each field, in the order they first appear in the cellboxes
+    fields = {'id': {}}
+    for row, cellbox in enumerate(mesh.agg_cellboxes):
+        cellbox_bounds = cellbox.get_bounds()
+        bounds[:, row] = [cellbox_bounds.get_lat_min(), cellbox_bounds.get_lat_max(),
+                          cellbox_bounds.get_long_min(), cellbox_bounds.get_long_max()]
+        fields['id'][row] = cellbox.get_id()
+        for name, value in cellbox.get_agg_data().items():
+            fields.setdefault(name, {})[row] = value
+    for name, array in zip(BOUNDS_ARRAYS, bounds):
+        arrays[f'bounds/{name}'] = array
+
+    columns = []
+    for name, values in fields.items():
+        kind = _column_kind(list(values.values()))
+        present = None
+        if len(values) < num_cellboxes:
+            present = np.zeros(num_cellboxes, dtype=bool)
+            present[list(values.keys())] = True
+            values = [values.get(row, PLACEHOLDERS[kind]) for row in range(num_cellboxes)]
+        else:
+            values = list(values.values())
+        for suffix, array in _encode_column(values, kind).items():
+            arrays[f'columns/{name}{suffix}'] = array
+        if present is not None:
+            arrays[f'columns/{name}#present'] = present
+        columns.append({'name': name, 'kind': kind, 'sparse': present is not None})
+
+    # Neighbour graph in CSR form. Each node has a list of direction slots,
+    # and each slot has a list of neighbours
+    graph = mesh.neighbour_graph.get_graph()
+    directions = []
+    node_offsets = [0]
+    slot_directions = []
+    slot_offsets = [0]
+    neighbours = []
+    for node, neighbour_map in graph.items():
+        for direction, direction_neighbours in neighbour_map.items():
+            direction = str(direction)
+            if direction not in directions:
+                directions.append(direction)
+            slot_directions.append(directions.index(direction))
+            neighbours.extend(direction_neighbours)
+            slot_offsets.append(len(neighbours))
+        node_offsets.append(len(slot_directions))
+    nodes = [str(node) for node in graph]
+    arrays['graph/nodes'] = np.array(nodes, dtype=str) if nodes else np.array(nodes, dtype='<U1')
+    arrays['graph/node_offsets'] = np.array(node_offsets, dtype=np.int64)
+    arrays['graph/slot_directions'] = np.array(slot_directions, dtype=np.int64)
+    arrays['graph/slot_offsets'] = np.array(slot_offsets, dtype=np.int64)
+    arrays['graph/neighbours'] = np.array(neighbours, dtype=np.int64)
+
+    # Lay out arrays one after another, each aligned for memory-mapping
+    array_info = {}
+    offset = 0
+    for name, array in arrays.items():
+        array = np.ascontiguousarray(array)
+        arrays[name] = array
+        array_info[name] = {'dtype': array.dtype.str,
+                            'shape': list(array.shape),
+                            'offset': offset}
+        offset += -(-array.nbytes // ALIGNMENT) * ALIGNMENT
+
+    header = {'format_version': FORMAT_VERSION,
+              'config': {'mesh_info': mesh.config},
+              'num_cellboxes': num_cellboxes,
+              'columns': columns,
+              'directions': directions,
+              'arrays': array_info}
+    header = json.dumps(header).encode('utf-8')
+
+    with open(path, 'wb') as fp:
+        fp.write(MAGIC)
+        fp.write(struct.pack('<Q', len(header)))
+        fp.write(header)
+        data_start = -(-fp.tell() // ALIGNMENT) * ALIGNMENT
+        fp.write(b'\x00' * (data_start - fp.tell()))
+        for name, array in arrays.items():
+            fp.write(b'\x00' * (data_start + array_info[name]['offset'] - fp.tell()))
+            fp.write(array.tobytes())
+
+
+class BinaryMeshFile:
+    '''
+    Reader for binary mesh files. Arrays are memory-mapped when first used,
+    so only the parts of the file that are accessed are read from disk.
+
+    Attributes:
+        path (str): Location of the binary mesh file
+        config (dict): Config the mesh was built with, of the form {'mesh_info': ...}
+        num_cellboxes (int): Number of cellboxes in the mesh
+    '''
+    def __init__(self, path):
+        '''
+        Args:
+            path (str): Location of the binary mesh file
+
+        Raises:
+            ValueError: If the file is not a binary mesh file, or was written
+                by a newer version of the format
+        '''
+        self.path = path
+        with open(path, 'rb') as fp:
+            if fp.read(len(MAGIC)) != MAGIC:
+                raise ValueError(f'{path} is not a binary mesh file')
+            header_len, = struct.unpack('<Q', fp.read(8))
+            header = json.loads(fp.read(header_len).decode('utf-8'))
+            self._data_start = -(-fp.tell() // ALIGNMENT) * ALIGNMENT
+
+        if header['format_version'] > FORMAT_VERSION:
+            raise ValueError(f"Binary mesh format version {header['format_version']} " +
+                             f"is newer than supported version {FORMAT_VERSION}")
+        self.config = header['config']
+        self.num_cellboxes = header['num_cellboxes']
+        self._columns = header['columns']
+        self._directions = header['directions']
+        self._array_info = header['arrays']
+        self._arrays = {}
+
+    def get_array(self, name):
+        '''
+        Returns a memory-mapped array from the file
+
+        Args:
+            name (str): Name of the array, e.g. 'bounds/lat_min' or 'columns/id'
+
+        Returns:
+            np.ndarray: Read-only array
+        '''
+        if name not in self._arrays:
+            info = self._array_info[name]
+            dtype = np.dtype(info['dtype'])
+            shape = tuple(info['shape'])
+            if np.prod(shape) * dtype.itemsize == 0:
+                # Can't memory-map an empty region of a file
+                array = np.empty(shape, dtype=dtype)
+            else:
+                array = np.memmap(self.path, dtype=dtype, mode='r', shape=shape,
+                                  offset=self._data_start + info['offset'])
+            self._arrays[name] = array
+        return self._arrays[name]
+
+    def get_column_names(self):
+        '''
+        Returns the names of the cellbox fields stored in the file, including 'id'
+        '''
+        return [column['name'] for column in self._columns]
+
+    def get_column(self, name):
+        '''
+        Returns the values of a cellbox field for every cellbox, without
+        creating any cellboxes. Missing values are NaN for 'float' fields
+        and None otherwise.
+
+        Args:
+            name (str): Name of the field
+
+        Returns:
+            np.ndarray or list: Array of values for 'float', 'int' and 'str'
+                fields, and a list of values for 'json' fields
+        '''
+        column = self._get_column_info(name)
+        if column['kind'] == 'float':
+            # Missing values already stored as NaN
+            return self.get_array(f'columns/{name}')
+        values = [self._get_value(column, row) for row in range(self.num_cellboxes)]
+        if column['kind'] == 'json' or column['sparse']:
+            return values
+        return self.get_array(f'columns/{name}')
+
+    def _get_column_info(self, name):
+        for column in self._columns:
+            if column['name'] == name:
+                return column
+        raise KeyError(f"No cellbox field '{name}' in {self.path}")
+
+    def _get_value(self, column, row):
+        '''
+        Returns the value of a field for the cellbox at a given row,
+        or None if the cellbox doesn't have the field
+        '''
+        name = column['name']
+        if column['sparse'] and not self.get_array(f'columns/{name}#present')[row]:
+            return None
+
+        values = self.get_array(f'columns/{name}')
+        if column['kind'] == 'float':
+            return float(values[row])
+        elif column['kind'] == 'int':
+            return int(values[row])
+        elif column['kind'] == 'str':
+            return str(values[row])
+        else:
+            offsets = self.get_array(f'columns/{name}#offsets')
+            text = values[offsets[row]:offsets[row + 1]].tobytes()
+            return json.loads(text.decode('utf-8'))
+
+    def get_cellbox(self, row):
+        '''
+        Creates the AggregatedCellBox at a given row of the file
+
+        Args:
+            row (int): Index of the cellbox in the mesh
+
+        Returns:
+            AggregatedCellBox: Cellbox at the given row
+        '''
+        lat_min, lat_max, long_min, long_max = \
+            [float(self.get_array(f'bounds/{name}')[row]) for name in BOUNDS_ARRAYS]
+        bounds = Boundary([lat_min, lat_max], [long_min, long_max])
+
+        cellbox_id = None
+        agg_data = {}
+        for column in self._columns:
+            name = column['name']
+            if column['sparse'] and not self.get_array(f'columns/{name}#present')[row]:
+                continue
+            value = self._get_value(column, row)
+            if name == 'id':
+                cellbox_id = value
+            else:
+                agg_data[name] = value
+        return AggregatedCellBox(bounds, agg_data, cellbox_id)
+
+    def get_neighbour_graph(self):
+        '''
+        Creates the neighbour graph of the mesh. Node and direction keys are
+        strings, and neighbours are ints, as when loaded from the mesh JSON.
+
+        Returns:
+            NeighbourGraph: Neighbour graph of the mesh
+        '''
+        nodes = self.get_array('graph/nodes').tolist()
+        node_offsets = self.get_array('graph/node_offsets').tolist()
+        slot_directions = self.get_array('graph/slot_directions').tolist()
+        slot_offsets = self.get_array('graph/slot_offsets').tolist()
+        neighbours = self.get_array('graph/neighbours').tolist()
+
+        graph = {}
+        for i, node in enumerate(nodes):
+            graph[node] = {self._directions[slot_directions[slot]]:
+                               neighbours[slot_offsets[slot]:slot_offsets[slot + 1]]
+                           for slot in range(node_offsets[i], node_offsets[i + 1])}
+        return NeighbourGraph.from_json(graph)
+
+
+class LazyCellboxes(MutableSequence):
+    '''
+    List of the cellboxes in a binary mesh file, which creates each
+    AggregatedCellBox the first time it is accessed. Cellboxes can be
+    modified, added and removed as in a regular list.
+    '''
+    def __init__(self, mesh_file):
+        '''
+        Args:
+            mesh_file (BinaryMeshFile): File to read cellboxes from
+        '''
+        self._file = mesh_file
+        self._cellboxes = [None] * mesh_file.num_cellboxes
+        # Row in the file of each cellbox, or None if added after loading
+        self._rows = list(range(mesh_file.num_cellboxes))
+
+    def __len__(self):
+        return len(self._cellboxes)
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self[i] for i in range(*index.indices(len(self)))]
+        cellbox = self._cellboxes[index]
+        if cellbox is None:
+            cellbox = self._file.get_cellbox(self._rows[index])
+            self._cellboxes[index] = cellbox
+        return cellbox
+
+    def __setitem__(self, index, cellbox):
+        if isinstance(index, slice):
+            cellboxes = list(cellbox)
+            self._cellboxes[index] = cellboxes
+            self._rows[index] = [None] * len(cellboxes)
+        else:
+            self._cellboxes[index] = cellbox
+            self._rows[index] = None
+
+    def __delitem__(self, index):
+        del self._cellboxes[index]
+        del self._rows[index]
+
+    def insert(self, index, cellbox):
+        self._cellboxes.insert(index, cellbox)
+        self._rows.insert(index, None)
+
+    def num_loaded(self):
+        '''
+        Returns the number of cellboxes that have been created so far
+        '''
+        return sum(cellbox is not None for cellbox in self._cellboxes)
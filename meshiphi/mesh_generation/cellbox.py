@@ -55,6 +55,8 @@ class CellBox:
         self.split_depth = 0
         self.data_source = None
         self.id = id
+        # Values aggregated for filling in children, keyed on id of dataloader
+        self.fill_values = {}
 
 ######## setters and getters ########
     def set_minimum_datapoints(self, minimum_datapoints):
@@ -329,15 +331,7 @@ class CellBox:
                 if source.get_value_fill_type() == 'parent':
                     # if the agg_value empty and get_value_fill_type is parent, then use the parent bounds
                     while parent is not None and np.isnan(agg_value[data_name]):
-                        # Search through parent metadata to find match
-                        for parent_source in parent.get_data_source():
-                            if parent_source.get_data_loader() == source.get_data_loader():
-                                break
-                        # If no match found
-                        else:
-                            raise ValueError('Dataloader not found in parent')
-                        parent_data_subset = parent_source.get_data_subset()
-                        agg_value = loader.get_value(parent.bounds, data=parent_data_subset)
+                        agg_value = parent.get_fill_value(loader)
                         parent = parent.get_parent()
                 else:  # not parent, so either float or Nan so set the agg_Data to value_fill_type
                     agg_value[data_name] = source.get_value_fill_type()
@@ -366,20 +360,42 @@ class CellBox:
                 if source.get_value_fill_type() == 'parent':
                     # if the agg_value empty and get_value_fill_type is parent, then use the parent bounds
                     while parent is not None and np.isnan(agg_value[name]):
-                        # Search through parent metadata to find match
-                        for parent_source in parent.get_data_source():
-                            if parent_source.get_data_loader() == source.get_data_loader():
-                                break
-                        # If no match found
-                        else:
-                            raise ValueError('Dataloader not found in parent')
-                        parent_data_subset = parent_source.get_data_subset()
-                        agg_value[name] = loader.get_value(parent.bounds, data=parent_data_subset)[name]
+                        agg_value[name] = parent.get_fill_value(source.get_data_loader())[name]
                         parent = parent.get_parent()
                 else:  # not parent, so either float or Nan so set the agg_Data to value_fill_type
                     agg_value[data_name] = source.get_value_fill_type()
         return agg_value
 
+    def get_fill_value(self, loader):
+        """
+        Returns the aggregated value of a dataloader within this cellbox, used to
+        fill in NaN values of the cellboxes it has been split into. The value is
+        aggregated at most once per dataloader and reused for every child, after
+        which the data subset of that dataloader is no longer needed and is freed.
+
+        Args:
+            loader (DataLoader): Dataloader to aggregate the value of
+
+        Returns:
+            dict: {variable (str): aggregated_value (float)}
+
+        Raises:
+            ValueError: If the dataloader isn't one of the cellbox's data sources
+        """
+        key = id(loader)
+        if key not in self.fill_values:
+            # Search through metadata to find match
+            for source in self.get_data_source():
+                if source.get_data_loader() == loader:
+                    break
+            # If no match found
+            else:
+                raise ValueError('Dataloader not found in parent')
+            self.fill_values[key] = loader.get_value(self.bounds, data=source.get_data_subset())
+            source.set_data_subset(None)
+        # Copy so that filled in values don't alter the cached value
+        return dict(self.fill_values[key])
+
     def deallocate_cellbox(self):
         """
         Method to free up the memory space allocated by the cellbox
@@ -0,0 +1,573 @@
+"""
+Spatial index used to find the cellboxes of a mesh that contain a point,
+without testing every cellbox in the mesh.
+"""
+
+import operator
+
+import numpy as np
+
+
+def _bounds_rects(bounds):
+    '''
+    Returns the (lat_min, lat_max, long_min, long_max) rectangles covered by
+    a boundary. A boundary crossing the antimeridian covers two rectangles,
+    one either side of it, matching the polygons created by Boundary.to_polygon()
+    '''
+    lat_min, lat_max = bounds.get_lat_min(), bounds.get_lat_max()
+    long_min, long_max = bounds.get_long_min(), bounds.get_long_max()
+    if long_min < long_max:
+        return [(lat_min, lat_max, long_min, long_max)]
+    elif long_min == 180:
+        return [(lat_min, lat_max, -180, long_max)]
+    elif long_max == -180:
+        return [(lat_min, lat_max, long_min, 180)]
+    else:
+        return [(lat_min, lat_max, long_min, 180),
+                (lat_min, lat_max, -180, long_max)]
+
+
+def bounds_contain_point(bounds, lat, long):
+    '''
+    Determines whether a point is strictly within a boundary, the same as
+    AggregatedCellBox.contains_point()
+
+    Args:
+        bounds (Boundary): Boundary to check
+        lat (float): Latitude of the point
+        long (float): Longitude of the point
+
+    Returns:
+        bool: True if the point is within the boundary
+    '''
+    return any(rect[0] < lat < rect[1] and rect[2] < long < rect[3]
+               for rect in _bounds_rects(bounds))
+
+
+def locate_points(cellboxes, lats, longs):
+    '''
+    Finds the cellboxes containing each of an array of points at once.
+    To search the same cellboxes more than once, create a CellboxLocator
+    and reuse it.
+
+    Args:
+        cellboxes (list<AggregatedCellBox>): Cellboxes to search
+        lats (np.array): Latitudes of the points
+        longs (np.array): Longitudes of the points, the same shape as lats
+
+    Returns:
+        np.array: Position in cellboxes of the cellbox containing each point,
+            or -1 if the point is not within any cellbox. If a point is
+            within more than one cellbox, the first is returned.
+    '''
+    return CellboxLocator(cellboxes).locate(lats, longs)
+
+
+class CellboxLocator:
+    '''
+    Grid of buckets over the bounds of a fixed list of cellboxes, used to find
+    the cellboxes containing many points at once with array operations only.
+
+    Each bucket holds the rectangles of the cellboxes that overlap it, stored
+    as a single array sorted by bucket. Buckets are about the size of a typical
+    cellbox, so each point is only compared against the few rectangles in its
+    bucket, and the cost of locating points doesn't grow with the number of
+    cellboxes. A cellbox contains a point if the point is strictly within its
+    bounds, the same as AggregatedCellBox.contains_point().
+    '''
+    def __init__(self, cellboxes, max_buckets_per_rect=4):
+        '''
+        Args:
+            cellboxes (list<AggregatedCellBox>): Cellboxes to locate points in.
+                The list is copied, so the locator isn't affected if it changes
+            max_buckets_per_rect (int): Limits the number of buckets to this
+                many times the number of rectangles
+        '''
+        self.cellboxes = list(cellboxes)
+        rects = []
+        rect_positions = []
+        for position, cellbox in enumerate(self.cellboxes):
+            for rect in _bounds_rects(cellbox.get_bounds()):
+                rects.append(rect)
+                rect_positions.append(position)
+        rects = np.array(rects, dtype=float).reshape(-1, 4)
+        self._rect_positions = np.array(rect_positions, dtype=np.int64)
+
+        if len(rects) == 0:
+            self._shape = (1, 1)
+            self._origin = (0., 0.)
+            self._spacing = (1., 1.)
+            self._starts = np.zeros(2, dtype=np.int64)
+            self._entry_rects = [np.zeros(0) for _ in range(4)]
+            self._entry_positions = np.zeros(0, dtype=np.int64)
+            return
+
+        # Buckets cover the extent of all rectangles, each about the size of
+        # the median rectangle, but no more than max_buckets_per_rect per rectangle
+        lat_min, lat_max = rects[:, 0].min(), rects[:, 1].max()
+        long_min, long_max = rects[:, 2].min(), rects[:, 3].max()
+        lat_extent = max(lat_max - lat_min, np.finfo(float).eps)
+        long_extent = max(long_max - long_min, np.finfo(float).eps)
+        num_lat = lat_extent / max(np.median(rects[:, 1] - rects[:, 0]), np.finfo(float).eps)
+        num_long = long_extent / max(np.median(rects[:, 3] - rects[:, 2]), np.finfo(float).eps)
+        scale = min(1., np.sqrt(max_buckets_per_rect * len(rects) / (num_lat * num_long)))
+        self._shape = (int(np.clip(np.ceil(num_lat * scale), 1, None)),
+                       int(np.clip(np.ceil(num_long * scale), 1, None)))
+        self._origin = (lat_min, long_min)
+        self._spacing = (lat_extent / self._shape[0], long_extent / self._shape[1])
+
+        # Every bucket each rectangle overlaps, as (bucket, rectangle) pairs
+        row_start, col_start = self._bucket_coords(rects[:, 0], rects[:, 2])
+        row_end, col_end = self._bucket_coords(rects[:, 1], rects[:, 3])
+        num_rows = row_end - row_start + 1
+        num_cols = col_end - col_start + 1
+        counts = num_rows * num_cols
+        rect_ids = np.repeat(np.arange(len(rects)), counts)
+        offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+        rows = row_start[rect_ids] + offsets // num_cols[rect_ids]
+        cols = col_start[rect_ids] + offsets % num_cols[rect_ids]
+        buckets = rows * self._shape[1] + cols
+
+        # Rectangles sorted by bucket, in order of position within each bucket.
+        # Stored as separate arrays, so the rectangles of a bucket are contiguous
+        entries = rect_ids[np.argsort(buckets, kind='stable')]
+        self._entry_rects = [np.ascontiguousarray(rects[entries, i]) for i in range(4)]
+        self._entry_positions = self._rect_positions[entries]
+        self._starts = np.zeros(self._shape[0] * self._shape[1] + 1, dtype=np.int64)
+        np.cumsum(np.bincount(buckets, minlength=self._shape[0] * self._shape[1]),
+                  out=self._starts[1:])
+
+    def __len__(self):
+        return len(self.cellboxes)
+
+    def matches(self, cellboxes):
+        '''
+        Determines whether the locator was created for the same cellboxes,
+        in the same order
+
+        Args:
+            cellboxes (list<AggregatedCellBox>): Cellboxes to compare against
+
+        Returns:
+            bool: True if cellboxes are the cellboxes of the locator
+        '''
+        return len(cellboxes) == len(self.cellboxes) and \
+               all(map(operator.is_, cellboxes, self.cellboxes))
+
+    def _bucket_coords(self, lats, longs):
+        '''
+        Returns the row and column of the bucket each coordinate is in,
+        clipped to the grid of buckets
+        '''
+        rows = np.floor((lats - self._origin[0]) / self._spacing[0])
+        cols = np.floor((longs - self._origin[1]) / self._spacing[1])
+        return np.clip(rows, 0, self._shape[0] - 1).astype(np.int64), \
+               np.clip(cols, 0, self._shape[1] - 1).astype(np.int64)
+
+    def locate(self, lats, longs):
+        '''
+        Finds the cellboxes containing each of an array of points
+
+        Args:
+            lats (np.array): Latitudes of the points
+            longs (np.array): Longitudes of the points, the same shape as lats
+
+        Returns:
+            np.array: Position in the cellboxes of the cellbox containing each
+                point, or -1 if the point is not within any cellbox. If a point
+                is within more than one cellbox, the first is returned.
+        '''
+        lats = np.asarray(lats, dtype=float)
+        longs = np.asarray(longs, dtype=float)
+        if lats.shape != longs.shape:
+            raise ValueError(f'lats and longs must be the same shape, not {lats.shape} and {longs.shape}')
+
+        flat_lats = lats.ravel()
+        flat_longs = longs.ravel()
+        positions = np.full(flat_lats.shape, -1, dtype=np.int64)
+        # NaN coordinates are not within any cellbox
+        valid = np.flatnonzero(~(np.isnan(flat_lats) | np.isnan(flat_longs)))
+        if len(valid) == 0 or len(self._entry_positions) == 0:
+            return positions.reshape(lats.shape)
+
+        # Visit points in order of bucket, so that the rectangles of each
+        # bucket are read from memory together
+        rows, cols = self._bucket_coords(flat_lats[valid], flat_longs[valid])
+        buckets = rows * self._shape[1] + cols
+        order = np.argsort(buckets, kind='stable')
+        points = valid[order]
+        buckets = buckets[order]
+
+        # Every rectangle in the bucket of each point, as (point, entry) pairs
+        starts = self._starts[buckets]
+        counts = self._starts[buckets + 1] - starts
+        ends = np.cumsum(counts)
+        entries = np.arange(ends[-1]) - np.repeat(ends - counts - starts, counts)
+        point_lats = np.repeat(flat_lats[points], counts)
+        point_longs = np.repeat(flat_longs[points], counts)
+
+        # Containment is strict, as in AggregatedCellBox.contains_point()
+        lat_min, lat_max, long_min, long_max = self._entry_rects
+        inside = (lat_min[entries] < point_lats) & (point_lats < lat_max[entries]) & \
+                 (long_min[entries] < point_longs) & (point_longs < long_max[entries])
+        pair_points = np.repeat(points, counts)[inside]
+        entries = entries[inside]
+
+        # Pairs are grouped by point, with rectangles in order of position,
+        # so the first pair of each point is the first cellbox containing it
+        first = np.ones(len(pair_points), dtype=bool)
+        first[1:] = pair_points[1:] != pair_points[:-1]
+        positions[pair_points[first]] = self._entry_positions[entries[first]]
+        return positions.reshape(lats.shape)
+
+
+def rasterise_cellboxes(cellboxes, lats, longs):
+    '''
+    Burns the bounds of cellboxes into a raster grid, finding the cellbox
+    containing the centre of each pixel. The pixels within each cellbox
+    are found by binary search of the pixel centres along each axis, so
+    each cellbox is written to the grid as a single block.
+
+    Args:
+        cellboxes (list<AggregatedCellBox>): Cellboxes to rasterise
+        lats (np.array): Latitude of the centre of each row of pixels
+        longs (np.array): Longitude of the centre of each column of pixels
+
+    Returns:
+        np.array: (len(lats), len(longs)) array of the position in cellboxes
+            of the cellbox containing each pixel centre, or -1 if the pixel
+            centre is not within any cellbox. If a pixel centre is within
+            more than one cellbox, the first is returned.
+    '''
+    lats = np.asarray(lats, dtype=float)
+    longs = np.asarray(longs, dtype=float)
+    # Burn into a grid with both axes sorted, so each cellbox is a slice of it
+    row_order = np.argsort(lats, kind='stable')
+    sorted_lats = lats[row_order]
+    col_order = np.argsort(longs, kind='stable')
+    sorted_longs = longs[col_order]
+    sorted_positions = np.full((len(lats), len(longs)), -1, dtype=np.int64)
+
+    # Burn cellboxes in reverse so that the first containing cellbox is kept
+    for position in range(len(cellboxes) - 1, -1, -1):
+        for rect in _bounds_rects(cellboxes[position].get_bounds()):
+            # Containment is strict, as in AggregatedCellBox.contains_point()
+            row_start = np.searchsorted(sorted_lats, rect[0], side='right')
+            row_end = np.searchsorted(sorted_lats, rect[1], side='left')
+            col_start = np.searchsorted(sorted_longs, rect[2], side='right')
+            col_end = np.searchsorted(sorted_longs, rect[3], side='left')
+            sorted_positions[row_start:row_end, col_start:col_end] = position
+
+    # Return the rows and columns to the order of lats and longs
+    positions = np.empty_like(sorted_positions)
+    positions[np.ix_(row_order, col_order)] = sorted_positions
+    return positions
+
+
+class _QuadNode:
+    '''
+    Node of a region quadtree, holding the rectangles that overlap it until
+    it has more than 'capacity' of them, at which point they are moved
+    into its four children
+    '''
+    __slots__ = ['lat_min', 'lat_max', 'long_min', 'long_max',
+                 'lat_mid', 'long_mid', 'depth', 'entries', 'children']
+
+    def __init__(self, lat_min, lat_max, long_min, long_max, depth):
+        self.lat_min = lat_min
+        self.lat_max = lat_max
+        self.long_min = long_min
+        self.long_max = long_max
+        self.lat_mid = (lat_min + lat_max) / 2
+        self.long_mid = (long_min + long_max) / 2
+        self.depth = depth
+        self.entries = []
+        self.children = None
+
+    def overlaps(self, rect):
+        '''
+        Determines whether a rectangle overlaps this node. Rectangles that
+        only touch the edge of the node can't contain any point within it.
+        '''
+        return rect[0] < self.lat_max and rect[1] > self.lat_min and \
+               rect[2] < self.long_max and rect[3] > self.long_min
+
+    def touches(self, rect):
+        '''
+        Determines whether a rectangle overlaps or touches the edge of this node
+        '''
+        return rect[0] <= self.lat_max and rect[1] >= self.lat_min and \
+               rect[2] <= self.long_max and rect[3] >= self.long_min
+
+    def covered(self):
+        '''
+        Determines whether every rectangle in this node covers all of it,
+        in which case splitting the node would not separate them
+        '''
+        return all(rect[0] <= self.lat_min and rect[1] >= self.lat_max and
+                   rect[2] <= self.long_min and rect[3] >= self.long_max
+                   for rect, _ in self.entries)
+
+    def child(self, lat, long):
+        '''
+        Returns the child node a point falls in
+        '''
+        return self.children[(2 if lat >= self.lat_mid else 0) +
+                             (1 if long >= self.long_mid else 0)]
+
+    def split(self):
+        '''
+        Creates the four children of this node, and moves its rectangles into them
+        '''
+        self.children = [
+            _QuadNode(self.lat_min, self.lat_mid, self.long_min, self.long_mid, self.depth + 1),
+            _QuadNode(self.lat_min, self.lat_mid, self.long_mid, self.long_max, self.depth + 1),
+            _QuadNode(self.lat_mid, self.lat_max, self.long_min, self.long_mid, self.depth + 1),
+            _QuadNode(self.lat_mid, self.lat_max, self.long_mid, self.long_max, self.depth + 1)
+        ]
+        for entry in self.entries:
+            for child in self.children:
+                if child.overlaps(entry[0]):
+                    child.entries.append(entry)
+        self.entries = []
+
+
+class CellboxIndex:
+    '''
+    Region quadtree over the bounds of a set of cellboxes, used to find the
+    cellboxes containing a point in O(log n) time. Cellboxes can be added
+    and removed as the mesh they belong to is modified.
+
+    A cellbox contains a point if the point is strictly within its bounds,
+    the same as AggregatedCellBox.contains_point(). Cellboxes crossing the
+    antimeridian are indexed as two rectangles, one either side of it.
+    '''
+    def __init__(self, cellboxes=(), capacity=8, max_depth=24):
+        '''
+        Args:
+            cellboxes (iterable<AggregatedCellBox>): Cellboxes to index
+            capacity (int): Number of rectangles a node holds before it is split
+            max_depth (int): Maximum depth of the quadtree
+        '''
+        self.capacity = capacity
+        self.max_depth = max_depth
+        self._root = _QuadNode(-90, 90, -180, 180, 0)
+        self._size = 0
+        for cellbox in cellboxes:
+            self.insert(cellbox)
+
+    def __len__(self):
+        return self._size
+
+    def insert(self, cellbox):
+        '''
+        Adds a cellbox to the index
+
+        Args:
+            cellbox (AggregatedCellBox): Cellbox to add
+        '''
+        for rect in _bounds_rects(cellbox.get_bounds()):
+            entry = (rect, cellbox)
+            stack = [self._root]
+            while stack:
+                node = stack.pop()
+                if not node.overlaps(rect):
+                    continue
+                if node.children is not None:
+                    stack.extend(node.children)
+                    continue
+                node.entries.append(entry)
+                if len(node.entries) > self.capacity and node.depth < self.max_depth \
+                        and not node.covered():
+                    node.split()
+        self._size += 1
+
+    def remove(self, cellbox):
+        '''
+        Removes a cellbox from the index
+
+        Args:
+            cellbox (AggregatedCellBox): Cellbox to remove. Must be the same
+                object that was added to the index, with the same bounds
+        '''
+        for rect in _bounds_rects(cellbox.get_bounds()):
+            stack = [self._root]
+            while stack:
+                node = stack.pop()
+                if not node.overlaps(rect):
+                    continue
+                if node.children is not None:
+                    stack.extend(node.children)
+                    continue
+                node.entries = [entry for entry in node.entries if entry[1] is not cellbox]
+        self._size -= 1
+
+    def query(self, lat, long):
+        '''
+        Finds the cellboxes containing a point
+
+        Args:
+            lat (float): Latitude of the point
+            long (float): Longitude of the point
+
+        Returns:
+            list<AggregatedCellBox>: Cellboxes containing the point, in the
+                order they were added to the index
+        '''
+        node = self._root
+        if not (node.lat_min <= lat <= node.lat_max and node.long_min <= long <= node.long_max):
+            return []
+        while node.children is not None:
+            node = node.child(lat, long)
+
+        found = []
+        for rect, cellbox in node.entries:
+            if rect[0] < lat < rect[1] and rect[2] < long < rect[3]:
+                if not any(cellbox is other for other in found):
+                    found.append(cellbox)
+        return found
+
+    def query_bounds(self, lat_min, lat_max, long_min, long_max):
+        '''
+        Finds the cellboxes that overlap or touch the edge of a rectangle
+
+        Args:
+            lat_min (float): Minimum latitude of the rectangle
+            lat_max (float): Maximum latitude of the rectangle
+            long_min (float): Minimum longitude of the rectangle
+            long_max (float): Maximum longitude of the rectangle
+
+        Returns:
+            list<AggregatedCellBox>: Cellboxes overlapping or touching the rectangle
+        '''
+        query_rect = (lat_min, lat_max, long_min, long_max)
+        # Keyed on object id, as a cellbox may be in several nodes
+        found = {}
+        stack = [self._root]
+        while stack:
+            node = stack.pop()
+            if not node.touches(query_rect):
+                continue
+            if node.children is not None:
+                stack.extend(node.children)
+                continue
+            for rect, cellbox in node.entries:
+                if rect[0] <= lat_max and rect[1] >= lat_min and \
+                        rect[2] <= long_max and rect[3] >= long_min:
+                    found[id(cellbox)] = cellbox
+        return list(found.values())
+
+
+class CellboxIdIndex:
+    '''
+    Index of a list of cellboxes by id, used to find a cellbox, its position
+    in the list and the maximum cellbox id without scanning the list.
+
+    Each cellbox is numbered in the order it was added. Cellboxes are only
+    appended to or removed from the list, so the list stays sorted by these
+    numbers and the position of a cellbox is found by binary search.
+    '''
+    def __init__(self, cellboxes):
+        '''
+        Args:
+            cellboxes (list<AggregatedCellBox>): Cellboxes to index. The list
+                is not modified, and should be updated alongside the index
+        '''
+        self.cellboxes = cellboxes
+        self._by_id = {}
+        self._order = {}
+        self._next_order = 0
+        self._max_id = 0
+        self._max_id_stale = False
+        for cellbox in cellboxes:
+            self.add(cellbox)
+
+    def __len__(self):
+        return len(self._by_id)
+
+    def add(self, cellbox):
+        '''
+        Adds a cellbox appended to the end of the list to the index
+
+        Args:
+            cellbox (AggregatedCellBox): Cellbox to add
+        '''
+        cellbox_id = str(cellbox.get_id())
+        self._by_id[cellbox_id] = cellbox
+        self._order[cellbox_id] = self._next_order
+        self._next_order += 1
+        if not self._max_id_stale and int(cellbox_id) > self._max_id:
+            self._max_id = int(cellbox_id)
+
+    def remove(self, cellbox):
+        '''
+        Removes a cellbox from the index
+
+        Args:
+            cellbox (AggregatedCellBox): Cellbox to remove
+        '''
+        cellbox_id = str(cellbox.get_id())
+        del self._by_id[cellbox_id]
+        del self._order[cellbox_id]
+        # Only search for the new maximum if it's needed
+        if int(cellbox_id) == self._max_id:
+            self._max_id_stale = True
+
+    def get(self, cellbox_id):
+        '''
+        Finds the cellbox with a given id
+
+        Args:
+            cellbox_id (str): Id of the cellbox
+
+        Returns:
+            AggregatedCellBox: The cellbox, or None if there is no cellbox with the id
+        '''
+        return self._by_id.get(str(cellbox_id))
+
+    def position(self, cellbox):
+        '''
+        Finds the position of a cellbox in the list of cellboxes
+
+        Args:
+            cellbox (AggregatedCellBox): Cellbox to find
+
+        Returns:
+            int: Position of the cellbox in the list
+
+        Raises:
+            ValueError: If the cellbox is not in the list
+        '''
+        cellbox_id = str(cellbox.get_id())
+        if self._by_id.get(cellbox_id) is not cellbox:
+            raise ValueError(f'Cellbox {cellbox_id} is not in the mesh')
+        order = self._order[cellbox_id]
+        low, high = 0, len(self.cellboxes)
+        while low < high:
+            mid = (low + high) // 2
+            if self._order[str(self.cellboxes[mid].get_id())] < order:
+                low = mid + 1
+            else:
+                high = mid
+        return low
+
+    def sort(self, cellboxes):
+        '''
+        Sorts cellboxes into the order they are in the list of cellboxes
+
+        Args:
+            cellboxes (list<AggregatedCellBox>): Cellboxes in the index to sort
+
+        Returns:
+            list<AggregatedCellBox>: The cellboxes in the order of the list of cellboxes
+        '''
+        return sorted(cellboxes, key=lambda cellbox: self._order[str(cellbox.get_id())])
+
+    def max_id(self):
+        '''
+        Returns the maximum id of the cellboxes in the index, or 0 if there are none
+        '''
+        if self._max_id_stale:
+            self._max_id = max([0] + [int(cellbox_id) for cellbox_id in self._by_id])
+            self._max_id_stale = False
+        return self._max_id
@@ -13,12 +13,15 @@ from shapely import wkt
 from meshiphi.mesh_generation.boundary import Boundary
 from meshiphi.mesh_generation.aggregated_cellbox import AggregatedCellBox
 from meshiphi.mesh_generation.neighbour_graph import NeighbourGraph
+from meshiphi.mesh_generation.mesh_writer import open_mesh_file, write_mesh_json
+from meshiphi.mesh_generation.binary_mesh import BinaryMeshFile, LazyCellboxes, write_binary_mesh
+from meshiphi.mesh_generation.cellbox_index import CellboxIdIndex, CellboxIndex, CellboxLocator, bounds_contain_point, \
+                                                     rasterise_cellboxes
 
 
 from meshiphi.mesh_validation.sampler import Sampler
 import collections.abc
 import math
-from pathlib import Path
 
 class EnvironmentMesh:
     """
@@ -96,6 +99,26 @@ class EnvironmentMesh:
         obj = EnvironmentMesh(bounds, agg_cellboxes, neighbour_graph, config)
         return obj
 
+    @classmethod
+    def load_from_binary(cls, path):
+        """
+            Constructs an Env.Mesh from a binary mesh file saved with format 'BINARY'. 
+            The file is memory-mapped, and each AggregatedCellBox is only created 
+            from it the first time it is accessed.
+
+            Args:
+                path (str): location of the binary mesh file
+            Returns:
+                EnvironmentMesh: object that contains all the binary mesh file information.\n
+        """
+        mesh_file = BinaryMeshFile(path)
+        config = mesh_file.config['mesh_info']
+        bounds = Boundary.from_json(config)
+        agg_cellboxes = LazyCellboxes(mesh_file)
+        neighbour_graph = mesh_file.get_neighbour_graph()
+        obj = EnvironmentMesh(bounds, agg_cellboxes, neighbour_graph, config)
+        return obj
+
     def __init__(self, bounds, agg_cellboxes, neighbour_graph, config):
         """
             Args:
@@ -109,7 +132,52 @@ class EnvironmentMesh:
         self.agg_cellboxes = agg_cellboxes
         self.neighbour_graph = neighbour_graph
         self.config = config
+        # Spatial index of agg_cellboxes, built on first point query
+        self._cellbox_index = None
+        # Index of agg_cellboxes by id, built on first lookup
+        self._cellbox_id_index = None
+        # Grid of agg_cellboxes used to locate many points at once, built on first use
+        self._cellbox_locator = None
+
+    def get_cellbox_index(self):
+        """
+            Returns the spatial index used to find the cellboxes containing a point.
+            The index is built on first use, and kept up to date by add_cellbox, 
+            remove_cellbox and split_and_replace. If agg_cellboxes has been 
+            modified directly, the index is rebuilt.
+
+            Returns:
+                CellboxIndex: spatial index of agg_cellboxes
+        """
+        if self._cellbox_index is None or len(self._cellbox_index) != len(self.agg_cellboxes):
+            self._cellbox_index = CellboxIndex(self.agg_cellboxes)
+        return self._cellbox_index
+
+    def _get_cellbox_id_index(self):
+        """
+            Returns the index of agg_cellboxes by id, building it on first use or
+            if agg_cellboxes has been modified directly.
 
+            Returns:
+                CellboxIdIndex: index of agg_cellboxes by id
+        """
+        if self._cellbox_id_index is None or self._cellbox_id_index.cellboxes is not self.agg_cellboxes \
+                or len(self._cellbox_id_index) != len(self.agg_cellboxes):
+            self._cellbox_id_index = CellboxIdIndex(self.agg_cellboxes)
+        return self._cellbox_id_index
+
+
+    def _get_cellbox_locator(self):
+        """
+            Returns the grid used to locate many points in agg_cellboxes at once,
+            building it on first use or if agg_cellboxes has been modified since.
+
+            Returns:
+                CellboxLocator: grid of agg_cellboxes
+        """
+        if self._cellbox_locator is None or not self._cellbox_locator.matches(self.agg_cellboxes):
+            self._cellbox_locator = CellboxLocator(self.agg_cellboxes)
+        return self._cellbox_locator
 
     def query_inside_mesh(self,point):
         """
@@ -120,8 +188,8 @@ class EnvironmentMesh:
             Returns:
                 inside_mesh (bool) - Boolean stating if point inside mesh
         """
-        inside_cell = [agg_cell.contains_point(point[0],point[1]) for agg_cell in self.agg_cellboxes]
-        if any(inside_cell):
+        inside_cells = self.get_cellbox_index().query(point[0], point[1])
+        if len(inside_cells) > 0:
             return True
         else:
             return False
@@ -135,18 +203,82 @@ class EnvironmentMesh:
             Returns:
                 cellbox_index (str) - Cellbox index containing the point
         """
-        inside_cell = [agg_cell.contains_point(point[0],point[1]) for agg_cell in self.agg_cellboxes]
+        inside_cells = self.get_cellbox_index().query(point[0], point[1])
 
-        if any(inside_cell):
-            indices = np.where(inside_cell)[0]
-            if len(indices) > 1:
+        if len(inside_cells) > 0:
+            if len(inside_cells) > 1:
                 raise Exception('Point within more than one cellbox')    
             else:
-                indx = indices[0]
-                return self.agg_cellboxes[indx].id
+                return inside_cells[0].id
         else:
             raise Exception('Point not within the mesh')
 
+    def query_index_many(self, lats, longs):
+        """
+            Returns the indices of the aggregate cellboxes that contain each of
+            an array of points, found in a single vectorised search
+
+            Args:
+                lats (np.array) - latitudes of the points to query
+                longs (np.array) - longitudes of the points to query, the same shape as lats
+            Returns:
+                cellbox_indices (np.array) - Cellbox index containing each point, or 
+                    None for points not within the mesh. Points on the shared edge of
+                    cellboxes are not within either of them.
+        """
+        positions = self._get_cellbox_locator().locate(lats, longs)
+        cellbox_ids = np.empty(positions.shape, dtype=object)
+        inside_mesh = positions >= 0
+        cellbox_ids[inside_mesh] = [self.agg_cellboxes[position].id 
+                                    for position in positions[inside_mesh]]
+        return cellbox_ids
+
+    def sample_values(self, lats, longs, data_name):
+        """
+            Returns the aggregated value of the cellboxes that contain each of an 
+            array of points, found in a single vectorised search. Vector data is 
+            sampled as the mean of its components.
+
+            Args:
+                lats (np.array) - latitudes of the points to sample
+                longs (np.array) - longitudes of the points to sample, the same shape as lats
+                data_name (str) - name of the aggregated value to sample
+            Returns:
+                values (np.array) - value of data_name at each point, or nan for 
+                    points not within the mesh or within cellboxes without data_name
+        """
+        positions = self._get_cellbox_locator().locate(lats, longs)
+        return self._get_cellbox_values(positions, data_name)
+
+    def _get_cellbox_values(self, positions, data_name):
+        """
+            Returns the aggregated value of the cellboxes at an array of positions in
+            agg_cellboxes. Vector data is sampled as the mean of its components.
+
+            Args:
+                positions (np.array) - positions in agg_cellboxes, or -1 for no cellbox
+                data_name (str) - name of the aggregated value to sample
+            Returns:
+                values (np.array) - value of data_name at each position, or nan for 
+                    no cellbox or cellboxes without data_name
+        """
+        # Look up each cellbox value once, however many positions it is at.
+        # The extra nan at the end of cellbox_values is the value at position -1
+        cellbox_values = np.full(len(self.agg_cellboxes) + 1, np.nan)
+        sampled = np.zeros(len(self.agg_cellboxes) + 1, dtype=bool)
+        sampled[positions] = True
+        for position in np.flatnonzero(sampled[:-1]):
+            value = self.agg_cellboxes[position].agg_data.get(data_name)
+            if value is None:
+                logging.debug(f'{data_name} not found in cellbox!')
+                continue
+            if isinstance(value, collections.abc.Sequence): # if it is a vector then take the mean
+                value = np.mean(value)
+                if value == float('inf'): # replace inf with nan
+                    value = np.nan
+            cellbox_values[position] = value
+        return cellbox_values[positions]
+
 
 
     def _split_loc(self,point):
@@ -194,6 +326,52 @@ class EnvironmentMesh:
                 while splitting_waypoint:
                     splitting_waypoint = self._split_loc(point)
 
+    def batch_split_points(self, points):
+        """
+            Splitting the mesh to maximum split depth around a series of point locations, one split depth 
+            at a time. The cellbox containing each point is found once, and each point is then followed into 
+            the split cellbox containing it, rather than searching the mesh for it after every split. Each 
+            cellbox is split once at each depth, however many points it contains, and the neighbour graph is 
+            updated once per depth for all of the cellboxes split at it. The cellboxes and neighbour graph 
+            created are the same as split_points, but are numbered in the order of the split depth they were 
+            created at.
+
+            Args:
+                points ([tuple,tuple]) - List of tuples (lat,lon) for the different point locations to split about
+
+        """
+        # Determing the mesh maximum split depth
+        min_dcx = self.config['region']['cell_width']/(2**(self.config['splitting']['split_depth']))
+        min_dcy = self.config['region']['cell_height']/(2**(self.config['splitting']['split_depth']))
+
+        # Cellboxes to split at the current depth, and the points within each of them
+        split_cellboxes = {}
+        for point in points:
+            inside_cells = self.get_cellbox_index().query(point[0], point[1])
+            if len(inside_cells) == 1:
+                split_cellboxes.setdefault(inside_cells[0].id, (inside_cells[0], []))[1].append(point)
+
+        # The spatial index is rebuilt on next use, rather than updated after every split
+        self._cellbox_index = None
+
+        while split_cellboxes:
+            # Continue with cellboxes that aren't at max split depth
+            split_cellboxes = {cellbox_id: (cellbox, cellbox_points) 
+                               for cellbox_id, (cellbox, cellbox_points) in split_cellboxes.items()
+                               if cellbox.boundary.get_width() > min_dcx and cellbox.boundary.get_height() > min_dcy}
+            split_results = self.split_and_replace_many(list(split_cellboxes))
+
+            next_split_cellboxes = {}
+            for cellbox_id, (cellbox, cellbox_points) in split_cellboxes.items():
+                new_cellboxes = split_results[str(cellbox_id)]
+                for point in cellbox_points:
+                    for new_cellbox in new_cellboxes:
+                        # Points on the edges between the new cellboxes are not within any of them
+                        if bounds_contain_point(new_cellbox.get_bounds(), point[0], point[1]):
+                            next_split_cellboxes.setdefault(new_cellbox.id, (new_cellbox, []))[1].append(point)
+                            break
+            split_cellboxes = next_split_cellboxes
+
     def get_cellbox(self, cellbox_id):
         """
             returns the cellbox with the given id
@@ -203,9 +381,7 @@ class EnvironmentMesh:
             Returns:
                 AggregatedCellBox: the cellbox with the given id
         """
-        for cellbox in self.agg_cellboxes:
-            if str(cellbox.get_id()) == str(cellbox_id):
-                return cellbox
+        return self._get_cellbox_id_index().get(cellbox_id)
 
     # Merging meshes
     def merge_mesh(self, mesh2):
@@ -215,49 +391,120 @@ class EnvironmentMesh:
             Args:
                 mesh2 (EnvironmentMesh): the mesh to be merged with this mesh
         """
+        self.merge_meshes([mesh2])
 
-        assert self.validate_merge_compatibility(mesh2), "The given mesh is not compatible with merging with this mesh" 
-
-        # append config files
-        if "merged" not in self.config.keys():
-            self.config["merged"] = []
-
-        self.config["merged"].append(mesh2.config)
-
-        # merge cellboxes
-        mesh2_bounds = mesh2.bounds
-
-        # remove cellboxes within bounds of mesh2 from this mesh
-        self.remove_cellboxes_within_bounds(mesh2_bounds)
-
-        # Appended cellboxes from mesh2 to this mesh
-        mesh1_max_id = self.get_max_cellbox_id()
-        mesh2.increment_ids(mesh1_max_id + 1)
-        for cellbox in mesh2.agg_cellboxes:
-            self.add_cellbox(cellbox)
-
-        # Appened neighbour graph from mesh2 to this mesh
-        for index in mesh2.neighbour_graph.get_graph().keys():
-            neighbour_map = mesh2.neighbour_graph.neighbour_graph[index]
-
-            self.neighbour_graph.add_node(index, neighbour_map)
-
-        # Tie the neighbour graphs of the cellboxes on the boundary between the two meshes
-        north_ext_cellboxes = self.get_cellboxes_north_of_bounds(mesh2_bounds)
-        north_int_cellboxes = mesh2.get_top_edge_cellboxes()
-        self.tie_northern_cellbox_ng(north_ext_cellboxes, north_int_cellboxes)
+    def merge_meshes(self, meshes):
+        """
+            merges each of the given meshes with this mesh in turn, with the same result as 
+            calling merge_mesh for each of them. The cellboxes on the boundary of each mesh are 
+            found using the spatial index of this mesh, and agg_cellboxes is updated once all 
+            of the meshes have been merged, rather than once per removed cellbox. If any of 
+            the meshes can't be merged, none of them are, and this mesh is left unchanged.
 
-        south_ext_cellboxes = self.get_cellboxes_south_of_bounds(mesh2_bounds)
-        south_int_cellboxes = mesh2.get_bottom_edge_cellboxes()
-        self.tie_southern_cellbox_ng(south_ext_cellboxes, south_int_cellboxes)
+            Args:
+                meshes (iterable<EnvironmentMesh>): the meshes to be merged with this mesh. May be 
+                    a generator, so that only one of the meshes needs to be loaded at a time
 
-        east_ext_cellboxes = self.get_cellboxes_east_of_bounds(mesh2_bounds)
-        east_int_cellboxes = mesh2.get_right_edge_cellboxes()
-        self.tie_eastern_cellbox_ng(east_ext_cellboxes, east_int_cellboxes)
+            Raises:
+                AssertionError: if any of the meshes is not compatible with merging with this mesh
+        """
+        cellbox_index = self.get_cellbox_index()
+        cellbox_id_index = self._get_cellbox_id_index()
 
-        west_ext_cellboxes = self.get_cellboxes_west_of_bounds(mesh2_bounds)
-        west_int_cellboxes = mesh2.get_left_edge_cellboxes()
-        self.tie_western_cellbox_ng(west_ext_cellboxes, west_int_cellboxes)
+        def get_cellboxes_touching_bounds(bounds):
+            """
+                returns the cellboxes currently in the mesh that overlap or touch the given bounds,
+                in the order they will be in agg_cellboxes
+            """
+            if bounds.get_long_min() > bounds.get_long_max():
+                # bounds crossing the antimeridian aren't narrowed down
+                cellboxes = cellbox_index.query_bounds(-90, 90, -180, 180)
+            else:
+                cellboxes = cellbox_index.query_bounds(bounds.get_lat_min(), bounds.get_lat_max(),
+                                                       bounds.get_long_min(), bounds.get_long_max())
+            return cellbox_id_index.sort(cellboxes)
+
+        # object ids of cellboxes removed from this mesh
+        removed_cellboxes = set()
+        merged_cellboxes = []
+
+        # State restored if a mesh can't be merged. Meshes may be a generator, so can't all 
+        # be validated before merging begins
+        merged_configs = list(self.config["merged"]) if "merged" in self.config else None
+        graph_snapshot = {index: {direction: list(neighbours) 
+                                  for direction, neighbours in neighbour_map.items()}
+                          for index, neighbour_map in self.neighbour_graph.get_graph().items()}
+
+        try:
+            for mesh2 in meshes:
+                assert self.validate_merge_compatibility(mesh2), "The given mesh is not compatible with merging with this mesh" 
+
+                # append config files
+                if "merged" not in self.config.keys():
+                    self.config["merged"] = []
+
+                self.config["merged"].append(mesh2.config)
+
+                # merge cellboxes
+                mesh2_bounds = mesh2.bounds
+
+                # remove cellboxes within bounds of mesh2 from this mesh
+                cells_within_bounds = self.get_cellboxes_within_bounds(
+                    mesh2_bounds, get_cellboxes_touching_bounds(mesh2_bounds))
+                for cellbox in cells_within_bounds:
+                    cellbox_index.remove(cellbox)
+                    cellbox_id_index.remove(cellbox)
+                    removed_cellboxes.add(id(cellbox))
+                    self.neighbour_graph.remove_node_and_update_neighbours(cellbox.get_id())
+
+                # Appended cellboxes from mesh2 to this mesh
+                mesh1_max_id = cellbox_id_index.max_id()
+                mesh2.increment_ids(mesh1_max_id + 1)
+                for cellbox in mesh2.agg_cellboxes:
+                    cellbox_index.insert(cellbox)
+                    cellbox_id_index.add(cellbox)
+                    merged_cellboxes.append(cellbox)
+
+                # Appened neighbour graph from mesh2 to this mesh
+                for index in mesh2.neighbour_graph.get_graph().keys():
+                    neighbour_map = mesh2.neighbour_graph.neighbour_graph[index]
+
+                    self.neighbour_graph.add_node(index, neighbour_map)
+
+                # Tie the neighbour graphs of the cellboxes on the boundary between the two meshes
+                boundary_cellboxes = get_cellboxes_touching_bounds(mesh2_bounds)
+
+                north_ext_cellboxes = self.get_cellboxes_north_of_bounds(mesh2_bounds, boundary_cellboxes)
+                north_int_cellboxes = mesh2.get_top_edge_cellboxes()
+                self.tie_northern_cellbox_ng(north_ext_cellboxes, north_int_cellboxes)
+
+                south_ext_cellboxes = self.get_cellboxes_south_of_bounds(mesh2_bounds, boundary_cellboxes)
+                south_int_cellboxes = mesh2.get_bottom_edge_cellboxes()
+                self.tie_southern_cellbox_ng(south_ext_cellboxes, south_int_cellboxes)
+
+                east_ext_cellboxes = self.get_cellboxes_east_of_bounds(mesh2_bounds, boundary_cellboxes)
+                east_int_cellboxes = mesh2.get_right_edge_cellboxes()
+                self.tie_eastern_cellbox_ng(east_ext_cellboxes, east_int_cellboxes)
+
+                west_ext_cellboxes = self.get_cellboxes_west_of_bounds(mesh2_bounds, boundary_cellboxes)
+                west_int_cellboxes = mesh2.get_left_edge_cellboxes()
+                self.tie_western_cellbox_ng(west_ext_cellboxes, west_int_cellboxes)
+        except BaseException:
+            # Leave this mesh as it was before merging. Indexes are rebuilt on next use
+            if merged_configs is None:
+                self.config.pop("merged", None)
+            else:
+                self.config["merged"] = merged_configs
+            self.neighbour_graph.neighbour_graph = graph_snapshot
+            self._cellbox_index = None
+            self._cellbox_id_index = None
+            raise
+        else:
+            # Remove the replaced cellboxes and append the merged cellboxes in a single pass
+            self.agg_cellboxes[:] = [cellbox for cellbox in self.agg_cellboxes 
+                                     if id(cellbox) not in removed_cellboxes] + \
+                                    [cellbox for cellbox in merged_cellboxes 
+                                     if id(cellbox) not in removed_cellboxes]
 
     def validate_merge_compatibility(self, mesh2):
         """
@@ -571,19 +818,41 @@ class EnvironmentMesh:
                         self.neighbour_graph.get_graph()[cellbox_s.get_id()]["-3"].append(neighbour)
 
 
-    def get_cellboxes_within_bounds(self, bounds):
+    def _get_cellboxes_touching_bounds(self, bounds):
+        """
+            returns the cellboxes that overlap or touch the edge of the given bounds, in the 
+            order they are in agg_cellboxes. Used to narrow down the cellboxes searched by the
+            get_cellboxes_*_bounds methods.
+
+            Args:
+                bounds (Boundary): the bounds the cellboxes overlap or touch
+            Returns:
+                AggregatedCellBox[]: the cellboxes overlapping or touching the given bounds
+        """
+        if bounds.get_long_min() > bounds.get_long_max():
+            # bounds crossing the antimeridian aren't narrowed down
+            return self.agg_cellboxes
+        cellboxes = self.get_cellbox_index().query_bounds(bounds.get_lat_min(), bounds.get_lat_max(),
+                                                          bounds.get_long_min(), bounds.get_long_max())
+        return self._get_cellbox_id_index().sort(cellboxes)
+
+    def get_cellboxes_within_bounds(self, bounds, cellboxes=None):
         """
             returns the cellboxes within the given bounds. 
             Only cellboxes that are completely within the given bounds are returned.
 
             Args:
                 bounds (Boundary): the bounds encapsulating the cellboxes to be returned
+                cellboxes (AggregatedCellBox[]) (optional): the cellboxes to search. 
+                    Defaults to the cellboxes in this mesh touching the bounds
             Returns:
                 AggregatedCellBox[]: the cellboxes within the given bounds
         """
+        if cellboxes is None:
+            cellboxes = self._get_cellboxes_touching_bounds(bounds)
         cells_within_bounds = []
         
-        for cellbox in self.agg_cellboxes:
+        for cellbox in cellboxes:
             cb_bounds = cellbox.get_bounds()
 
             if (cb_bounds.get_long_min() >= bounds.get_long_min() and 
@@ -596,7 +865,7 @@ class EnvironmentMesh:
         return cells_within_bounds
 
 
-    def get_cellboxes_north_of_bounds(self, bounds):
+    def get_cellboxes_north_of_bounds(self, bounds, cellboxes=None):
         """
             returns all cellboxes that are directly north of the given bounds.
             Only cellboxes which are touching the north edge of the boundary, 
@@ -604,13 +873,17 @@ class EnvironmentMesh:
 
             Args:
                 bounds (Boundary): the bounds encapsulating the cellboxes to be returned
+                cellboxes (AggregatedCellBox[]) (optional): the cellboxes to search. 
+                    Defaults to the cellboxes in this mesh touching the bounds
             Returns: 
                 north_cellboxes (AggregatedCellBox[]): a list of cellboxes that are directly north of the given bounds
         """
+        if cellboxes is None:
+            cellboxes = self._get_cellboxes_touching_bounds(bounds)
 
         north_cellboxes = []
 
-        for cellbox in self.agg_cellboxes:
+        for cellbox in cellboxes:
             if (cellbox.get_bounds().get_lat_min() == bounds.get_lat_max() and
                 cellbox.get_bounds().get_long_max() >= bounds.get_long_min() and
                 cellbox.get_bounds().get_long_min() <= bounds.get_long_max()):
@@ -619,11 +892,13 @@ class EnvironmentMesh:
             
         return north_cellboxes
 
-    def get_cellboxes_south_of_bounds(self, bounds):
+    def get_cellboxes_south_of_bounds(self, bounds, cellboxes=None):
+        if cellboxes is None:
+            cellboxes = self._get_cellboxes_touching_bounds(bounds)
 
         south_cellboxes = []
 
-        for cellbox in self.agg_cellboxes:
+        for cellbox in cellboxes:
             if (cellbox.get_bounds().get_lat_max() == bounds.get_lat_min() and
                 cellbox.get_bounds().get_long_max() >= bounds.get_long_min() and
                 cellbox.get_bounds().get_long_min() <= bounds.get_long_max()):
@@ -632,11 +907,13 @@ class EnvironmentMesh:
             
         return south_cellboxes
 
-    def get_cellboxes_east_of_bounds(self, bounds):
+    def get_cellboxes_east_of_bounds(self, bounds, cellboxes=None):
+        if cellboxes is None:
+            cellboxes = self._get_cellboxes_touching_bounds(bounds)
 
         east_cellboxes = []
 
-        for cellbox in self.agg_cellboxes:
+        for cellbox in cellboxes:
             if (cellbox.get_bounds().get_long_min() == bounds.get_long_max() and
                 cellbox.get_bounds().get_lat_min() >= bounds.get_lat_min() and
                 cellbox.get_bounds().get_lat_max() <= bounds.get_lat_max()):
@@ -645,11 +922,13 @@ class EnvironmentMesh:
             
         return east_cellboxes
 
-    def get_cellboxes_west_of_bounds(self, bounds):
+    def get_cellboxes_west_of_bounds(self, bounds, cellboxes=None):
+            if cellboxes is None:
+                cellboxes = self._get_cellboxes_touching_bounds(bounds)
             
             west_cellboxes = []
     
-            for cellbox in self.agg_cellboxes:
+            for cellbox in cellboxes:
                 if (cellbox.get_bounds().get_long_max() == bounds.get_long_min() and
                     cellbox.get_bounds().get_lat_min() >= bounds.get_lat_min() and
                     cellbox.get_bounds().get_lat_max() <= bounds.get_lat_max()):
@@ -721,8 +1000,7 @@ class EnvironmentMesh:
                 bounds (Boundary): the bounds encapsulating the cellboxes to be removed
         """
         cells_within_bounds = self.get_cellboxes_within_bounds(bounds)
-        for cellbox in cells_within_bounds:
-            self.remove_cellbox(cellbox)
+        self.remove_cellboxes(cells_within_bounds)
   
     def get_max_cellbox_id(self):
         """
@@ -731,11 +1009,7 @@ class EnvironmentMesh:
             Returns:
                 int: the maximum cellbox id
         """
-        max_id = 0
-        for cellbox in self.agg_cellboxes:
-            if int(cellbox.get_id()) > max_id:
-                max_id = int(cellbox.get_id())
-        return max_id
+        return self._get_cellbox_id_index().max_id()
 
     def remove_cellbox(self, cellbox):
         """
@@ -744,21 +1018,80 @@ class EnvironmentMesh:
             Args:
                 cellbox (AggregatedCellBox): the cellbox to be removed
         """
-        self.agg_cellboxes.remove(cellbox)
+        self._remove_agg_cellbox(cellbox)
 
         self.neighbour_graph.remove_node_and_update_neighbours(cellbox.get_id())
 
+    def remove_cellboxes(self, cellboxes):
+        """
+            removes the given cellboxes from the mesh, in a single pass over agg_cellboxes
+
+            Args:
+                cellboxes (AggregatedCellBox[]): the cellboxes to be removed
+        """
+        for cellbox in self._remove_agg_cellboxes(cellboxes):
+            self.neighbour_graph.remove_node_and_update_neighbours(cellbox.get_id())
+
+    def _remove_agg_cellboxes(self, cellboxes):
+        """
+            removes the cellboxes with the same ids as the given cellboxes from agg_cellboxes 
+            and the indexes of them, in a single pass, without updating the neighbour graph
+
+            Args:
+                cellboxes (AggregatedCellBox[]): the cellboxes to be removed
+            Returns:
+                removed_cellboxes (AggregatedCellBox[]): the cellboxes removed from agg_cellboxes
+        """
+        cellbox_id_index = self._get_cellbox_id_index()
+        removed_cellboxes = {}
+        for cellbox in cellboxes:
+            mesh_cellbox = cellbox_id_index.get(cellbox.get_id())
+            if mesh_cellbox is None:
+                raise ValueError(f'Cellbox {cellbox.get_id()} is not in the mesh')
+            removed_cellboxes[id(mesh_cellbox)] = mesh_cellbox
+
+        self.agg_cellboxes[:] = [cellbox for cellbox in self.agg_cellboxes 
+                                 if id(cellbox) not in removed_cellboxes]
+        for cellbox in removed_cellboxes.values():
+            cellbox_id_index.remove(cellbox)
+            if self._cellbox_index is not None:
+                self._cellbox_index.remove(cellbox)
+        return list(removed_cellboxes.values())
+
+    def _remove_agg_cellbox(self, cellbox):
+        """
+            removes the cellbox with the same id as the given cellbox from agg_cellboxes 
+            and the indexes of them, without updating the neighbour graph
+
+            Args:
+                cellbox (AggregatedCellBox): the cellbox to be removed
+        """
+        cellbox_id_index = self._get_cellbox_id_index()
+        mesh_cellbox = cellbox_id_index.get(cellbox.get_id())
+        if mesh_cellbox is None:
+            raise ValueError(f'Cellbox {cellbox.get_id()} is not in the mesh')
+        removed_cellbox = self.agg_cellboxes.pop(cellbox_id_index.position(mesh_cellbox))
+        cellbox_id_index.remove(removed_cellbox)
+        if self._cellbox_index is not None:
+            self._cellbox_index.remove(removed_cellbox)
+
     def add_cellbox(self, cellbox):
         """
             adds the given cellbox to the mesh
         """
         self.agg_cellboxes.append(cellbox)
+        if self._cellbox_index is not None:
+            self._cellbox_index.insert(cellbox)
+        if self._cellbox_id_index is not None:
+            self._cellbox_id_index.add(cellbox)
 
     def increment_ids(self, increment):
 
         for cellbox in self.agg_cellboxes:
             cellbox.set_id(str(int(cellbox.get_id()) + increment))
             cellbox.agg_data['id'] = str(int(cellbox.get_id()) + increment)
+        # ids have all changed, so the index by id is rebuilt on next use
+        self._cellbox_id_index = None
 
         self.neighbour_graph.increment_ids(increment)
         
@@ -803,12 +1136,14 @@ class EnvironmentMesh:
 
             Args:
                 cellbox_id (string): the id of the cellbox to be split
+            Returns:
+                split_cellboxes (list<AggregatedCellBox>): the new cellboxes that replaced the split cellbox
         """
         
         # Create new cellboxes and append to agg_cellboxes
         split_cellboxes = self.sim_split_cellbox(cellbox_id)
         for cellbox in split_cellboxes:
-            self.agg_cellboxes.append(cellbox)
+            self.add_cellbox(cellbox)
 
         # get ID's of new cellboxes
         north_west_index = int(split_cellboxes[1].get_agg_data()['id'])
@@ -969,9 +1304,112 @@ class EnvironmentMesh:
 
         # remove original cellbox from mesh.
         cellbox = self.get_cellbox(cellbox_id)
-        self.agg_cellboxes.remove(cellbox)
+        self._remove_agg_cellbox(cellbox)
         self.neighbour_graph.remove_node(cellbox_id)
 
+        return split_cellboxes
+
+    def split_and_replace_many(self, cellbox_ids):
+        """
+            splits the cellboxes with the given ids and replaces them with the new cellboxes. The neighbour 
+            graph is updated once for all of the split cellboxes, rather than after each split, and is the 
+            same as if each cellbox had been split in turn with split_and_replace.
+
+            The neighbour map of each new cellbox is found from those of its split cellbox, with any 
+            neighbours that were also split replaced by the new cellboxes that touch it. As in 
+            split_and_replace, corner neighbours are carried over from the split cellbox, and side 
+            neighbours are placed by their bounds.
+
+            Args:
+                cellbox_ids (list<string>): the ids of the cellboxes to be split
+            Returns:
+                split_cellboxes (dict<string, list<AggregatedCellBox>>): the new cellboxes that replaced 
+                    each split cellbox, in the order [south west, north west, south east, north east]
+        """
+        # Position of each new cellbox in the list returned by sim_split_cellbox
+        south_west, north_west, south_east, north_east = 0, 1, 2, 3
+        # Corner of the split cellbox that each new cellbox is in, and the sides it is on
+        corners = {south_west: "-1", north_west: "-3", south_east: "3", north_east: "1"}
+        sides = {south_west: ["4", "-2"], north_west: ["-4", "-2"],
+                 south_east: ["4", "2"], north_east: ["-4", "2"]}
+        # New cellbox in each corner of a split cellbox
+        corner_positions = {corner: position for position, corner in corners.items()}
+
+        graph = self.neighbour_graph.get_graph()
+        get_case = self.neighbour_graph.get_neighbour_case_bounds
+
+        # Create new cellboxes and append to agg_cellboxes
+        split_cellboxes = {}
+        for cellbox_id in cellbox_ids:
+            split_cellboxes[str(cellbox_id)] = self.sim_split_cellbox(cellbox_id)
+            for cellbox in split_cellboxes[str(cellbox_id)]:
+                self.add_cellbox(cellbox)
+        bounds = lambda indx: self.get_cellbox(indx).get_bounds()
+
+        def replace(indx):
+            # Neighbours of a split cellbox that are in the mesh once all are split
+            if str(indx) in split_cellboxes:
+                return [int(cellbox.get_id()) for cellbox in split_cellboxes[str(indx)]]
+            return [indx]
+
+        # ================== Create Neighbour Maps ==================
+        new_neighbour_maps = {}
+        for cellbox_id, new_cellboxes in split_cellboxes.items():
+            sw_index, nw_index, se_index, ne_index = [int(cellbox.get_id()) for cellbox in new_cellboxes]
+            # Neighbours of each new cellbox within the split cellbox
+            internal_maps = {south_west: {"1": [ne_index], "2": [se_index], "-4": [nw_index]},
+                             north_west: {"2": [ne_index], "3": [se_index], "4": [sw_index]},
+                             north_east: {"4": [se_index], "-1": [sw_index], "-2": [nw_index]},
+                             south_east: {"-2": [sw_index], "-3": [nw_index], "-4": [ne_index]}}
+            for position, cellbox in enumerate(new_cellboxes):
+                neighbour_map = {direction: list(internal_maps[position].get(direction, []))
+                                 for direction in ["1", "2", "3", "4", "-1", "-2", "-3", "-4"]}
+                # Corner neighbour of split cellbox, or the new cellbox in its opposite corner if it was split too
+                corner = corners[position]
+                for indx in graph[cellbox_id][corner]:
+                    if str(indx) in split_cellboxes:
+                        opposite_position = corner_positions[str(-int(corner))]
+                        indx = int(split_cellboxes[str(indx)][opposite_position].get_id())
+                    neighbour_map[corner].append(indx)
+                # Side neighbours of split cellbox, placed by their bounds
+                cellbox_bounds = cellbox.get_bounds()
+                for side in sides[position]:
+                    for indx in graph[cellbox_id][side]:
+                        for neighbour_indx in replace(indx):
+                            crossing_case = get_case(cellbox_bounds, bounds(neighbour_indx))
+                            if crossing_case != 0:
+                                neighbour_map[str(crossing_case)].append(neighbour_indx)
+                new_neighbour_maps[cellbox.get_id()] = neighbour_map
+
+        # ================== Update Neighbours of split cellboxes ==================
+        # Neighbours that were split too have new neighbour maps already
+        for cellbox_id, new_cellboxes in split_cellboxes.items():
+            new_indices = [int(cellbox.get_id()) for cellbox in new_cellboxes]
+            for corner, position in corner_positions.items():
+                corner_index = graph[cellbox_id][corner]
+                if len(corner_index) > 0 and str(corner_index[0]) not in split_cellboxes:
+                    self.neighbour_graph.update_neighbour(str(corner_index[0]), str(-int(corner)),
+                                                          [new_indices[position]])
+            for side in ["-4", "4", "2", "-2"]:
+                for indx in graph[cellbox_id][side]:
+                    if str(indx) in split_cellboxes:
+                        continue
+                    graph[str(indx)][str(-int(side))].remove(int(cellbox_id))
+                    neighbour_bounds = bounds(indx)
+                    for new_cellbox, new_index in zip(new_cellboxes, new_indices):
+                        crossing_case = get_case(neighbour_bounds, new_cellbox.get_bounds())
+                        if crossing_case != 0:
+                            self.neighbour_graph.add_neighbour(str(indx), str(crossing_case), new_index)
+
+        # remove split cellboxes from mesh
+        self._remove_agg_cellboxes([self.get_cellbox(cellbox_id) for cellbox_id in split_cellboxes])
+        for cellbox_id in split_cellboxes:
+            self.neighbour_graph.remove_node(cellbox_id)
+        for index, neighbour_map in new_neighbour_maps.items():
+            self.neighbour_graph.add_node(str(index), neighbour_map)
+
+        return split_cellboxes
+
     def fill_se_neighbour_map(self, se_neighbour_map, se_neighbour_id, south_neighbour_index, east_neighbour_indx):
         """
             fills the south east neighbour map with the given values
@@ -1109,6 +1547,21 @@ class EnvironmentMesh:
 
 
         return json.loads(json.dumps(output, indent=4))
+
+    def write_json(self, fp, indent=4):
+        """
+            Writes this Mesh to a file handle in the JSON format returned by to_json(), 
+            converting one cellbox at a time rather than building the whole JSON 
+            object in memory first.
+
+            Args:
+                fp (file object): text file handle to write the mesh to
+                indent (int or None): number of spaces to indent each level of the JSON with. 
+                    If None, the JSON is written compactly without any whitespace
+        """
+        cellboxes = (cellbox.to_json() for cellbox in self.agg_cellboxes)
+        write_mesh_json(fp, {'mesh_info': self.config}, cellboxes, 
+                        self.neighbour_graph.get_graph(), indent=indent)
     
     def to_shapely(self):
 
@@ -1211,7 +1664,7 @@ class EnvironmentMesh:
                                  ],\n
                                 "projection": "3031",\n
                             }\n
-                            Where data_name (string) is the name of the mesh data that will be included in the tif image (ex. SIC, elevation), if it is a vector data (e.g. fuel) then the vector mean is calculated for each pixel,
+                            Where data_name (string or [string]) is the name of the mesh data that will be included in the tif image (ex. SIC, elevation), if it is a vector data (e.g. fuel) then the vector mean is calculated for each pixel. If a list of names is given, each is written to a separate band of the image, and the image is not coloured,
                             sampling_resolution ([int]) is a 2d array that represents the sampling resolution the geotiff will be generated at (how many pixels in the final image),
                             projection (int) is an int representing the ESPG sampling projection used to create the geotiff image  (default is 4326),
                             and colour_conf (string) contains the path to color config file, which is a text-based file containing the association between data_name values and colors. It contains 4 columns per line: the data_name value and the corresponding red, green, blue value between 0 and 255, an example format where values range from 0 to 100 is -\n
@@ -1222,59 +1675,21 @@ class EnvironmentMesh:
                                     100 250 250 250  \n
                     path (string): the path to save the generated tif image.\n
         """
-        def generate_samples():
+        def get_pixel_centres(extent, nlines, ncols):
             """
-                generates uniform lat, long samples covering the image resolution space.\n
+                finds the lat, long of the centre of each row and column of pixels in the image.\n
 
                 Returns:
-                    samples([[lat,long],..]): an array of samples, each item in the array is a 2d array that contains each sample lat and long.\n
+                    lats ([float]): the latitude of the centre of each row of pixels, from the top row down.\n
+                    longs ([float]): the longitude of the centre of each column of pixels, from the left column.\n
 
             """
-            mesh_height = self.bounds.get_lat_max() - self.bounds.get_lat_min()
-            mesh_width = self.bounds.get_long_max() - self.bounds.get_long_min()
-            pixel_height = mesh_height / ncols
-            pixel_width = mesh_width / nlines
-            samples = []
+            resx = (extent[2] - extent[0]) / ncols
+            resy = (extent[3] - extent[1]) / nlines
             # has to move in this direction as we start rendering from the upper left pixel
-            for lat in np.arange(self.bounds.get_lat_max(), self.bounds.get_lat_min(), -1*pixel_height):
-                for long in np.arange(self.bounds.get_long_min(), self.bounds.get_long_max(), pixel_width):
-                    pixel_lat = lat - 0.5 * pixel_height   # centeralize the pixel lat value
-                    pixel_long = long + 0.5*pixel_width   # centeralize the pixel long value
-                    samples = np.append(samples, pixel_lat)
-                    samples = np.append(samples, pixel_long)
-            # shape the samples in 2d array (each entry in the array holds sample lat and long
-            samples = np.reshape(samples, (nlines * ncols, 2))
-            return samples
-
-        def get_sample_value(sample):
-            """
-                finds the aggregated cellbox that contains the sample lat and long and returns the value within.\n
-
-                Args:
-                    sample ([lat,long]): an array conatins the sample latitude and longtitude
-                Returns:
-                    the aggregated value of 'data_name'(specified in to_tif params) 
-
-             """
-            lat = sample[0]
-            long = sample[1]
-            value = np.nan
-            for agg_cellbox in self.agg_cellboxes:
-                if agg_cellbox.contains_point(lat, long):
-                    # get the agg_value
-                    try:
-                        value = agg_cellbox.agg_data[data_name]
-                    except KeyError:
-                        logging.debug(f'{data_name} not found in cellbox!')
-                        value = np.nan
-                        
-                    if isinstance(value, collections.abc.Sequence): # if it is a vector then take the mean
-                        value = np.mean (value)
-                        if value == float('inf') : # repalce inf with nan
-                            value = np.nan
-                    # break to make sure we avoid getting multiple values (for lat and long on the bounds of multiple cellboxes)
-                    break
-            return value
+            lats = extent[3] - (np.arange(nlines) + 0.5) * resy
+            longs = extent[0] + (np.arange(ncols) + 0.5) * resx
+            return lats, longs
 
         def get_geo_transform(extent, nlines, ncols):
             """
@@ -1369,21 +1784,15 @@ class EnvironmentMesh:
             cmd = "gdaldem color-relief " + input_file \
                 + ' ' + color_file + ' ' + input_file
             subprocess.check_call(cmd, shell=True)
-            # remove additional files created while generating the tif
-            file_path = os.path.abspath(input_file)
-            dir_path = os.path.split(file_path)[0]
-            additional_files = ["grid_data" , "grid_data.aux.xml"]
-            for file in additional_files: 
-                file_path = Path(dir_path +"/"+ file)
-                if os.path.isfile (file_path):
-                     os.remove(file_path)
 
         # Only import if we need GDAL, to avoid having it as a requirement
         from osgeo import gdal, ogr, osr
         
         params = {}
         params = load_params(params_file)
-        data_name = params["data_name"]
+        data_names = params["data_name"]
+        if isinstance(data_names, str):
+            data_names = [data_names]
         DEFAULT_PROJ = 4326
 
         # Get image dimensions
@@ -1395,29 +1804,31 @@ class EnvironmentMesh:
         ), self.bounds.get_long_max(), self.bounds.get_lat_max()]
 
         logging.info("Generating the tif image ...")
-        samples = generate_samples()
-        # create raster band and populate with sampled data of image_size (sampling_resolution)
-        driver = gdal.GetDriverByName('GTiff')
-        # reading the samples value
-        data = []
-        data = np.reshape(np.asarray([get_sample_value(
-            sample) for sample in samples], dtype=np.float32), (nlines, ncols))
-        # create a temp grid
-        grid_data = driver.Create(
-            'grid_data', ncols, nlines, 1, gdal.GDT_Float32)
+        # find the cellbox at the centre of each pixel once, then read each band from it
+        lats, longs = get_pixel_centres(extent, nlines, ncols)
+        positions = rasterise_cellboxes(self.agg_cellboxes, lats, longs)
+        data = [np.asarray(self._get_cellbox_values(positions, data_name), dtype=np.float32)
+                for data_name in data_names]
+        # create the raster in memory, with a band per data_name
+        grid_data = gdal.GetDriverByName('MEM').Create(
+            '', ncols, nlines, len(data_names), gdal.GDT_Float32)
         # setup geo-transform
         grid_data.SetGeoTransform(get_geo_transform(extent, nlines, ncols))
         # Write data
         srs = osr.SpatialReference()
         srs.ImportFromEPSG(DEFAULT_PROJ)
         grid_data.SetProjection(srs.ExportToWkt())
-        grid_data.GetRasterBand(1).WriteArray(data)
-    
+        for i, data_name in enumerate(data_names):
+            band = grid_data.GetRasterBand(i + 1)
+            band.SetDescription(data_name)
+            band.WriteArray(data[i])
 
         # Save the file
-        driver.CreateCopy(path, grid_data, 0)
+        gdal.GetDriverByName('GTiff').CreateCopy(str(path), grid_data, 0)
         transform_proj(path, params, DEFAULT_PROJ)
-        set_colour(data, path, params)
+        # a colour relief replaces the data values, so is only applied to single band images
+        if len(data_names) == 1:
+            set_colour(data[0], path, params)
         logging.info(f'Generated GeoTIFF: {path}')
 
     def cellboxes_to_json(self):
@@ -1466,7 +1877,7 @@ class EnvironmentMesh:
         else:
             raise ValueError('Invalid cellbox index')
 
-    def save(self, path, format="JSON", format_params=None):
+    def save(self, path, format="JSON", format_params=None, compact=False, compression='infer'):
         """
             Saves this object to a location in local storage in a specific format. 
 
@@ -1476,7 +1887,13 @@ class EnvironmentMesh:
                     If not format is given, default is JSON.
                     Supported formats are\n
                         - JSON \n
-                        - GEOJSON
+                        - GEOJSON \n
+                        - BINARY (columnar binary mesh, loaded with load_from_binary)
+                compact (bool) (optional): If True, JSON is written without any 
+                    whitespace. Default is False, indenting JSON by 4 spaces.
+                compression (String) (optional): Compression of JSON output, 
+                    either 'gzip', 'zstd' or None. Default is to infer it from the 
+                    file extension of path (.gz or .zst).
         """
 
         logging.info(f"Saving mesh in {format} format to {path}")
@@ -1484,9 +1901,12 @@ class EnvironmentMesh:
             self.to_tif(format_params, path)
 
         elif format.upper() == "JSON":
-            with open(path, 'w') as path:
-                json.dump(self.to_json(), path, indent=4)
+            with open_mesh_file(path, 'w', compression=compression) as fp:
+                self.write_json(fp, indent=None if compact else 4)
            
+        elif format.upper() == "BINARY":
+            write_binary_mesh(path, self)
+
         elif format.upper() == "GEOJSON":
             with open(path, 'w') as path:
                 json.dump(self.to_geojson(format_params), path, indent=4)
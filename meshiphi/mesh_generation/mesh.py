@@ -11,7 +11,12 @@ from meshiphi.mesh_generation.cellbox import CellBox
 class Mesh:
     """
         Attributes:
-            cellboxes (list<(CellBox)>): A list of CellBox objects forming the Mesh
+            cellboxes (list<(CellBox)>): A list of CellBox objects forming the Mesh.
+                Entries are indexed by cellbox id, with None left in place of any
+                cellbox that has been split and replaced by its children. The list
+                is backed by an id index and a parent-children (quadtree) map so
+                that cellbox lookups, splits and leaf iteration do not need to
+                scan the list.
 
             neighbour_graph (NeighbourGraph): A graphical representation of the adjacency
                 relationship between CellBoxes in the Mesh. The neighbour_graph object conatin a dict
@@ -49,11 +54,103 @@ class Mesh:
                 relationship between CellBoxes in the Mesh \n      
         """
         self.boundary = boundary
+        self._children = {}
         self.cellboxes = cellboxes
         self.neighbour_graph = neighbour_graph
         self.max_split_depth = max_split_depth
         self.config = {}
 
+    @property
+    def cellboxes(self):
+        """
+            list view of the cellboxes in the Mesh, indexed by cellbox id
+        """
+        return self._cellboxes
+
+    @cellboxes.setter
+    def cellboxes(self, cellboxes):
+        self._cellboxes = cellboxes
+        self._reindex()
+
+    def _reindex(self):
+        """
+            rebuilds the id index and the set of leaf cellboxes from the cellbox list.
+            Parent-children links are kept for the ids that are still present.
+        """
+        self._index = {}
+        self._leaves = {}
+        for indx, cellbox in enumerate(self._cellboxes):
+            if isinstance(cellbox, CellBox):
+                self._index[cellbox.get_id()] = indx
+                self._leaves[indx] = None
+        self._children = {indx: children for indx, children in self._children.items()
+                          if indx < len(self._cellboxes)}
+
+    # Functions for navigating the cellbox quadtree
+
+    def get_cellbox_index(self, cellbox):
+        """
+            returns the position of a given cellbox within the cellbox list
+            without scanning the list.
+
+            Args:
+                cellbox (CellBox): a cellbox contained within the Mesh
+
+            Returns:
+                int: the index of the cellbox in the cellbox list
+        """
+        indx = self._index.get(cellbox.get_id())
+        if indx is None or indx >= len(self._cellboxes) or self._cellboxes[indx] is not cellbox:
+            # list has been modified directly, so rebuild the index from it
+            self._reindex()
+            indx = self._index.get(cellbox.get_id())
+            if indx is None or self._cellboxes[indx] is not cellbox:
+                raise ValueError(f'Mesh: cellbox {cellbox.get_id()} is not contained in the mesh')
+        return indx
+
+    def replace_cellbox(self, cellbox, split_cellboxes):
+        """
+            replaces a cellbox in the Mesh with the cellboxes produced by splitting it.
+            The split cellboxes are appended to the cellbox list, the original cellbox
+            is set to None and the parent-children link between them is recorded.
+
+            Args:
+                cellbox (CellBox): the cellbox that has been split
+                split_cellboxes (list<CellBox>): the cellboxes produced by splitting
+
+            Returns:
+                (int, list<int>): the index of the replaced cellbox and the indices
+                    of the split cellboxes, in the same order as split_cellboxes
+        """
+        cellbox_indx = self.get_cellbox_index(cellbox)
+        split_indices = []
+        for split_cellbox in split_cellboxes:
+            indx = len(self._cellboxes)
+            self._cellboxes.append(split_cellbox)
+            self._index[split_cellbox.get_id()] = indx
+            self._leaves[indx] = None
+            split_indices.append(indx)
+
+        self._children[cellbox_indx] = split_indices
+        self._leaves.pop(cellbox_indx, None)
+        self._index.pop(cellbox.get_id(), None)
+        self._cellboxes[cellbox_indx] = None
+        return cellbox_indx, split_indices
+
+    def get_children(self, cellbox_indx):
+        """
+            returns the indices of the cellboxes produced by splitting the cellbox
+            at a given index, or an empty list if it has not been split
+        """
+        return self._children.get(cellbox_indx, [])
+
+    def get_leaf_cellboxes(self):
+        """
+            returns the cellboxes that have not been split, in the order they
+            appear in the cellbox list
+        """
+        return [self._cellboxes[indx] for indx in self._leaves]
+
     # Functions for adding data to the Mesh
 
     def add_data_points(self, data_points):
@@ -112,17 +209,8 @@ class Mesh:
                         "value_n": (float) ... \n
                     }
         """
-        return_cellboxes = []
-        for cellbox in self.cellboxes:
-            if isinstance(cellbox, CellBox): #checking to filter out the cellbox that was splitted and replaced
-
-                # Get json for CellBox
-                #cell = cellbox.to_json()
-                # Append ID to CellBox
-                #cell['id'] = str(self.cellboxes.index(cellbox))
-
-                return_cellboxes.append(cellbox)
-        return return_cellboxes
+        # leaves filter out the cellboxes that were splitted and replaced
+        return self.get_leaf_cellboxes()
 
     def get_cellbox(self, long, lat):
         """
@@ -137,10 +225,9 @@ class Mesh:
                 (long, lat)
         """
         selected_cell = []
-        for cellbox in self.cellboxes:
-            if isinstance(cellbox, CellBox):
-                if cellbox.contains_point(lat, long):
-                    selected_cell.append(cellbox)
+        for cellbox in self.get_leaf_cellboxes():
+            if cellbox.contains_point(lat, long):
+                selected_cell.append(cellbox)
         return selected_cell[0]
 
     def get_bounds(self): 
@@ -18,8 +18,12 @@ Example:
 
 import logging
 import math
+import multiprocessing
+import threading
 import numpy as np
 
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
 from tqdm import tqdm
 
 from meshiphi.mesh_generation.boundary import Boundary
@@ -32,7 +36,62 @@ from meshiphi.mesh_generation.mesh import Mesh
 from meshiphi.dataloaders.factory import DataLoaderFactory
 from meshiphi.config_validation.config_validator import validate_mesh_config
 
-from meshiphi.utils import longitude_distance, longitude_domain
+from meshiphi.utils import longitude_domain
+
+
+# Cellboxes being aggregated by a pool of worker processes. Set before the
+# pool is started so that forked workers inherit the cellboxes (and the data
+# they reference) instead of each cellbox being pickled and sent to them.
+_AGGREGATION_CELLBOXES = []
+
+def _aggregate_cellbox_chunk(chunk):
+    """
+        aggregates a chunk of the cellboxes in _AGGREGATION_CELLBOXES within a worker process
+
+        Args:
+            chunk (tuple<int>): start and stop indices of the cellboxes to aggregate
+
+        Returns:
+            list<AggregatedCellBox>: the aggregated cellboxes, in order
+    """
+    start, stop = chunk
+    return [cellbox.aggregate() for cellbox in _AGGREGATION_CELLBOXES[start:stop]]
+
+
+class _TaskLogBuffer(logging.Filter):
+    """
+        Filter for the root logger which holds back the log records emitted by
+        tasks running in worker threads, so that the records of each task can be
+        logged together once it completes, rather than interleaved with the
+        records of other tasks
+    """
+    def __init__(self):
+        super().__init__()
+        self._local = threading.local()
+
+    def filter(self, record):
+        records = getattr(self._local, 'records', None)
+        if records is None:
+            return True
+        records.append(record)
+        return False
+
+    def run(self, func, *args):
+        """
+            runs func(*args), holding back any records logged while it runs
+
+            Returns:
+                (object, list<logging.LogRecord>, Exception):
+                    the result of func, the records it logged, and the exception
+                    it raised, or None if it completed
+        """
+        records = self._local.records = []
+        try:
+            return func(*args), records, None
+        except Exception as err:
+            return None, records, err
+        finally:
+            self._local.records = None
 
 
 class MeshBuilder:
@@ -69,7 +128,13 @@ class MeshBuilder:
                         ],\n
                         "splitting": { \n
                             "split_depth": (int),\n
-                            "minimum_datapoints": (int)\n
+                            "minimum_datapoints": (int),\n
+                            "split_mode": (string) 'depth_first' or 'breadth_first' (optional)\n
+                            },\n
+                        "parallel": { (optional)\n
+                            "dataloader_workers": (int),\n
+                            "aggregation_workers": (int),\n
+                            "pool": (string) 'process' or 'thread'\n
                             }\n
                         }
                    
@@ -108,6 +173,7 @@ class MeshBuilder:
         if 'splitting' in self.config:
             min_datapoints = self.config['splitting']['minimum_datapoints']
         meta_data_list = self.initialize_meta_data(bounds, min_datapoints)
+        self.meta_data_list = meta_data_list
 
         # Initialise the metadata for each cellbox, including subsets of each
         # dataloader's data set
@@ -138,7 +204,7 @@ class MeshBuilder:
                          self.neighbour_graph, max_split_depth)
         self.mesh.set_config(config)
 
-    def initialize_meta_data(self, bounds, min_datapoints):
+    def initialize_meta_data(self, bounds, min_datapoints, workers=None):
         '''
         Creates a metadata object which holds information about the data sources
         within a cellbox. 
@@ -150,36 +216,69 @@ class MeshBuilder:
             min_datapoints (int):
                 Minimum number of datapoints each dataloader is allowed to 
                 aggregate 
+
+            workers (int):
+                Number of threads to create the dataloaders with. Defaults to
+                'dataloader_workers' in the 'parallel' section of the config,
+                or 1 (serial) if not set.
         Returns:
             list(Metadata):
-                Array of metadata objects; one for each data source
+                Array of metadata objects; one for each data source, in the
+                order they are listed in the config
         '''
+        data_sources = self.config.get('data_sources', [])
+        if workers is None:
+            workers = self.config.get('parallel', {}).get('dataloader_workers', 1)
+
+        def create_loader(data_source):
+            logging.debug("Creating data loader {}".format(
+                data_source['loader']))
+            return DataLoaderFactory.get_dataloader(
+                data_source['loader'], bounds, data_source['params'], min_datapoints)
+
+        if workers > 1 and len(data_sources) > 1:
+            # Loaders spend most of their time reading files, so are created in
+            # threads. Records logged by each loader are held back until it has
+            # been created, then logged in the order of the data sources
+            logging.info(f"Creating {len(data_sources)} data loaders with {workers} threads")
+            log_buffer = _TaskLogBuffer()
+            root_logger = logging.getLogger()
+            root_logger.addFilter(log_buffer)
+            loaders = []
+            try:
+                with ThreadPoolExecutor(max_workers=workers) as executor:
+                    results = executor.map(lambda data_source: log_buffer.run(create_loader, data_source),
+                                           data_sources)
+                    for loader, records, err in results:
+                        for record in records:
+                            logging.getLogger(record.name).handle(record)
+                        if err is not None:
+                            raise err
+                        loaders.append(loader)
+            finally:
+                root_logger.removeFilter(log_buffer)
+        else:
+            loaders = [create_loader(data_source) for data_source in data_sources]
+
         meta_data_list = []
         splitting_conds = []
-        if 'data_sources' in self.config.keys():
-            for data_source in self.config['data_sources']:
-                loader_name = data_source['loader']
-                loader = DataLoaderFactory.get_dataloader(
-                    loader_name, bounds, data_source['params'], min_datapoints)
-
-                logging.debug("Creating data loader {}".format(
-                    data_source['loader']))
-                updated_splitting_cond = []  # create this list to get rid of the data_name in the conditions as it is not handeled by the DataLoader, remove after talking to Harry to address this in the loader
-                if 'splitting_conditions' in data_source['params']:
-                    splitting_conds = data_source['params']['splitting_conditions']
-                    for split_cond in splitting_conds:
-                        cond = split_cond[loader.data_name]
-                        updated_splitting_cond.append(cond)
-
-                value_fill_type = self.check_value_fill_type(data_source)
-
-                # Update list of files in config to match the ones read in by dataloader
-                if 'files' in data_source['params']:
-                    data_source['params']['files'] = loader.files
-
-                meta_data_obj = Metadata(
-                    loader, updated_splitting_cond,  value_fill_type, loader.data)
-                meta_data_list.append(meta_data_obj)
+        for data_source, loader in zip(data_sources, loaders):
+            updated_splitting_cond = []  # create this list to get rid of the data_name in the conditions as it is not handeled by the DataLoader, remove after talking to Harry to address this in the loader
+            if 'splitting_conditions' in data_source['params']:
+                splitting_conds = data_source['params']['splitting_conditions']
+                for split_cond in splitting_conds:
+                    cond = split_cond[loader.data_name]
+                    updated_splitting_cond.append(cond)
+
+            value_fill_type = self.check_value_fill_type(data_source)
+
+            # Update list of files in config to match the ones read in by dataloader
+            if 'files' in data_source['params']:
+                data_source['params']['files'] = loader.files
+
+            meta_data_obj = Metadata(
+                loader, updated_splitting_cond,  value_fill_type, loader.data)
+            meta_data_list.append(meta_data_obj)
 
         return meta_data_list
         
@@ -236,17 +335,21 @@ class MeshBuilder:
 
 
     def initialize_cellboxes(self, bounds, cell_width, cell_height):
-        cellboxes = []
-        grid_height = (bounds.get_lat_max() -
-                       bounds.get_lat_min()) / cell_height
-        
-        lat_range = np.arange(bounds.get_lat_min(), bounds.get_lat_max(), cell_height)
+        """
+            Creates the initial uniform grid of cellboxes covering the mesh bounds, 
+            ordered row by row from the south west corner. Cellbox ids are their 
+            index in the grid.
 
+            Args:
+                bounds (Boundary): Outer boundary of the mesh being created
+                cell_width (float): Width of each cellbox in degrees longitude
+                cell_height (float): Height of each cellbox in degrees latitude
+
+            Returns:
+                list<CellBox>: the cellboxes forming the initial grid
+        """
+        lat_range = np.arange(bounds.get_lat_min(), bounds.get_lat_max(), cell_height)
 
-        # Account for going over the antimeridian with longitude_distance
-        grid_width = longitude_distance(bounds.get_long_min(), 
-                                        bounds.get_long_max()) / cell_width
-        
         if bounds.get_long_min() < bounds.get_long_max():
             long_range = np.arange(bounds.get_long_min(),
                                    bounds.get_long_max(), 
@@ -258,17 +361,21 @@ class MeshBuilder:
         # Cast to within -180:180
         long_range = longitude_domain(long_range)
 
-        for lat in lat_range:
-            for long in long_range:
-                cell_lat_range = [lat, lat+cell_height]
-                # If doesn't go over anti-meridian
-                if long + cell_width <= 180: cell_long_range = [long, long+cell_width]
-                else:                        cell_long_range = [long, long+cell_width-360]
-                cell_bounds = Boundary(
-                    cell_lat_range, cell_long_range, bounds.get_time_range())
-                cell_id = str(len(cellboxes))
-                cellbox = CellBox(cell_bounds, cell_id)
-                cellboxes.append(cellbox)
+        # Corners of every cellbox in the grid, one row of longitudes per latitude
+        lat_mins, long_mins = np.meshgrid(lat_range, long_range, indexing='ij')
+        lat_mins = lat_mins.ravel()
+        long_mins = long_mins.ravel()
+        lat_maxs = lat_mins + cell_height
+        long_maxs = long_mins + cell_width
+        # Account for cellboxes going over the anti-meridian
+        long_maxs = np.where(long_maxs <= 180, long_maxs, long_maxs - 360)
+
+        time_range = bounds.get_time_range()
+        cellboxes = [CellBox(Boundary([lat_min, lat_max], [long_min, long_max], time_range),
+                             str(cell_id))
+                     for cell_id, (lat_min, lat_max, long_min, long_max) in 
+                        enumerate(zip(lat_mins.tolist(), lat_maxs.tolist(), 
+                                      long_mins.tolist(), long_maxs.tolist()))]
         return cellboxes
     
     def add_dataloader(self, Dataloader, params, bounds=None, name='myDataLoader', min_dp = 5):
@@ -340,19 +447,21 @@ class MeshBuilder:
         if bounds.get_long_max()== abs (bounds.get_long_min()) == 180: # check if it is a global mesh
             is_global_mesh = True
             # find indeces of cellboxes at the min longtitude and max longtitude 
-            min_long_cellboxes = cellboxes [::grid_width]
-            max_long_cellboxes = cellboxes [grid_width-1::grid_width]
+            # (ids of the initial cellboxes are their index in the grid)
+            min_long_indx = np.arange(0, len(cellboxes), grid_width).tolist()
+            max_long_indx = np.arange(grid_width-1, len(cellboxes), grid_width).tolist()
+            num_rows = len(min_long_indx)
             # update NG to connect cellboxes
-            for i in range (0 , len(min_long_cellboxes)): 
-                    self.neighbour_graph.add_neighbour (int (min_long_cellboxes[i].get_id()) , Direction.west, int (max_long_cellboxes[i].get_id()))
-                    self.neighbour_graph.add_neighbour (int (max_long_cellboxes[i].get_id()) , Direction.east , int (min_long_cellboxes[i].get_id()))
+            for i in range (0 , num_rows): 
+                    self.neighbour_graph.add_neighbour (min_long_indx[i] , Direction.west, max_long_indx[i])
+                    self.neighbour_graph.add_neighbour (max_long_indx[i] , Direction.east , min_long_indx[i])
                     # checks to avoid the very upper and lower cellboxes as they do not have north/south neighbours
-                    if 0<= i < len(min_long_cellboxes)-1:
-                        self.neighbour_graph.add_neighbour (int (min_long_cellboxes[i].get_id()) , Direction.north_west, int (max_long_cellboxes[i+1].get_id()))
-                        self.neighbour_graph.add_neighbour (int (max_long_cellboxes[i].get_id()) , Direction.north_east, int (min_long_cellboxes[i+1].get_id()))
-                    if 0<i<= len(min_long_cellboxes)-1: 
-                        self.neighbour_graph.add_neighbour (int (min_long_cellboxes[i].get_id()) , Direction.south_west, int (max_long_cellboxes[i-1].get_id()))
-                        self.neighbour_graph.add_neighbour (int (max_long_cellboxes[i].get_id()) , Direction.south_east, int (min_long_cellboxes[i-1].get_id()))
+                    if 0<= i < num_rows-1:
+                        self.neighbour_graph.add_neighbour (min_long_indx[i] , Direction.north_west, max_long_indx[i+1])
+                        self.neighbour_graph.add_neighbour (max_long_indx[i] , Direction.north_east, min_long_indx[i+1])
+                    if 0<i<= num_rows-1: 
+                        self.neighbour_graph.add_neighbour (min_long_indx[i] , Direction.south_west, max_long_indx[i-1])
+                        self.neighbour_graph.add_neighbour (max_long_indx[i] , Direction.south_east, min_long_indx[i-1])
                    
         return is_global_mesh
     
@@ -386,16 +495,15 @@ class MeshBuilder:
                 cellbox (CellBox): the CellBox within this Mesh to be split into
                     4 smaller CellBox objects.
 
+            Returns:
+                list<CellBox>: the 4 CellBoxes that replaced the given cellbox
         """
         split_cellboxes = cellbox.split(len(self.mesh.cellboxes))
-        self.mesh.cellboxes += split_cellboxes
+        # replace the cellbox with its split cellboxes in the mesh's cellbox store
+        cellbox_indx, split_indices = self.mesh.replace_cellbox(cellbox, split_cellboxes)
         cellboxes = self.mesh.cellboxes
-        cellbox_indx = cellboxes.index(cellbox)
 
-        north_west_indx = cellboxes.index(split_cellboxes[0])
-        north_east_indx = cellboxes.index(split_cellboxes[1])
-        south_west_indx = cellboxes.index(split_cellboxes[2])
-        south_east_indx = cellboxes.index(split_cellboxes[3])
+        north_west_indx, north_east_indx, south_west_indx, south_east_indx = split_indices
 
         south_neighbour_indx = self.neighbour_graph.get_neighbours(
             cellbox_indx, 4)
@@ -482,8 +590,8 @@ class MeshBuilder:
 
         # remove the original splitted cellbox from the neighbour_graph
         self.neighbour_graph.remove_node(cellbox_indx)
-        # set the original splitted cellbox to None
-        cellboxes[cellbox_indx] = None
+
+        return split_cellboxes
 
  ############################## methods to fill the neighbour maps of the splitted cells ########################
  
@@ -601,30 +709,160 @@ class MeshBuilder:
         ds_pbar.clear()
         sd_pbar.clear()
 
-    def build_environmental_mesh(self):
+    def split_breadth_first(self, split_depth):
+        """
+            splits all cellboxes in this grid one split level at a time until a
+            maximum split depth is reached, or all cellboxes are homogeneous.
+            At each level, the splitting conditions of every data source are
+            evaluated for all the cellboxes on that level, then every cellbox
+            that should split is split together to form the next level.
+
+            Args:
+                split_depth (int): The maximum split depth reached by any CellBox
+                    within this Mesh after splitting.
+        """
+        logging.info("Splitting cellboxes breadth-first...")
+        frontier = self.mesh.get_leaf_cellboxes()
+
+        sd_pbar = tqdm(range(0, split_depth), position=0,
+                       bar_format=' Split depth: {n_fmt}/{total_fmt} |{bar}| {percentage:3.0f}%{postfix} ')
+        for level in sd_pbar:
+            if len(frontier) == 0:
+                break
+            sd_pbar.set_postfix_str(f'[{len(frontier)} cellboxes]')
+            # Evaluate the splitting conditions of the whole level before
+            # modifying the mesh
+            to_split = [cellbox for cellbox in frontier
+                        if cellbox.get_split_depth() < split_depth and
+                           cellbox.should_split_breadth_first()]
+            logging.debug(f'\tsplitting {len(to_split)}/{len(frontier)} cellboxes at split level {level}')
+
+            frontier = []
+            for cellbox in to_split:
+                frontier += self.split_and_replace(cellbox)
+        tqdm.write('')
+        sd_pbar.clear()
+
+    def get_split_mode(self):
+        """
+            returns the split mode set in the splitting section of the config,
+            either 'depth_first' (default) or 'breadth_first'
+        """
+        if 'splitting' in self.config:
+            return self.config['splitting'].get('split_mode', 'depth_first')
+        return 'depth_first'
+
+    def aggregate_cellboxes(self, cellboxes, workers=1, pool='process'):
+        """
+            aggregates the data within each of the given cellboxes, optionally 
+            spreading the cellboxes over a pool of workers. The aggregated 
+            cellboxes are returned in the same order as the input cellboxes, so 
+            the result is the same regardless of the number of workers.
+
+            Args:
+                cellboxes (list<CellBox>): the cellboxes to aggregate
+                workers (int): the number of workers to aggregate with. 
+                    Aggregation is serial if 1.
+                pool (str): the type of worker pool, either 'process' or 'thread'.
+                    Process pools require the 'fork' start method, and fall back 
+                    to a thread pool where it is not available.
+
+            Returns:
+                list<AggregatedCellBox>: the aggregated cellboxes
+        """
+        bar_format = ' Aggregating cellboxes: {n_fmt}/{total_fmt} |{bar}| {percentage:3.0f}%, [{elapsed} elapsed] '
+        if workers is None or workers <= 1 or len(cellboxes) <= 1:
+            agg_cellboxes = []
+            for agg_cell_count, cellbox in enumerate(tqdm(cellboxes, bar_format=bar_format)):
+                logging.debug(f'aggregating cellbox ({agg_cell_count+1}/{len(cellboxes)})')
+                agg_cellboxes.append(cellbox.aggregate())
+            return agg_cellboxes
+
+        # Split into several chunks per worker to balance load between them
+        chunk_size = max(1, math.ceil(len(cellboxes) / (workers * 4)))
+        chunks = [(start, min(start + chunk_size, len(cellboxes))) 
+                  for start in range(0, len(cellboxes), chunk_size)]
+
+        if pool == 'process' and 'fork' not in multiprocessing.get_all_start_methods():
+            logging.warning("\tProcess pool requires the 'fork' start method, aggregating with a thread pool instead")
+            pool = 'thread'
+        logging.info(f'\tAggregating {len(cellboxes)} cellboxes with {workers} {pool} workers')
+
+        pbar = tqdm(total=len(cellboxes), bar_format=bar_format)
+        agg_cellboxes = []
+        if pool == 'process':
+            global _AGGREGATION_CELLBOXES
+            _AGGREGATION_CELLBOXES = cellboxes
+            try:
+                with ProcessPoolExecutor(max_workers=workers, 
+                                         mp_context=multiprocessing.get_context('fork')) as executor:
+                    for agg_chunk in executor.map(_aggregate_cellbox_chunk, chunks):
+                        agg_cellboxes += agg_chunk
+                        pbar.update(len(agg_chunk))
+            finally:
+                _AGGREGATION_CELLBOXES = []
+        else:
+            def aggregate_chunk(chunk):
+                start, stop = chunk
+                return [cellbox.aggregate() for cellbox in cellboxes[start:stop]]
+            with ThreadPoolExecutor(max_workers=workers) as executor:
+                for agg_chunk in executor.map(aggregate_chunk, chunks):
+                    agg_cellboxes += agg_chunk
+                    pbar.update(len(agg_chunk))
+        pbar.close()
+
+        return agg_cellboxes
+
+    def build_environmental_mesh(self, workers=None, pool=None):
         """
             splits the mesh then goes through the mesh cellboxes and builds an evironmental mesh that contains the cellboxes aggregated data
+
+            Args:
+                workers (int): number of workers to aggregate cellboxes with. 
+                    Defaults to 'aggregation_workers' in the 'parallel' section of the config, or 1 (serial) if not set.
+                pool (str): type of worker pool to aggregate cellboxes with, 'process' or 'thread'.
+                    Defaults to 'pool' in the 'parallel' section of the config, or 'process' if not set.
             
             Returns:
                 EnvironmentMesh: an object that represents the constructed nonunifrom mesh and contains the aggregated cellboxs and neighbour graph 
         """
-        self.split_to_depth(self.mesh.get_max_split_depth())
-        agg_cellboxes = []
+        parallel_config = self.config.get('parallel', {})
+        if workers is None:
+            workers = parallel_config.get('aggregation_workers', 1)
+        if pool is None:
+            pool = parallel_config.get('pool', 'process')
+
+        if self.get_split_mode() == 'breadth_first':
+            self.split_breadth_first(self.mesh.get_max_split_depth())
+        else:
+            self.split_to_depth(self.mesh.get_max_split_depth())
 
-        agg_cell_count = 0
         logging.info('Aggregating cellboxes...')
-        for cellbox in tqdm(self.mesh.cellboxes, 
-                            bar_format=' Aggregating cellboxes: {n_fmt}/{total_fmt} |{bar}| {percentage:3.0f}%, [{elapsed} elapsed] '):
-            agg_cell_count += 1
-            if isinstance(cellbox, CellBox):
-                logging.debug(f'aggregating cellbox ({agg_cell_count}/{len(self.mesh.cellboxes)})')
-                agg_cellboxes.append(cellbox.aggregate())
+        agg_cellboxes = self.aggregate_cellboxes(self.mesh.get_leaf_cellboxes(), 
+                                                 workers=workers, pool=pool)
+        self.log_trim_cache_info()
 
         env_mesh = EnvironmentMesh(self.mesh.get_bounds(
         ), agg_cellboxes, self.neighbour_graph, self.get_config())
 
         return env_mesh
 
+    def log_trim_cache_info(self):
+        """
+            logs how often each dataloader reused the data and values cached for a boundary 
+            while the mesh was built. Cellboxes aggregated by worker processes use their own 
+            copies of the dataloaders, so aren't counted
+        """
+        for meta_data in getattr(self, 'meta_data_list', []):
+            loader = meta_data.get_data_loader()
+            if not hasattr(loader, 'trim_cache_info'):
+                continue
+            info = loader.trim_cache_info()
+            if info is not None:
+                logging.debug(f"\tTrim cache of '{loader.data_name}': {info['hits']} hits, " + 
+                              f"{info['misses']} misses, {info['entries']} entries " + 
+                              f"using {info['nbytes'] / 1024**2:.1f} of {info['max_bytes'] / 1024**2:.1f} MB")
+
     def get_config(self):
         """
         returns the config
@@ -0,0 +1,163 @@
+"""
+Streaming writer for environmental mesh JSON files.
+
+Meshes are written to a file handle one cellbox and one neighbour graph node
+at a time, rather than building the whole document as a string or a dict
+first, so that the memory needed to save a mesh does not grow with a copy of
+the full document. Indented output is identical to
+json.dump(mesh.to_json(), fp, indent=4).
+"""
+
+import gzip
+import json
+
+
+# File extensions that select a compression when opening mesh files
+COMPRESSION_EXTENSIONS = {'.gz':   'gzip',
+                          '.gzip': 'gzip',
+                          '.zst':  'zstd',
+                          '.zstd': 'zstd'}
+
+
+def compression_from_path(path):
+    '''
+    Determines the compression of a mesh file from its file extension
+
+    Args:
+        path (str): Location of the mesh file
+
+    Returns:
+        str or None: 'gzip', 'zstd', or None if the file is not compressed
+    '''
+    path = str(path).lower()
+    for extension, compression in COMPRESSION_EXTENSIONS.items():
+        if path.endswith(extension):
+            return compression
+    return None
+
+
+def open_mesh_file(path, mode='r', compression='infer'):
+    '''
+    Opens a mesh file as text, compressing or decompressing it on the fly
+
+    Args:
+        path (str): Location of the mesh file
+        mode (str): 'r' to read or 'w' to write
+        compression (str or None):
+            'gzip', 'zstd' or None. If 'infer', determined from the file
+            extension of path. zstd requires the 'zstandard' package
+
+    Returns:
+        file object: Text file handle of the mesh file
+
+    Raises:
+        ValueError: If the mode or compression are not supported
+        ImportError: If zstd compression is requested without 'zstandard' installed
+    '''
+    if mode not in ['r', 'w']:
+        raise ValueError(f"Mesh files can only be opened with mode 'r' or 'w', not '{mode}'")
+
+    if compression == 'infer':
+        compression = compression_from_path(path)
+
+    if compression is None:
+        return open(path, mode, encoding='utf-8')
+    elif compression == 'gzip':
+        return gzip.open(path, mode + 't', encoding='utf-8')
+    elif compression == 'zstd':
+        try:
+            import zstandard
+        except ModuleNotFoundError as err:
+            raise ImportError("Package 'zstandard' is required to read or write " +
+                              "zstd compressed meshes") from err
+        return zstandard.open(path, mode + 't', encoding='utf-8')
+    else:
+        raise ValueError(f"Unknown compression '{compression}'! " +
+                         "Requires 'gzip', 'zstd' or None")
+
+
+def load_mesh_json(path):
+    '''
+    Loads a mesh JSON file, decompressing it if its file extension is that
+    of a compressed mesh file
+
+    Args:
+        path (str): Location of the mesh file
+
+    Returns:
+        dict: JSON of the mesh, as saved by EnvironmentMesh.save()
+    '''
+    with open_mesh_file(path, 'r') as fp:
+        return json.load(fp)
+
+
+def write_mesh_json(fp, config, cellboxes, neighbour_graph, indent=4):
+    '''
+    Writes a mesh to a file handle in the JSON format of EnvironmentMesh.to_json(),
+    one cellbox and one neighbour graph node at a time
+
+    Args:
+        fp (file object): Text file handle to write the mesh to
+        config (dict): Config of the mesh, of the form {'mesh_info': ...}
+        cellboxes (iterable<dict>):
+            JSON of each cellbox in the mesh. May be a generator, so that
+            only one cellbox is converted to JSON at a time
+        neighbour_graph (dict): Neighbour graph of the mesh
+        indent (int or None):
+            Number of spaces to indent each level with. If None, the mesh
+            is written compactly, without any whitespace
+    '''
+    if indent is None:
+        separators = (',', ':')
+    else:
+        separators = (',', ': ')
+    key_separator = separators[1]
+
+    def newline(level):
+        '''
+        Returns the whitespace starting a new line at a given nesting level
+        '''
+        if indent is None:
+            return ''
+        return '\n' + ' ' * (indent * level)
+
+    def dumps(obj, level):
+        '''
+        Converts an object to JSON, indented to be nested at a given level
+        '''
+        text = json.dumps(obj, indent=indent, separators=separators)
+        if indent is None:
+            return text
+        # JSON strings never contain raw newlines, so all are indentation
+        return text.replace('\n', newline(level))
+
+    def write_items(items, level):
+        '''
+        Writes (key, value) pairs, or values if key is None, as the entries
+        of a JSON object or list nested at a given level.
+        Returns True if any items were written.
+        '''
+        written = False
+        for key, value in items:
+            fp.write(',' if written else '')
+            fp.write(newline(level))
+            if key is not None:
+                fp.write(json.dumps(str(key)) + key_separator)
+            fp.write(dumps(value, level))
+            written = True
+        return written
+
+    fp.write('{' + newline(1))
+    fp.write(json.dumps('config') + key_separator + dumps(config, 1) + ',')
+
+    fp.write(newline(1) + json.dumps('cellboxes') + key_separator + '[')
+    if write_items(((None, cellbox) for cellbox in cellboxes), 2):
+        fp.write(newline(1))
+    fp.write('],')
+
+    fp.write(newline(1) + json.dumps('neighbour_graph') + key_separator + '{')
+    if write_items(neighbour_graph.items(), 2):
+        fp.write(newline(1))
+    fp.write('}')
+
+    fp.write(newline(0) + '}')
@@ -1,5 +1,7 @@
 
 
+import numpy as np
+
 from meshiphi.mesh_generation.direction import Direction
 
 
@@ -416,13 +418,44 @@ class NeighbourGraph:
 
     def initialise_neighbour_graph(self, cellboxes, grid_width):
         """
-         initialize the neighbour graph
-        """
-        for cellbox in cellboxes:
-            cellbox_indx = cellboxes.index(cellbox)
-            neighbour_map = self.initialise_map(
-                cellbox_indx, grid_width, len(cellboxes))
+            initialize the neighbour graph of a uniform grid of cellboxes, ordered row by row
+            from the south west corner. The neighbours of every cellbox are calculated together
+            from the cellbox indices, giving the same neighbour maps as initialise_map.
 
+            Args:
+                cellboxes (list<CellBox>): the cellboxes forming the initial grid
+                grid_width (int): the number of cellboxes in each row of the grid
+        """
+        cellboxes_length = len(cellboxes)
+        if cellboxes_length == 0:
+            return
+        grid_width = int(grid_width)
+        indx = np.arange(cellboxes_length)
+
+        has_east = (indx + 1) % grid_width != 0
+        has_west = indx % grid_width != 0
+        has_north = indx + grid_width < cellboxes_length
+        has_south = indx - grid_width >= 0
+
+        def neighbours(mask, offset):
+            # list of neighbour lists, with an empty list where there is no neighbour
+            neighbour_indx = np.where(mask, indx + offset, -1).tolist()
+            return [[n] if n >= 0 else [] for n in neighbour_indx]
+
+        direction_neighbours = {
+            Direction.north_east: neighbours(has_east & has_north, grid_width + 1),
+            Direction.east:       neighbours(has_east, 1),
+            Direction.south_east: neighbours(has_east & has_south, 1 - grid_width),
+            Direction.south:      neighbours(has_south, -grid_width),
+            Direction.south_west: neighbours(has_west & has_south, -grid_width - 1),
+            Direction.west:       neighbours(has_west, -1),
+            Direction.north_west: neighbours(has_west & has_north, grid_width - 1),
+            Direction.north:      neighbours(has_north, grid_width)
+        }
+
+        for cellbox_indx in range(cellboxes_length):
+            neighbour_map = {direction: direction_neighbours[direction][cellbox_indx]
+                             for direction in direction_neighbours}
             self.add_node(cellbox_indx, neighbour_map)
 
     def initialise_map(self, cellbox_indx, grid_width, cellboxes_length):
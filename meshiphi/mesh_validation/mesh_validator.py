@@ -43,13 +43,14 @@ class MeshValidator:
     
        
 
-    def validate_mesh (self , number_of_samples=10):
+    def validate_mesh (self , number_of_samples=10, seed=None):
         """
 
           samples the mesh's lat and long space and compares the actual data within the sampled's range to the mesh agg_value then calculates the RMSE.
 
             Args:
               number_of_samples (int): the number of samples used to validate the mesh
+              seed (int): seed of the sampler, so that the same samples are validated each time. None for different samples each time
             Returns:
                 distance (float): the RMSE between the actaul data value and the mesh's agg_value.
 
@@ -59,13 +60,15 @@ class MeshValidator:
         SAMPLE_DIM = 2  # each sample contains lat and long
     
         bounds = self.mesh.get_bounds()
-        samples = Sampler(SAMPLE_DIM , number_of_samples).generate_samples([bounds.lat_range , bounds.long_range])
+        samples = Sampler(SAMPLE_DIM , number_of_samples, seed).generate_samples([bounds.lat_range , bounds.long_range])
         # compare the sampled lat and long values in data_file to the values obtained by mesh ( agg_values returned by  get_value)
         actual_value = np.array([])
         mesh_value = np.array([])
         for sample in samples:
-           actual_value =  np.append (actual_value ,self.get_value_from_data (sample))
-           mesh_value =  np.append ( mesh_value ,self.get_values_from_mesh(sample))  
+           # compare the data and mesh values of the same datapoints
+           sample_actual_value, sample_mesh_value = self.get_sample_values(sample)
+           actual_value =  np.append (actual_value , sample_actual_value)
+           mesh_value =  np.append ( mesh_value , sample_mesh_value)  
         # calculate the RMSE over the samples.
         distance = math.sqrt (mean_squared_error(actual_value,mesh_value))
         return distance
@@ -93,6 +96,35 @@ class MeshValidator:
         logging.info("values from data are: {}".format(' '.join(map(str, values))))
         return values
 
+    def get_sample_values (self , sample):
+        """
+            gets the actual data within the provided sample lat and long, and the mesh's aggregated value at each of the same datapoints.
+            datapoints on the bounds of cellboxes, which are not within any of them, are skipped in both
+            Args:
+              sample (float[]): a decimal array contains the sampled lat and long values
+            Returns:
+                two numpy arrays of the same length, the data values and the mesh values of each datapoint within the sampled lat and long range
+        """
+        actual_values = []
+        mesh_values = []
+        #calculate the sampling range based on the validation length
+        lat_end, long_end = self.get_range_end(sample)
+        lat_range = [sample[0] , lat_end]
+        long_range = [sample[1] , long_end ]
+        time_range = self.mesh.get_bounds().get_time_range()
+        for source in self.mesh.cellboxes[0].get_data_source():
+            data_loader = source.get_data_loader()
+            data_name = data_loader.get_data_col_name()
+            dp = data_loader.trim_datapoints( Boundary (lat_range , long_range , time_range))
+            if type(dp) == xr.core.dataset.Dataset:
+                dp = dp.to_dataframe().reset_index()
+            # locate all points at once, and skip points on the bounds of cellboxes
+            positions = self.env_mesh._get_cellbox_locator().locate(dp['lat'].to_numpy(), dp['long'].to_numpy())
+            inside_mesh = positions >= 0
+            actual_values = np.append (actual_values , dp[data_name].to_numpy()[inside_mesh])
+            mesh_values = np.append (mesh_values , self.env_mesh._get_cellbox_values(positions[inside_mesh], data_name))
+        return actual_values, mesh_values
+
     def get_range_end(self, sample):
         """
             calculates the range end of the provided sample lat and long, claculation is based on the specified validation_length
@@ -135,13 +167,12 @@ class MeshValidator:
                 
                 if type(dp) == xr.core.dataset.Dataset:
                     dp = dp.to_dataframe().reset_index()
-                for index, point in dp.iterrows():
-                    lat = point ['lat']
-                    long = point ['long']
-                    for agg_cellbox in self.env_mesh.agg_cellboxes:
-                        if agg_cellbox.contains_point(lat , long):
-                            values = np.append ( values , agg_cellbox.agg_data [data_loader.data_name] )#get the agg_value 
-                            break  # break to make sure we avoid getting multiple values (for lat and long on bounds of multiple cellboxes)
+                lats = dp['lat'].to_numpy()
+                longs = dp['long'].to_numpy()
+                # locate all points at once, and skip points on the bounds of cellboxes, which are not within any of them
+                positions = self.env_mesh._get_cellbox_locator().locate(lats, longs)
+                values = np.append(values, self.env_mesh._get_cellbox_values(positions[positions >= 0], 
+                                                                             data_loader.data_name))#get the agg_value 
             logging.info("values from mesh are: {}".format(' '.join(map(str, values))))
          
             return values
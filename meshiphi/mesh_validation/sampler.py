@@ -8,13 +8,15 @@ class Sampler:
     Attributes:
         dimensions (int): an integer representing the dimensions of each sample 
         number_of_samples (int): an integer representing the number of the generated samples
+        seed (int): seed of the scrambling of the Sobol sequence, so that the same samples are generated each time. None for different samples each time
 
 
     """
-    def __init__(self, d , n ):
+    def __init__(self, d , n , seed=None):
       
         self.dimensions = d
         self.number_of_samples = n
+        self.seed = seed
 
 
     def generate_samples ( self, ranges):
@@ -31,7 +33,7 @@ class Sampler:
         if len(ranges) != self.dimensions:
             raise ValueError("ranges length should be equal to the sampler dimension") 
 
-        sampler =  qmc.Sobol(d=self.dimensions)
+        sampler =  qmc.Sobol(d=self.dimensions, seed=self.seed)
         samples = sampler.random(n=self.number_of_samples)
         mapped_samples = []
         # map samples to ranges
@@ -196,7 +196,7 @@ def fftind(size):
     return k_ind
 
 
-def gaussian_random_field(size, alpha):
+def gaussian_random_field(size, alpha, random_state=None):
     """
     Creates a gaussian random field with normal (circular) distribution
     Code from https://github.com/bsciolla/gaussian-random-fields/blob/master/gaussian_random_fields.py
@@ -208,6 +208,10 @@ def gaussian_random_field(size, alpha):
         alpha (float):
             Default = 3.0;
             The power of the power-law momentum distribution
+        random_state (np.random.RandomState):
+            Default = None;
+            Random number generator to draw the noise from. If None, numpy's
+            global random state is used
 
     Returns:
         np.array:
@@ -221,10 +225,13 @@ def gaussian_random_field(size, alpha):
     amplitude = np.power( k_idx[0]**2 + k_idx[1]**2 + 1e-10, -alpha/4.0 )
     amplitude[0,0] = 0
 
+    if random_state is None:
+        random_state = np.random
+
     # Draws a complex gaussian random noise with normal
     # (circular) distribution
-    noise = np.random.normal(size = (size, size)) \
-        + 1j * np.random.normal(size = (size, size))
+    noise = random_state.normal(size = (size, size)) \
+        + 1j * random_state.normal(size = (size, size))
 
     # To real space
     grf = np.fft.ifft2(noise * amplitude).real
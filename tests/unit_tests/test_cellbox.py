@@ -269,6 +269,27 @@ class TestCellBox (unittest.TestCase):
 
         self.assertAlmostEqual(child_agg_cb.agg_data['dummy_data'], 0.245, 3)
 
+    def test_get_fill_value(self):
+        parent_cellbox   = create_cellbox(Boundary([-10, 10], [-10, 10]), 
+                                          id=1, 
+                                          parent=None)
+        loader = parent_cellbox.get_data_source()[0].get_data_loader()
+        expected_value = loader.get_value(parent_cellbox.bounds,
+                                          data=parent_cellbox.get_data_source()[0].get_data_subset())
+        
+        # Value is aggregated once, then reused without the parent's data subset
+        self.assertEqual(parent_cellbox.get_fill_value(loader), expected_value)
+        self.assertIsNone(parent_cellbox.get_data_source()[0].get_data_subset())
+        self.assertEqual(parent_cellbox.get_fill_value(loader), expected_value)
+        self.assertEqual(len(parent_cellbox.fill_values), 1)
+
+        # Returned value can be altered without changing the cached value
+        parent_cellbox.get_fill_value(loader)['dummy_data'] = float('nan')
+        self.assertEqual(parent_cellbox.get_fill_value(loader), expected_value)
+
+        arbitrary_loader = create_dataloader(Boundary([-10, 10], [-10, 10]))
+        self.assertRaises(ValueError, parent_cellbox.get_fill_value, arbitrary_loader)
+
     def test_check_vector_data(self):
         vector_bounds = Boundary([-10, 10], [-10, 10])
         vector_params = {
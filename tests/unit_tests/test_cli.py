@@ -4,12 +4,16 @@ from meshiphi.cli import create_mesh_cli
 from meshiphi.cli import export_mesh_cli
 from meshiphi.cli import merge_mesh_cli
 from meshiphi.cli import meshiphi_test_cli
+from meshiphi.dataloaders.data_cache import set_data_cache
 
 
 import tempfile
 import sys
+import os
+import gzip
 import unittest
 import json
+from importlib.util import find_spec
 from unittest.mock import patch
 
 
@@ -37,6 +41,17 @@ def json_dict_to_file(json_dict, filename):
     with open(filename, 'w') as fp:
         json.dump(json_dict, fp, indent=4)
 
+def json_dict_to_gzip_file(json_dict, filename):
+    """
+    Converts a dictionary to a gzip compressed JSON formatted file
+
+    Args:
+        json_dict (dict): Dict to write to JSON
+        filename (str): Path to file being written
+    """
+    with gzip.open(filename, 'wt') as fp:
+        json.dump(json_dict, fp)
+
 def file_to_json_dict(filename):
     """
     Reads in a JSON file and returns dict of contents
@@ -102,6 +117,25 @@ class TestCLI (unittest.TestCase):
             # Ensure they are the same
             self.assertEqual(orig_mesh, rebuilt_mesh)
 
+    def test_rebuild_mesh_cli_gzip(self):
+        # Command line entry, rebuilding a mesh saved as compressed JSON
+        mesh_file = os.path.join(self.output_base_directory, 'mesh.json.gz')
+        test_args = ['rebuild_mesh', 
+                     mesh_file,
+                     '-o', self.tmp_output_file.name]
+        
+        # Create files with relevant data for test
+        json_dict_to_gzip_file(BASIC_MESH, mesh_file)
+
+        # Patch sys.argv with command line entry defined above
+        with patch.object(sys, 'argv', test_args):
+
+            # Run the command
+            rebuild_mesh_cli()
+
+            # Ensure it is the same as the mesh rebuilt from uncompressed JSON
+            self.assertEqual(BASIC_OUTPUT, file_to_json_dict(self.tmp_output_file.name))
+
     def test_create_mesh_cli(self):
         # Command line entry
         test_args = ['create_mesh', 
@@ -125,6 +159,84 @@ class TestCLI (unittest.TestCase):
             # Ensure they are the same
             self.assertEqual(orig_mesh, created_mesh)
     
+    def test_create_mesh_cli_compact_gzip(self):
+        # Command line entry, saving compact JSON compressed by output file extension
+        output_file = os.path.join(self.output_base_directory, 'create_mesh.output.json.gz')
+        test_args = ['create_mesh', 
+                     self.tmp_config_file.name,
+                     '-o', output_file,
+                     '--compact']
+        
+        # Create files with relevant data for test
+        json_dict_to_file(BASIC_CONFIG, self.tmp_config_file.name)
+
+        # Patch sys.argv with command line entry defined above
+        with patch.object(sys, 'argv', test_args):
+
+            # Run the command
+            create_mesh_cli()
+            
+            # Read in compressed mesh, which should have no whitespace
+            with gzip.open(output_file, 'rt') as fp:
+                created_mesh_str = fp.read()
+            created_mesh = json.loads(created_mesh_str)
+
+            # Ensure it is the same as the uncompressed mesh
+            self.assertNotIn('\n', created_mesh_str)
+            self.assertEqual(BASIC_OUTPUT, created_mesh)
+    
+    def test_create_mesh_cli_data_cache(self):
+        # Config with data loaded from a file, so that it can be cached
+        data_file = os.path.join(self.output_base_directory, 'data.csv')
+        with open(data_file, 'w') as fp:
+            fp.write('lat,long,dummy_data\n')
+            for lat in range(-10, 11):
+                for long in range(-10, 11):
+                    fp.write(f'{lat},{long},{lat * long}\n')
+        config = json.loads(json.dumps(BASIC_CONFIG))
+        config['data_sources'] = [{'loader': 'scalar_csv',
+                                   'params': {'files': [data_file],
+                                              'data_name': 'dummy_data',
+                                              'aggregate_type': 'MEAN'}}]
+        json_dict_to_file(config, self.tmp_config_file.name)
+
+        cache_directory = os.path.join(self.output_base_directory, 'data_cache')
+        output_files = [os.path.join(self.output_base_directory, f'create_mesh_{i}.json') 
+                        for i in range(3)]
+        # Don't leave the cache set for any other tests
+        self.addCleanup(set_data_cache, None)
+
+        # First run fills the cache, second run reads from it
+        for output_file in output_files[:2]:
+            test_args = ['create_mesh', 
+                         self.tmp_config_file.name,
+                         '-o', output_file,
+                         '--data_cache', cache_directory]
+            with patch.object(sys, 'argv', test_args):
+                create_mesh_cli()
+        cached_files = os.listdir(cache_directory)
+        # Point data is stored as Parquet, so is only cached if pyarrow is installed
+        expected_extensions = ['.json', '.parquet'] if find_spec('pyarrow') else []
+        self.assertEqual(sorted(os.path.splitext(f)[1] for f in cached_files), 
+                         expected_extensions)
+
+        # Clearing the cache and bypassing it leaves it empty
+        test_args = ['create_mesh', 
+                     self.tmp_config_file.name,
+                     '-o', output_files[2],
+                     '--data_cache', cache_directory,
+                     '--clear_data_cache', 
+                     '--no_data_cache']
+        with patch.object(sys, 'argv', test_args):
+            create_mesh_cli()
+        self.assertEqual(os.listdir(cache_directory), [])
+
+        # Ensure cached data creates the same mesh as data read from file
+        meshes = [file_to_json_dict(output_file) for output_file in output_files]
+        self.assertEqual(meshes[0], meshes[1])
+        self.assertEqual(meshes[0], meshes[2])
+        self.assertIn('dummy_data', meshes[0]['cellboxes'][0])
+
     def test_export_mesh_cli(self):
         # TODO:
         #   - Test GeoJSON output
@@ -159,6 +271,30 @@ class TestCLI (unittest.TestCase):
             # Ensure they are the same
             self.assertEqual(orig_mesh, created_mesh)
         
+    def test_merge_mesh_cli_gzip(self):
+        # Command line entry, merging a directory of meshes saved as compressed JSON
+        mesh_file = os.path.join(self.output_base_directory, 'mesh_1.json.gz')
+        merge_directory = os.path.join(self.output_base_directory, 'merge')
+        os.mkdir(merge_directory)
+        test_args = ['merge_mesh', 
+                     mesh_file,
+                     merge_directory,
+                     '-d',
+                     '-o', self.tmp_output_file.name]
+        
+        # Create files with relevant data for test
+        json_dict_to_gzip_file(BASIC_HALF_MESH_1, mesh_file)
+        json_dict_to_gzip_file(BASIC_HALF_MESH_2, os.path.join(merge_directory, 'mesh_2.json.gz'))
+        
+        # Patch sys.argv with command line entry defined above
+        with patch.object(sys, 'argv', test_args):
+
+            # Run the command
+            merge_mesh_cli()
+
+            # Ensure it is the same as the meshes merged from uncompressed JSON
+            self.assertEqual(BASIC_MERGED_MESH, file_to_json_dict(self.tmp_output_file.name))
+        
     def test_meshiphi_test_cli(self):
         # TODO:
         #  - Set up method for comparing SVG images
@@ -0,0 +1,136 @@
+import os
+import pickle
+import tempfile
+import unittest
+from importlib.util import find_spec
+
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+from meshiphi.dataloaders.data_cache import DataCache, set_data_cache, ARRAYS_PREFIX
+from meshiphi.dataloaders.scalar.abstract_scalar import ScalarDataLoader
+from meshiphi.dataloaders.grid_index import is_lat_sorted
+from meshiphi.mesh_generation.boundary import Boundary
+
+
+class FilteredFilesDataLoader(ScalarDataLoader):
+    '''
+    Scalar dataloader that only reads the first of its files, as dataloaders
+    that filter their files by date do
+    '''
+    def import_data(self, bounds):
+        self.files = self.files[:1]
+        self.num_imports += 1
+        return xr.open_dataset(self.files[0]).load()
+
+
+class TestDataCache(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        self.cache = DataCache(self.directory.name, 1024**2)
+        self.dataset = xr.Dataset({'dummy': (('lat', 'long'), np.random.RandomState(0).rand(5, 5))},
+                                  coords={'lat': np.arange(5.), 'long': np.arange(5.)})
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def test_dataset(self):
+        self.cache.put('key', self.dataset, 'dummy', ['a.nc'])
+        data, data_name, files = self.cache.get('key')
+        xr.testing.assert_equal(data, self.dataset)
+        self.assertEqual((data_name, files), ('dummy', ['a.nc']))
+        self.assertIsNone(self.cache.get('other_key'))
+
+    @unittest.skipUnless(find_spec('pyarrow'), "requires 'pyarrow'")
+    def test_dataframe(self):
+        points = pd.DataFrame({'lat': [0., 1.], 'long': [2., 3.], 'dummy': [4., 5.],
+                               'time': pd.to_datetime(['2000-01-01', '2000-01-02'])})
+        self.cache.put('key', points, 'dummy', ['a.csv'])
+        self.assertTrue(os.path.exists(os.path.join(self.directory.name, 'key.parquet')))
+        data, _, _ = self.cache.get('key')
+        pd.testing.assert_frame_equal(data, points)
+
+    def test_unreadable(self):
+        self.cache.put('key', self.dataset, 'dummy', ['a.nc'])
+        # Truncated data file
+        with open(os.path.join(self.directory.name, 'key.nc'), 'r+b') as fp:
+            fp.truncate(100)
+        self.assertIsNone(self.cache.get('key'))
+        self.assertEqual(os.listdir(self.directory.name), [])
+        # Truncated info file
+        self.cache.put('key', self.dataset, 'dummy', ['a.nc'])
+        with open(os.path.join(self.directory.name, 'key.json'), 'r+') as fp:
+            fp.truncate(5)
+        self.assertIsNone(self.cache.get('key'))
+        self.assertEqual(os.listdir(self.directory.name), [])
+
+    def test_pickle_not_read(self):
+        # Entries pickled by earlier versions are removed without being loaded
+        with open(os.path.join(self.directory.name, 'key.pkl'), 'wb') as fp:
+            pickle.dump(pd.DataFrame({'dummy': [1.]}), fp)
+        with open(os.path.join(self.directory.name, 'key.json'), 'w') as fp:
+            fp.write('{"data_name": "dummy", "extension": ".pkl"}')
+        self.assertIsNone(self.cache.get('key'))
+        self.assertEqual(os.listdir(self.directory.name), [])
+
+    def test_arrays_in_size_cap(self):
+        self.cache.put_arrays('map', lat=np.zeros(1000))
+        self.assertIn((ARRAYS_PREFIX + 'map', os.path.getsize(self.cache._arrays_path('map'))),
+                      self.cache.entries())
+        np.testing.assert_array_equal(self.cache.get_arrays('map')['lat'], np.zeros(1000))
+        # Least recently used arrays are evicted to make room for new data
+        os.utime(self.cache._arrays_path('map'), (0, 0))
+        self.cache.max_bytes = os.path.getsize(self.cache._arrays_path('map')) + 1000
+        self.cache.put('key', self.dataset, 'dummy', ['a.nc'])
+        self.assertIsNone(self.cache.get_arrays('map'))
+        self.assertIsNotNone(self.cache.get('key'))
+        self.assertLessEqual(sum(size for _, size in self.cache.entries()), self.cache.max_bytes)
+
+
+class TestLoaderDataCache(unittest.TestCase):
+
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        set_data_cache(os.path.join(self.directory.name, 'cache'))
+        self.paths = []
+        for i in range(2):
+            path = os.path.join(self.directory.name, f'dummy_{i}.nc')
+            xr.Dataset({'dummy': (('lat', 'long'), np.full((5, 5), float(i)))},
+                       coords={'lat': np.arange(5.), 'long': np.arange(5.)}).to_netcdf(path)
+            self.paths.append(path)
+
+    def tearDown(self):
+        set_data_cache(None)
+        self.directory.cleanup()
+
+    def create_loader(self):
+        params = {'files': list(self.paths), 'data_name': 'dummy', 'num_imports': 0}
+        return FilteredFilesDataLoader(Boundary([0, 4], [0, 4]), params)
+
+    def test_files_restored(self):
+        uncached = self.create_loader()
+        cached = self.create_loader()
+        self.assertEqual((uncached.num_imports, cached.num_imports), (1, 0))
+        # Files recorded in the mesh config are the same whether or not the cache is used
+        self.assertEqual(cached.files, self.paths[:1])
+        self.assertEqual(cached.files, uncached.files)
+        xr.testing.assert_equal(cached.data, uncached.data)
+
+    @unittest.skipUnless(find_spec('pyarrow'), "requires 'pyarrow'")
+    def test_dataframe_sorted(self):
+        class PointsDataLoader(FilteredFilesDataLoader):
+            def import_data(self, bounds):
+                self.num_imports += 1
+                return xr.open_dataset(self.files[0]).to_dataframe().reset_index()
+        params = {'files': list(self.paths), 'data_name': 'dummy', 'num_imports': 0}
+        uncached = PointsDataLoader(Boundary([0, 4], [0, 4]), dict(params))
+        cached = PointsDataLoader(Boundary([0, 4], [0, 4]), dict(params))
+        self.assertEqual(cached.num_imports, 0)
+        self.assertTrue(is_lat_sorted(cached.data))
+        pd.testing.assert_frame_equal(cached.data, uncached.data)
+
+
+if __name__ == '__main__':
+    unittest.main()
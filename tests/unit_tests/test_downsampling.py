@@ -0,0 +1,94 @@
+import unittest
+
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+from meshiphi.dataloaders.downsampling import downsample_points, point_spacing
+
+
+def create_grid_dataset():
+    rng = np.random.RandomState(0)
+    lat = np.arange(-80, -60, 0.05)
+    long = np.arange(-100, -40, 0.1)
+    return xr.Dataset({'SIC': (('lat', 'long'), rng.rand(len(lat), len(long)))},
+                      coords={'lat': lat, 'long': long})
+
+
+class TestDownsampling(unittest.TestCase):
+
+    def test_point_spacing(self):
+        grid = create_grid_dataset().to_dataframe().reset_index()
+        lat_spacing, long_spacing = point_spacing(grid['lat'].to_numpy(), grid['long'].to_numpy())
+        self.assertAlmostEqual(lat_spacing, 0.05)
+        self.assertAlmostEqual(long_spacing, 0.1)
+        # Scattered points are spread evenly over their extent
+        rng = np.random.RandomState(1)
+        lat, long = rng.uniform(0, 10, 10000), rng.uniform(0, 40, 10000)
+        lat_spacing, long_spacing = point_spacing(lat, long)
+        self.assertAlmostEqual(lat_spacing, 0.2, delta=0.01)
+        self.assertEqual(lat_spacing, long_spacing)
+        # No coordinates
+        self.assertEqual(point_spacing(np.full(5, np.nan), np.arange(5.)), (0., 0.))
+
+    def test_grid_matches_coarsen(self):
+        grid = create_grid_dataset()
+        points = grid.to_dataframe().reset_index()
+        for agg_type in ['MIN', 'MAX', 'MEAN', 'MEDIAN', 'STD']:
+            # Reduce each 4x3 block of points together
+            coarsened = getattr(grid.coarsen(lat=4, long=3, boundary='pad'), agg_type.lower())()
+            coarsened = coarsened.to_dataframe().reset_index()
+            downsampled = downsample_points(points, (3, 4), agg_type)
+            self.assertEqual(list(downsampled.columns), list(points.columns))
+            for col in ['lat', 'long', 'SIC']:
+                np.testing.assert_allclose(downsampled[col], coarsened[col], atol=1e-12,
+                                           err_msg=f'{col} for {agg_type}')
+
+    def test_count_keeps_first_point(self):
+        grid = create_grid_dataset()
+        points = grid.to_dataframe().reset_index()
+        thinned = grid.thin(lat=4).thin(long=3).to_dataframe().reset_index()
+        downsampled = downsample_points(points, (3, 4), 'COUNT')
+        pd.testing.assert_frame_equal(downsampled.sort_values(['lat', 'long']).reset_index(drop=True),
+                                      thinned[list(points.columns)])
+
+    def test_scattered(self):
+        rng = np.random.RandomState(2)
+        num_points = 100000
+        points = pd.DataFrame({'lat': rng.uniform(-80, -60, num_points),
+                               'long': rng.uniform(-100, -40, num_points),
+                               'value': rng.rand(num_points)})
+        downsampled = downsample_points(points, (4, 4), 'MEAN')
+        # Roughly 16 points per bin
+        self.assertAlmostEqual(len(points) / len(downsampled), 16, delta=2)
+        # Mean of the bins, weighted by points in each, is the mean of all points
+        self.assertAlmostEqual(downsampled['value'].mean(), points['value'].mean(), delta=0.01)
+        self.assertTrue(downsampled['lat'].between(-80, -60).all())
+        self.assertTrue(downsampled['long'].between(-100, -40).all())
+
+    def test_time(self):
+        points = create_grid_dataset().to_dataframe().reset_index()
+        points = pd.concat([points.assign(time='2020-01-01'),
+                            points.assign(time='2020-01-02', SIC=points['SIC'] + 1)],
+                           ignore_index=True)
+        downsampled = downsample_points(points, (3, 4), 'MEAN')
+        self.assertEqual(list(downsampled.columns), list(points.columns))
+        # Points at different times are never binned together
+        day_1 = downsampled[downsampled['time'] == '2020-01-01'].reset_index(drop=True)
+        day_2 = downsampled[downsampled['time'] == '2020-01-02'].reset_index(drop=True)
+        self.assertEqual(len(day_1), len(day_2))
+        np.testing.assert_allclose(day_2['SIC'], day_1['SIC'] + 1)
+
+    def test_nan_coordinates(self):
+        points = create_grid_dataset().to_dataframe().reset_index()
+        with_nan = points.copy()
+        with_nan.loc[::7, 'lat'] = np.nan
+        expected = downsample_points(points.drop(index=points.index[::7]), (3, 4), 'MEAN')
+        pd.testing.assert_frame_equal(downsample_points(with_nan, (3, 4), 'MEAN'), expected)
+        # All NaN coordinates leaves no points
+        with_nan['lat'] = np.nan
+        self.assertEqual(len(downsample_points(with_nan, (3, 4), 'MEAN')), 0)
+
+    def test_unknown_agg_type(self):
+        points = create_grid_dataset().to_dataframe().reset_index()
+        self.assertIs(downsample_points(points, (3, 4), 'UNKNOWN'), points)
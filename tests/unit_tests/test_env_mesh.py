@@ -1,7 +1,14 @@
 import unittest
 import json
+import os
+import shutil
+import tempfile
+import numpy as np
 from meshiphi.mesh_generation.environment_mesh import EnvironmentMesh
 from meshiphi.mesh_generation.mesh_builder import MeshBuilder
+from meshiphi.mesh_generation.aggregated_cellbox import AggregatedCellBox
+from meshiphi.mesh_generation.boundary import Boundary
+from meshiphi.mesh_generation.cellbox_index import CellboxLocator
 
 
 class TestEnvMesh(unittest.TestCase):
@@ -33,3 +40,236 @@ class TestEnvMesh(unittest.TestCase):
             vessel_file = json.load(config_file)
         env_mesh = EnvironmentMesh.load_from_json(vessel_file)
         env_mesh.save("./resources/SIC.tif", format="tif")
+
+
+class TestBinaryMesh(unittest.TestCase):
+    def setUp(self):
+        mesh_file = "../regression_tests/example_meshes/env_meshes/grf_normal.json"
+        with open(mesh_file, "r") as fp:
+            self.mesh_json = json.load(fp)
+        self.env_mesh = EnvironmentMesh.load_from_json(self.mesh_json)
+        self.output_dir = tempfile.mkdtemp()
+        self.binary_file = os.path.join(self.output_dir, "mesh.bin")
+
+    def tearDown(self):
+        shutil.rmtree(self.output_dir)
+
+    def test_binary_round_trip(self):
+        # Add fields that aren't in every cellbox, and aren't floats
+        self.env_mesh.update_cellbox(0, {"x": "5"})
+        self.env_mesh.update_cellbox(1, {"y": [1, 2, None]})
+        self.env_mesh.save(self.binary_file, format="binary")
+
+        binary_mesh = EnvironmentMesh.load_from_binary(self.binary_file)
+        self.assertEqual(binary_mesh.to_json(), self.env_mesh.to_json())
+
+    def test_binary_lazy_load(self):
+        self.env_mesh.save(self.binary_file, format="binary")
+        binary_mesh = EnvironmentMesh.load_from_binary(self.binary_file)
+
+        # Cellboxes are only created when accessed
+        self.assertEqual(binary_mesh.agg_cellboxes.num_loaded(), 0)
+        self.assertEqual(binary_mesh.agg_cellboxes[5], self.env_mesh.agg_cellboxes[5])
+        self.assertEqual(binary_mesh.agg_cellboxes.num_loaded(), 1)
+        self.assertEqual(len(binary_mesh.agg_cellboxes), len(self.env_mesh.agg_cellboxes))
+
+
+class TestCellboxIndex(unittest.TestCase):
+    def setUp(self):
+        mesh_file = "../regression_tests/example_meshes/env_meshes/grf_normal.json"
+        with open(mesh_file, "r") as fp:
+            self.mesh_json = json.load(fp)
+        self.env_mesh = EnvironmentMesh.load_from_json(self.mesh_json)
+
+    def find_cellbox_ids(self, point):
+        return [cellbox.id for cellbox in self.env_mesh.agg_cellboxes
+                if cellbox.contains_point(point[0], point[1])]
+
+    def test_query_index(self):
+        for cellbox in self.env_mesh.agg_cellboxes[::10]:
+            point = (cellbox.get_bounds().getcy(), cellbox.get_bounds().getcx())
+            self.assertEqual(self.env_mesh.query_index(point), cellbox.id)
+        self.assertFalse(self.env_mesh.query_inside_mesh((89.9, 179.9)))
+
+    def test_index_after_split(self):
+        cellbox = self.env_mesh.agg_cellboxes[0]
+        point = (cellbox.get_bounds().getcy() + 1e-6, cellbox.get_bounds().getcx() + 1e-6)
+        self.env_mesh.query_index(point)
+
+        self.env_mesh.split_and_replace(cellbox.id)
+        self.assertEqual([self.env_mesh.query_index(point)], self.find_cellbox_ids(point))
+        self.assertNotEqual(self.env_mesh.query_index(point), cellbox.id)
+
+    def test_query_index_many(self):
+        cellboxes = self.env_mesh.agg_cellboxes[::10]
+        lats = np.array([cellbox.get_bounds().getcy() for cellbox in cellboxes] + [89.9])
+        longs = np.array([cellbox.get_bounds().getcx() for cellbox in cellboxes] + [179.9])
+
+        cellbox_ids = self.env_mesh.query_index_many(lats, longs)
+        self.assertEqual(list(cellbox_ids[:-1]), [cellbox.id for cellbox in cellboxes])
+        self.assertIsNone(cellbox_ids[-1])
+
+    def test_query_index_many_matches_contains_point(self):
+        rng = np.random.RandomState(0)
+        bounds = self.env_mesh.bounds
+        # Random points, and points on the corners and edges of cellboxes
+        lats = list(rng.uniform(bounds.get_lat_min() - 1, bounds.get_lat_max() + 1, 300))
+        longs = list(rng.uniform(bounds.get_long_min() - 1, bounds.get_long_max() + 1, 300))
+        for cellbox in self.env_mesh.agg_cellboxes[::25]:
+            cellbox_bounds = cellbox.get_bounds()
+            lats += [cellbox_bounds.get_lat_min(), cellbox_bounds.get_lat_min(), cellbox_bounds.getcy()]
+            longs += [cellbox_bounds.get_long_min(), cellbox_bounds.getcx(), cellbox_bounds.get_long_min()]
+
+        cellbox_ids = self.env_mesh.query_index_many(np.array(lats), np.array(longs))
+        for lat, long, cellbox_id in zip(lats, longs, cellbox_ids):
+            expected = self.find_cellbox_ids((lat, long))
+            self.assertEqual(cellbox_id, expected[0] if expected else None, msg=f'({lat}, {long})')
+
+    def test_query_index_many_after_split(self):
+        cellbox = self.env_mesh.agg_cellboxes[0]
+        point = (np.array([cellbox.get_bounds().getcy() + 1e-6]), np.array([cellbox.get_bounds().getcx() + 1e-6]))
+        self.assertEqual(self.env_mesh.query_index_many(*point)[0], cellbox.id)
+
+        self.env_mesh.split_and_replace(cellbox.id)
+        self.assertEqual(list(self.env_mesh.query_index_many(*point)), 
+                         [self.env_mesh.query_index((point[0][0], point[1][0]))])
+        self.assertNotEqual(self.env_mesh.query_index_many(*point)[0], cellbox.id)
+
+    def test_locator(self):
+        cellboxes = [AggregatedCellBox(Boundary([-10, 10], [170, -170]), {}, '0'),   # Crossing antimeridian
+                     AggregatedCellBox(Boundary([-5, 5], [175, -175]), {}, '1'),     # Within cellbox 0
+                     AggregatedCellBox(Boundary([0, 0.1], [0, 0.1]), {}, '2'),
+                     AggregatedCellBox(Boundary([0, 50], [0, 50]), {}, '3')]
+        lats = np.array([[0, 0, 0.05, 0.05, 20], [0, np.nan, -10, 0, 0]])
+        longs = np.array([[179, -179, 0.05, 0.1, 20], [np.nan, 0, 175, 180, 170]])
+        locator = CellboxLocator(cellboxes)
+        np.testing.assert_array_equal(locator.locate(lats, longs), [[0, 0, 2, 3, 3], [-1, -1, -1, -1, -1]])
+        for lat, long, position in zip(lats.ravel(), longs.ravel(), locator.locate(lats, longs).ravel()):
+            expected = [i for i, cellbox in enumerate(cellboxes) if cellbox.contains_point(lat, long)]
+            self.assertEqual(position, expected[0] if expected else -1)
+        self.assertTrue(locator.matches(list(cellboxes)))
+        self.assertFalse(locator.matches(cellboxes[::-1]))
+        self.assertEqual(list(CellboxLocator([]).locate(np.array([0.]), np.array([0.]))), [-1])
+
+    def test_sample_values(self):
+        cellboxes = self.env_mesh.agg_cellboxes[::10]
+        lats = np.array([cellbox.get_bounds().getcy() for cellbox in cellboxes] + [89.9])
+        longs = np.array([cellbox.get_bounds().getcx() for cellbox in cellboxes] + [179.9])
+
+        values = self.env_mesh.sample_values(lats, longs, "SIC")
+        np.testing.assert_array_equal(values[:-1], [cellbox.agg_data["SIC"] for cellbox in cellboxes])
+        self.assertTrue(np.isnan(values[-1]))
+
+    def test_cellbox_ids_after_split(self):
+        max_id = max(int(cellbox.id) for cellbox in self.env_mesh.agg_cellboxes)
+        self.assertEqual(self.env_mesh.get_max_cellbox_id(), max_id)
+
+        cellbox = self.env_mesh.agg_cellboxes[0]
+        self.env_mesh.split_and_replace(cellbox.id)
+        self.assertIsNone(self.env_mesh.get_cellbox(cellbox.id))
+        self.assertEqual(self.env_mesh.get_max_cellbox_id(), max_id + 4)
+        for split_id in range(max_id + 1, max_id + 5):
+            self.assertEqual(self.env_mesh.get_cellbox(split_id).id, str(split_id))
+
+        # Removing the cellbox with the maximum id lowers the maximum id
+        self.env_mesh.remove_cellbox(self.env_mesh.get_cellbox(max_id + 4))
+        self.assertEqual(self.env_mesh.get_max_cellbox_id(), max_id + 3)
+        self.assertEqual(len(self.env_mesh.agg_cellboxes), len(self.mesh_json["cellboxes"]) + 2)
+
+    def assert_batch_split_matches(self, env_mesh, points, split_depth):
+        def get_mesh_geometry(env_mesh):
+            # Bounds of each cellbox, and of each of its neighbours, as ids depend on the order of splitting
+            bounds = {str(cellbox.id): str(cellbox.get_bounds().to_polygon()) for cellbox in env_mesh.agg_cellboxes}
+            neighbours = set()
+            for index, neighbour_map in env_mesh.neighbour_graph.get_graph().items():
+                for direction, neighbour_indices in neighbour_map.items():
+                    neighbours.update((bounds[str(index)], str(direction), bounds[str(neighbour_index)])
+                                      for neighbour_index in neighbour_indices)
+            return sorted(bounds.values()), neighbours
+
+        batch_env_mesh = EnvironmentMesh.load_from_json(json.loads(json.dumps(env_mesh.to_json())))
+        num_cellboxes = len(env_mesh.agg_cellboxes)
+        env_mesh.config["splitting"]["split_depth"] = split_depth
+        batch_env_mesh.config["splitting"]["split_depth"] = split_depth
+
+        env_mesh.split_points(points)
+        batch_env_mesh.batch_split_points(points)
+        self.assertGreater(len(batch_env_mesh.agg_cellboxes), num_cellboxes)
+        self.assertEqual(get_mesh_geometry(batch_env_mesh), get_mesh_geometry(env_mesh))
+        # Every cellbox has a neighbour map, and every neighbour is in the mesh
+        cellbox_ids = set(str(cellbox.id) for cellbox in batch_env_mesh.agg_cellboxes)
+        self.assertEqual(set(map(str, batch_env_mesh.neighbour_graph.get_graph())), cellbox_ids)
+
+    def test_batch_split_points(self):
+        cellboxes = self.env_mesh.agg_cellboxes[::50]
+        points = [(cellbox.get_bounds().getcy() + 0.1, cellbox.get_bounds().getcx() + 0.1) for cellbox in cellboxes]
+        self.assert_batch_split_matches(self.env_mesh, points, 6)
+
+    def test_batch_split_points_clustered(self):
+        # Neighbouring cellboxes, including diagonal ones, are split at the same depth
+        rng = np.random.RandomState(0)
+        bounds = self.env_mesh.bounds
+        lat_min, long_min = bounds.get_lat_min(), bounds.get_long_min()
+        points = [(lat_min + lat, long_min + long) for lat, long in rng.uniform(0, 4, (40, 2))] + \
+                 [(bounds.getcy() + lat, bounds.getcx() + long) for lat, long in rng.uniform(-2, 2, (40, 2))]
+        self.assert_batch_split_matches(self.env_mesh, points, 6)
+
+    def test_batch_split_points_global(self):
+        # Cellboxes on the antimeridian, whose neighbours wrap around the mesh, are split
+        config = {"region": {"lat_min": -20, "lat_max": 20, "long_min": -180, "long_max": 180,
+                             "start_time": "2000-01-01", "end_time": "2000-12-31",
+                             "cell_width": 20, "cell_height": 20},
+                  "data_sources": [],
+                  "splitting": {"split_depth": 1, "minimum_datapoints": 5}}
+        env_mesh = MeshBuilder(config).build_environmental_mesh()
+        env_mesh = EnvironmentMesh.load_from_json(json.loads(json.dumps(env_mesh.to_json())))
+        rng = np.random.RandomState(1)
+        points = [(lat, long) for lat, long in zip(rng.uniform(-19, 19, 60),
+                                                   np.concatenate([rng.uniform(-180, -170, 30),
+                                                                   rng.uniform(170, 180, 30)]))]
+        self.assert_batch_split_matches(env_mesh, points, 4)
+
+
+class TestMergeMeshes(unittest.TestCase):
+    def build_mesh(self, lat_range, long_range, cell_size):
+        config = {"region": {"lat_min": lat_range[0], "lat_max": lat_range[1],
+                             "long_min": long_range[0], "long_max": long_range[1],
+                             "start_time": "2000-01-01", "end_time": "2000-12-31",
+                             "cell_width": cell_size, "cell_height": cell_size},
+                  "data_sources": [],
+                  "splitting": {"split_depth": 1, "minimum_datapoints": 5}}
+        # Merged meshes are loaded from JSON, as by merge_mesh_cli
+        env_mesh = MeshBuilder(config).build_environmental_mesh()
+        return EnvironmentMesh.load_from_json(json.loads(json.dumps(env_mesh.to_json())))
+
+    def build_tiles(self):
+        # Includes adjacent and overlapping tiles, of different cell sizes
+        return [self.build_mesh([-10, 0], [-10, 0], 2.5),
+                self.build_mesh([0, 10], [-10, 0], 5),
+                self.build_mesh([-5, 5], [-5, 10], 1.25)]
+
+    def test_merge_meshes(self):
+        merged_mesh = self.build_mesh([-20, 20], [-20, 20], 5)
+        for tile in self.build_tiles():
+            merged_mesh.merge_mesh(tile)
+
+        bulk_merged_mesh = self.build_mesh([-20, 20], [-20, 20], 5)
+        bulk_merged_mesh.merge_meshes(self.build_tiles())
+
+        self.assertEqual(bulk_merged_mesh.to_json(), merged_mesh.to_json())
+
+    def test_merge_meshes_incompatible(self):
+        merged_mesh = self.build_mesh([-20, 20], [-20, 20], 5)
+        unmerged_json = json.loads(json.dumps(merged_mesh.to_json()))
+        # Second tile isn't aligned with the cells of the mesh
+        tiles = [self.build_mesh([-10, 0], [-10, 0], 2.5),
+                 self.build_mesh([1, 11], [-10, 0], 5)]
+        with self.assertRaises(AssertionError):
+            merged_mesh.merge_meshes(iter(tiles))
+        # Mesh is left unchanged, rather than with the first tile merged
+        self.assertEqual(json.loads(json.dumps(merged_mesh.to_json())), unmerged_json)
+        # and can still be merged with afterwards
+        merged_mesh.merge_meshes([self.build_mesh([-10, 0], [-10, 0], 2.5)])
+        expected_mesh = self.build_mesh([-20, 20], [-20, 20], 5)
+        expected_mesh.merge_mesh(self.build_mesh([-10, 0], [-10, 0], 2.5))
+        self.assertEqual(merged_mesh.to_json(), expected_mesh.to_json())
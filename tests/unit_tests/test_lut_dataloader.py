@@ -0,0 +1,122 @@
+import unittest
+
+import numpy as np
+import pandas as pd
+from shapely.geometry import box
+
+from meshiphi.dataloaders.lut.abstract_lut import LutDataLoader
+from meshiphi.mesh_generation.boundary import Boundary
+
+
+class ArrayLutDataLoader(LutDataLoader):
+    '''
+    LUT dataloader for polygons already held in memory, passed in the
+    'source' param
+    '''
+    def import_data(self, bounds):
+        return self.source
+
+
+def create_loader(polygons, values, bounds=Boundary([0, 2], [0, 6])):
+    source = pd.DataFrame({'geometry': polygons, 'value': values})
+    return ArrayLutDataLoader(bounds, {'source': source, 'data_name': 'value'})
+
+
+class TestLutValue(unittest.TestCase):
+    '''
+    Mean, median and std dev are weighted by the area of each polygon within bounds
+    '''
+    def setUp(self):
+        # Two neighbouring polygons, with different values
+        self.loader = create_loader([box(0, 0, 2, 2), box(2, 0, 4, 2)], [1., 3.])
+        # A third of the overlap is with the first polygon, two thirds with the second
+        self.bounds = Boundary([0, 2], [1, 4])
+
+    def get_value(self, agg_type, bounds=None):
+        if bounds is None:
+            bounds = self.bounds
+        return self.loader.get_value(bounds, agg_type=agg_type)['value']
+
+    def test_mean(self):
+        self.assertAlmostEqual(self.get_value('MEAN'), 7/3)
+
+    def test_std(self):
+        self.assertAlmostEqual(self.get_value('STD'), np.sqrt(8/9))
+
+    def test_median(self):
+        median = self.get_value('MEDIAN')
+        self.assertNotIsInstance(median, pd.Series)
+        self.assertEqual(median, 3.)
+        self.assertEqual(self.get_value('MEDIAN', Boundary([0, 2], [0, 3])), 1.)
+
+    def test_only_touching(self):
+        # Polygons only touching bounds are weighted equally
+        self.assertEqual(self.get_value('COUNT', Boundary([0, 2], [4, 6])), 1)
+        self.assertAlmostEqual(self.get_value('MEAN', Boundary([0, 2], [4, 6])), 3.)
+
+    def test_no_data(self):
+        self.assertTrue(np.isnan(self.get_value('MEAN', Boundary([0, 2], [5, 6]))))
+
+
+class TestLutTrim(unittest.TestCase):
+    '''
+    Trimming a subset of self.data with the spatial index of self.data must
+    be the same as trimming it with a spatial index of its own
+    '''
+    def setUp(self):
+        rng = np.random.RandomState(0)
+        # Grid of square polygons
+        polygons = [box(long, lat, long + 1, lat + 1)
+                    for lat in range(0, 10) for long in range(0, 10)]
+        self.loader = create_loader(polygons, rng.rand(len(polygons)),
+                                    bounds=Boundary([0, 10], [0, 10]))
+        self.bounds = [Boundary([lat, lat + size], [long, long + size])
+                       for lat in np.arange(0, 10, 1.5) for long in np.arange(0, 10, 1.5)
+                       for size in [0.5, 1., 2.5]]
+        self.splitting_conds = {'boundary': True, 'split_lock': False}
+
+    def assert_trim_equal(self, data):
+        # A copy with its own geometries is never a subset of self.data
+        separate = data.copy()
+        separate['geometry'] = [box(*polygon.bounds) for polygon in separate['geometry']]
+        for bounds in self.bounds:
+            trimmed, positions = self.loader.trim_with_positions(bounds, data=data)
+            expected, separate_positions = self.loader.trim_with_positions(bounds, data=separate)
+            self.assertIsNotNone(positions)
+            self.assertIsNone(separate_positions)
+            pd.testing.assert_frame_equal(trimmed.drop(columns='geometry'),
+                                          expected.drop(columns='geometry'))
+            np.testing.assert_array_equal(self.loader.data.index[positions], trimmed.index)
+            self.assertEqual(self.loader.get_hom_condition(bounds, self.splitting_conds, data=data),
+                             self.loader.get_hom_condition(bounds, self.splitting_conds, data=separate))
+
+    def test_subset(self):
+        data = self.loader.data
+        self.assert_trim_equal(data.iloc[np.random.RandomState(1).permutation(len(data))[:40]])
+
+    def test_empty_subset(self):
+        for bounds in self.bounds:
+            trimmed, positions = self.loader.trim_with_positions(bounds, data=self.loader.data.iloc[[]])
+            self.assertEqual(len(trimmed), 0)
+            self.assertEqual(len(positions), 0)
+
+    def test_separate_data(self):
+        # Labels of self.data, but different polygons
+        data = pd.DataFrame({'geometry': [box(0, 0, 1, 1), box(5, 5, 6, 6)],
+                             'value': [5., 6.]})
+        trimmed, positions = self.loader.trim_with_positions(Boundary([5, 6], [5, 6]), data=data)
+        self.assertIsNone(positions)
+        self.assertEqual(list(trimmed['value']), [6.])
+        self.assertEqual(self.loader.get_value(Boundary([5.2, 5.8], [5.2, 5.8]), data=data),
+                         {'value': 6.})
+
+    def test_replaced_data(self):
+        subset = self.loader.data.iloc[:50]
+        self.assertIsNotNone(self.loader.get_subset_positions(subset))
+        self.loader.data = self.loader.data.copy()
+        self.loader.data['geometry'] = [box(*polygon.bounds) for polygon in self.loader.data['geometry']]
+        self.assertIsNone(self.loader.get_subset_positions(subset))
+
+
+if __name__ == '__main__':
+    unittest.main()
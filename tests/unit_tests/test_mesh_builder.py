@@ -1,9 +1,14 @@
 
 import unittest
 import json
+import copy
+import numpy as np
 from meshiphi.mesh_generation.environment_mesh import EnvironmentMesh
 from meshiphi.mesh_generation.mesh_builder import MeshBuilder
 from meshiphi.mesh_generation.direction import Direction
+from meshiphi.mesh_generation.neighbour_graph import NeighbourGraph
+from meshiphi.mesh_generation.cellbox import CellBox
+from meshiphi.utils import longitude_domain
 
 from meshiphi.mesh_generation.boundary import Boundary
 class TestMeshBuilder(unittest.TestCase):
@@ -43,4 +48,147 @@ class TestMeshBuilder(unittest.TestCase):
     
     
       self.assertEqual (self.mesh_builder.neighbour_graph.get_neighbour_case(self.mesh_builder.mesh.cellboxes[1] , self.mesh_builder.mesh.cellboxes[72]) , Direction.north_west)
-      self.assertEqual (self.mesh_builder.neighbour_graph.get_neighbour_case(self.mesh_builder.mesh.cellboxes[1] , self.mesh_builder.mesh.cellboxes[74]) , Direction.north_east)
\ No newline at end of file
+      self.assertEqual (self.mesh_builder.neighbour_graph.get_neighbour_case(self.mesh_builder.mesh.cellboxes[1] , self.mesh_builder.mesh.cellboxes[74]) , Direction.north_east)
+
+   def test_cellbox_store (self):
+      mesh = self.mesh_builder.mesh
+      # leaf cellboxes are the cellboxes that were not split and replaced
+      leaves = [cellbox for cellbox in mesh.cellboxes if cellbox is not None]
+      self.assertEqual (mesh.get_leaf_cellboxes() , leaves)
+      for cellbox in leaves:
+         self.assertEqual (mesh.get_cellbox_index(cellbox) , int(cellbox.get_id()))
+      # each split cellbox is replaced by 4 children holding consecutive ids
+      for indx, cellbox in enumerate(mesh.cellboxes):
+         children = mesh.get_children(indx)
+         if cellbox is None:
+            self.assertEqual (len(children) , 4)
+            self.assertEqual (children , list(range(children[0], children[0] + 4)))
+         else:
+            self.assertEqual (children , [])
+
+
+   def test_split_breadth_first (self):
+      config = copy.deepcopy(self.config)
+      config['splitting']['split_mode'] = 'breadth_first'
+      config['splitting']['split_depth'] = 2
+      config['region'].update({'lat_min': -20.0, 'lat_max': 20.0,
+                               'long_min': -40.0, 'long_max': 40.0})
+      mesh_builder = MeshBuilder(config)
+      env_mesh = mesh_builder.build_environmental_mesh()
+
+      leaves = mesh_builder.mesh.get_leaf_cellboxes()
+      self.assertEqual (len(env_mesh.agg_cellboxes) , len(leaves))
+      split_depths = [cellbox.get_split_depth() for cellbox in leaves]
+      self.assertEqual (max(split_depths) , 2)
+      # neighbour graph only contains leaves, and adjacency is symmetric
+      graph = mesh_builder.neighbour_graph.get_graph()
+      self.assertEqual (set(graph.keys()) , set(int(cellbox.get_id()) for cellbox in leaves))
+      for indx in graph:
+         for direction in graph[indx]:
+            for neighbour in graph[indx][direction]:
+               self.assertIn (indx , graph[neighbour][-1*direction])
+
+
+   def test_parallel_aggregation (self):
+      config = copy.deepcopy(self.config)
+      config['splitting']['split_depth'] = 2
+      config['region'].update({'lat_min': -20.0, 'lat_max': 20.0,
+                               'long_min': -40.0, 'long_max': 40.0})
+      serial_mesh = MeshBuilder(copy.deepcopy(config)).build_environmental_mesh()
+      # aggregating with a pool of workers gives the same mesh as serial aggregation
+      for pool in ['process', 'thread']:
+         parallel_mesh = MeshBuilder(copy.deepcopy(config)).build_environmental_mesh(workers=2, pool=pool)
+         self.assertEqual (parallel_mesh.to_json() , serial_mesh.to_json())
+
+   def test_parallel_dataloaders (self):
+      config = copy.deepcopy(self.config)
+      config['splitting']['split_depth'] = 2
+      config['region'].update({'lat_min': -20.0, 'lat_max': 20.0,
+                               'long_min': -40.0, 'long_max': 40.0})
+      serial_mesh = MeshBuilder(copy.deepcopy(config)).build_environmental_mesh()
+      # creating the dataloaders in threads keeps them in the order of the data sources
+      config['parallel'] = {'dataloader_workers': 2}
+      parallel_builder = MeshBuilder(copy.deepcopy(config))
+      loader_names = [source.get_data_loader().data_name
+                      for source in parallel_builder.mesh.cellboxes[0].get_data_source()]
+      self.assertEqual (loader_names , [source.get_data_loader().data_name
+                                        for source in self.mesh_builder.mesh.cellboxes[0].get_data_source()])
+      parallel_mesh = parallel_builder.build_environmental_mesh()
+      self.assertEqual (parallel_mesh.to_json()['cellboxes'] , serial_mesh.to_json()['cellboxes'])
+
+
+def loop_initial_cellboxes(bounds, cell_width, cell_height):
+   # Initial cellboxes as created one at a time, before they were built with array arithmetic
+   cellboxes = []
+   lat_range = np.arange(bounds.get_lat_min(), bounds.get_lat_max(), cell_height)
+   if bounds.get_long_min() < bounds.get_long_max():
+      long_range = np.arange(bounds.get_long_min(), bounds.get_long_max(), cell_width)
+   else:
+      long_range = np.arange(bounds.get_long_min(), bounds.get_long_max() + 360, cell_width)
+   long_range = longitude_domain(long_range)
+   for lat in lat_range:
+      for long in long_range:
+         cell_lat_range = [lat, lat+cell_height]
+         if long + cell_width <= 180: cell_long_range = [long, long+cell_width]
+         else:                        cell_long_range = [long, long+cell_width-360]
+         cell_bounds = Boundary(cell_lat_range, cell_long_range, bounds.get_time_range())
+         cellboxes.append(CellBox(cell_bounds, str(len(cellboxes))))
+   return cellboxes
+
+
+def loop_initial_neighbour_graph(cellboxes, grid_width, is_global_mesh):
+   # Initial neighbour graph as created one cellbox at a time, before it was built with array arithmetic
+   ng = NeighbourGraph()
+   for cellbox in cellboxes:
+      cellbox_indx = cellboxes.index(cellbox)
+      ng.add_node(cellbox_indx, ng.initialise_map(cellbox_indx, grid_width, len(cellboxes)))
+   if is_global_mesh:
+      min_long_cellboxes = cellboxes [::grid_width]
+      max_long_cellboxes = cellboxes [grid_width-1::grid_width]
+      for i in range (0 , len(min_long_cellboxes)):
+         ng.add_neighbour (int (min_long_cellboxes[i].get_id()) , Direction.west, int (max_long_cellboxes[i].get_id()))
+         ng.add_neighbour (int (max_long_cellboxes[i].get_id()) , Direction.east , int (min_long_cellboxes[i].get_id()))
+         if 0<= i < len(min_long_cellboxes)-1:
+            ng.add_neighbour (int (min_long_cellboxes[i].get_id()) , Direction.north_west, int (max_long_cellboxes[i+1].get_id()))
+            ng.add_neighbour (int (max_long_cellboxes[i].get_id()) , Direction.north_east, int (min_long_cellboxes[i+1].get_id()))
+         if 0<i<= len(min_long_cellboxes)-1:
+            ng.add_neighbour (int (min_long_cellboxes[i].get_id()) , Direction.south_west, int (max_long_cellboxes[i-1].get_id()))
+            ng.add_neighbour (int (max_long_cellboxes[i].get_id()) , Direction.south_east, int (min_long_cellboxes[i-1].get_id()))
+   return ng.get_graph()
+
+
+class TestInitialGrid(unittest.TestCase):
+   """
+      The initial cellboxes and neighbour graph built with array arithmetic must be
+      the same as those built one cellbox at a time
+   """
+   def assert_grid_matches_loop(self, lat_range, long_range, cell_width, cell_height, is_global_mesh):
+      config = {"region": {"lat_min": lat_range[0], "lat_max": lat_range[1],
+                           "long_min": long_range[0], "long_max": long_range[1],
+                           "start_time": "2000-01-01", "end_time": "2000-12-31",
+                           "cell_width": cell_width, "cell_height": cell_height},
+                "data_sources": [],
+                "splitting": {"split_depth": 0, "minimum_datapoints": 5}}
+      mesh_builder = MeshBuilder(config)
+      bounds = Boundary.from_json(config)
+      cellboxes = mesh_builder.mesh.cellboxes
+
+      expected_cellboxes = loop_initial_cellboxes(bounds, cell_width, cell_height)
+      self.assertEqual ([cellbox.get_id() for cellbox in cellboxes] ,
+                        [cellbox.get_id() for cellbox in expected_cellboxes])
+      self.assertEqual ([cellbox.get_bounds().get_bounds() + cellbox.get_bounds().get_time_range() for cellbox in cellboxes] ,
+                        [cellbox.get_bounds().get_bounds() + cellbox.get_bounds().get_time_range() for cellbox in expected_cellboxes])
+
+      grid_width = int(np.divide(bounds.get_width(), cell_width))
+      self.assertEqual (mesh_builder.neighbour_graph.is_global_mesh() , is_global_mesh)
+      self.assertEqual (mesh_builder.neighbour_graph.get_graph() ,
+                        loop_initial_neighbour_graph(expected_cellboxes, grid_width, is_global_mesh))
+
+   def test_regional_grid (self):
+      self.assert_grid_matches_loop([-20, 20], [-40, 30], 5, 2.5, False)
+
+   def test_antimeridian_grid (self):
+      self.assert_grid_matches_loop([60, 70], [170, -170], 2, 1, False)
+
+   def test_global_grid (self):
+      self.assert_grid_matches_loop([-80, 80], [-180, 180], 10, 5, True)
@@ -27,9 +27,17 @@ class TestMeshValidator(unittest.TestCase):
              self.assertGreaterEqual (sample[1], ranges[1][0])
 
    def test_validate_mesh(self):
-      distance = self.mesh_validator.validate_mesh()
+      distance = self.mesh_validator.validate_mesh(seed=0)
       print (distance)
       self.assertLess (distance, 0.1)
+
+   def test_sample_on_cellbox_bounds(self):
+      # datapoints on the bounds of cellboxes are skipped from both the data and mesh values
+      cellbox = self.mesh_validator.env_mesh.agg_cellboxes[0]
+      sample = [cellbox.get_bounds().get_lat_max() - 0.05, cellbox.get_bounds().get_long_max() - 0.15]
+      actual_values, mesh_values = self.mesh_validator.get_sample_values(sample)
+      self.assertGreater (len(actual_values), 0)
+      self.assertEqual (len(actual_values), len(mesh_values))
    
 
 
@@ -0,0 +1,96 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+import numpy as np
+import xarray as xr
+from pyproj import Transformer
+
+import meshiphi.dataloaders.reprojection_map as reprojection_map
+from meshiphi.dataloaders.reprojection_map import ReprojectionMap, nearest_index, clear_index_maps
+from meshiphi.dataloaders.data_cache import set_data_cache, get_data_cache
+
+
+# Coarse polar stereographic grid, like AMSR (EPSG:3412)
+X = np.arange(-3950000., 3950000., 100000.) + 50000.
+Y = np.arange(4350000., -3950000., -100000.) - 50000.
+SHAPE = (len(X) + len(Y), len(X) + len(Y))
+
+
+def create_dataset():
+    rng = np.random.RandomState(0)
+    values = rng.rand(2, len(Y), len(X))
+    values[0, :3, :3] = np.nan
+    return xr.Dataset({'SIC': (('time', 'y', 'x'), values),
+                       'polar_stereographic': ((), 0)},
+                      coords={'x': X, 'y': Y, 'time': ['2020-01-01', '2020-01-02']})
+
+
+class TestNearestIndex(unittest.TestCase):
+
+    def test_nearest_index(self):
+        coords = np.array([3., 2., 1., 0.])
+        values = np.array([-0.6, -0.4, 0.4, 0.6, 2.9, 3.4, 3.6, np.nan])
+        np.testing.assert_array_equal(nearest_index(coords, values),
+                                      [-1, 3, 3, 2, 0, 0, -1, -1])
+
+    def test_single_coordinate(self):
+        np.testing.assert_array_equal(nearest_index(np.array([5.]), np.array([4., 5., 100., np.nan])),
+                                      [0, 0, 0, -1])
+
+
+class TestReprojectionMap(unittest.TestCase):
+
+    def setUp(self):
+        clear_index_maps()
+        self.cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.cache_dir)
+        self.addCleanup(set_data_cache, None)
+        self.addCleanup(clear_index_maps)
+
+    def test_apply_matches_brute_force(self):
+        data = create_dataset()
+        index_map = ReprojectionMap.get('EPSG:3412', 'EPSG:4326', X, Y, SHAPE)
+        reprojected = index_map.apply(data, 'x', 'y')
+
+        self.assertEqual(reprojected['SIC'].dims, ('time', 'lat', 'long'))
+        self.assertNotIn('x', reprojected.variables)
+        self.assertTrue((np.diff(reprojected['lat']) > 0).all())
+        self.assertTrue((np.diff(reprojected['long']) > 0).all())
+
+        # Nearest source grid point to each lat/long grid point, one at a time
+        longv, latv = np.meshgrid(reprojected['long'].values, reprojected['lat'].values)
+        xv, yv = Transformer.from_crs('EPSG:4326', 'EPSG:3412', always_xy=True)\
+                            .transform(longv.ravel(), latv.ravel())
+        spacing = X[1] - X[0]
+        expected = np.full((2, len(xv)), np.nan)
+        for i, (x, y) in enumerate(zip(xv, yv)):
+            ix, iy = np.argmin(np.abs(X - x)), np.argmin(np.abs(Y - y))
+            if abs(X[ix] - x) <= spacing / 2 and abs(Y[iy] - y) <= spacing / 2:
+                expected[:, i] = data['SIC'].values[:, iy, ix]
+        np.testing.assert_array_equal(reprojected['SIC'].values.reshape(2, -1), expected)
+
+    def test_cache_round_trip(self):
+        set_data_cache(self.cache_dir)
+        index_map = ReprojectionMap.get('EPSG:3412', 'EPSG:4326', X, Y, SHAPE)
+        self.assertEqual(len(os.listdir(os.path.join(self.cache_dir, 'arrays'))), 1)
+
+        # Read back from disk, rather than memory
+        clear_index_maps()
+        cached_map = ReprojectionMap.get('EPSG:3412', 'EPSG:4326', X, Y, SHAPE)
+        self.assertIsNot(cached_map, index_map)
+        for attr in ['lat', 'long', 'x_index', 'y_index']:
+            np.testing.assert_array_equal(getattr(cached_map, attr), getattr(index_map, attr))
+
+        # A different grid doesn't reuse the map
+        other_map = ReprojectionMap.get('EPSG:3412', 'EPSG:4326', X[1:], Y, SHAPE)
+        self.assertFalse(np.array_equal(other_map.x_index, index_map.x_index))
+
+        get_data_cache().clear()
+        self.assertEqual(os.listdir(os.path.join(self.cache_dir, 'arrays')), [])
+
+    def test_memory_bounded(self):
+        for i in range(reprojection_map.MAX_INDEX_MAPS + 3):
+            ReprojectionMap.get('EPSG:3412', 'EPSG:4326', X + i, Y, (20, 20))
+        self.assertEqual(len(reprojection_map._index_maps), reprojection_map.MAX_INDEX_MAPS)
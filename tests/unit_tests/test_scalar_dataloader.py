@@ -0,0 +1,343 @@
+import os
+import tempfile
+import unittest
+from unittest.mock import patch
+
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+from meshiphi.dataloaders.scalar.abstract_scalar import ScalarDataLoader
+from meshiphi.dataloaders.grid_index import is_lat_sorted
+from meshiphi.mesh_generation.boundary import Boundary
+
+
+class ArrayScalarDataLoader(ScalarDataLoader):
+    '''
+    Scalar dataloader for a dataset already held in memory, passed in the
+    'source' param
+    '''
+    def import_data(self, bounds):
+        return self.source
+
+
+def create_scalar_dataset(time=False):
+    '''
+    Random, global in longitude, scalar field on a regular 1 degree grid,
+    with some NaN datapoints
+    '''
+    rng = np.random.RandomState(0)
+    lat = np.arange(-10., 11.)
+    long = np.arange(-180., 180.)
+    coords = {'lat': lat, 'long': long}
+    shape = (len(lat), len(long))
+    dims = ('lat', 'long')
+    if time:
+        coords['time'] = pd.date_range('2000-01-01', periods=4)
+        shape = (len(coords['time']),) + shape
+        dims = ('time',) + dims
+    values = rng.rand(*shape)
+    values[rng.rand(*shape) < 0.05] = np.nan
+    return xr.Dataset({'dummy': (dims, values)}, coords=coords)
+
+
+def create_loader(source, **params):
+    bounds = Boundary([-10, 10], [-180, 180], ['2000-01-01', '2000-01-04'])
+    # Trim cache disabled, so that each result is calculated from scratch
+    params = {'source': source, 'data_name': 'dummy', 'trim_cache_mb': 0, **params}
+    return ArrayScalarDataLoader(bounds, params)
+
+
+# Cellboxes of all sizes, on and between grid points
+TEST_BOUNDS = [Boundary([lat, lat + size], [long, long + size])
+               for size in [0.5, 1., 2.5, 5.]
+               for lat in np.arange(-10., 10., 2.5)
+               for long in np.arange(-40., 40., 7.5)] + \
+              [Boundary([-10, 10], [-180, 180]),
+               Boundary([-10, 10], [170, -170]),    # Crossing antimeridian
+               Boundary([-5, 5], [179.5, -179.5]),
+               Boundary([-10, -5], [-180, -170]),   # On lat_min and long_min edge of data
+               Boundary([-10.5, -9], [178, 180]),
+               Boundary([9, 12], [-179, -178]),     # Beyond edge of data
+               Boundary([3, 3.5], [3, 3.5])]        # Between grid points
+
+
+class TestTrimDatapoints(unittest.TestCase):
+    '''
+    Trimming by integer slices of the grid must select the same data as
+    trimming by label
+    '''
+    def assert_trim_matches_sel(self, loader, bounds_list):
+        for bounds in bounds_list:
+            trimmed = loader.trim_datapoints(bounds)
+            # Without the grid index, data is trimmed with sel/where
+            with patch.object(loader, 'get_grid_index', return_value=None):
+                expected = loader.trim_datapoints(bounds)
+            if expected['dummy'].size == 0:
+                self.assertEqual(trimmed['dummy'].size, 0, msg=str(bounds))
+                continue
+            xr.testing.assert_equal(trimmed, expected)
+
+    def test_trim(self):
+        loader = create_loader(create_scalar_dataset())
+        self.assertIsNotNone(loader.get_grid_index())
+        self.assert_trim_matches_sel(loader, TEST_BOUNDS)
+
+    def test_trim_time(self):
+        loader = create_loader(create_scalar_dataset(time=True))
+        time_ranges = [['2000-01-01', '2000-01-04'], ['2000-01-02', '2000-01-03']]
+        self.assert_trim_matches_sel(loader, [Boundary([bounds.get_lat_min(), bounds.get_lat_max()],
+                                                       [bounds.get_long_min(), bounds.get_long_max()], time_range)
+                                              for bounds in TEST_BOUNDS[::7] for time_range in time_ranges])
+
+    def test_grid_index_reused(self):
+        loader = create_loader(create_scalar_dataset())
+        grid_index = loader.get_grid_index()
+        loader.trim_datapoints(TEST_BOUNDS[0])
+        self.assertIs(loader.get_grid_index(), grid_index)
+        self.assertIs(loader.get_grid_index(loader.data), grid_index)
+        # Rebuilt if data is replaced
+        loader.data = loader.data.copy()
+        self.assertIsNot(loader.get_grid_index(), grid_index)
+
+
+
+
+class TestLatSortedTrim(unittest.TestCase):
+    '''
+    Trimming point data sorted by latitude with a binary search must select
+    the same rows as masking every row
+    '''
+    def create_points(self, time=False):
+        rng = np.random.RandomState(3)
+        num_points = 5000
+        # Coordinates rounded so that many points are on boundary edges
+        data = pd.DataFrame({'lat': np.round(rng.uniform(-10, 10, num_points) * 2) / 2,
+                             'long': np.round(rng.uniform(-180, 180, num_points) * 2) / 2,
+                             'dummy': rng.rand(num_points)})
+        if time:
+            data['time'] = pd.Timestamp('2000-01-01') + \
+                           pd.to_timedelta(rng.randint(0, 4, num_points), unit='D')
+        return data
+
+    def assert_trim_matches_mask(self, loader, bounds_list):
+        self.assertTrue(is_lat_sorted(loader.data))
+        for bounds in bounds_list:
+            trimmed = loader.trim_datapoints(bounds)
+            # Trimmed data is still sorted, so can be trimmed again by cellboxes
+            self.assertTrue(is_lat_sorted(trimmed))
+            with patch('meshiphi.dataloaders.scalar.abstract_scalar.is_lat_sorted', return_value=False):
+                expected = loader.trim_datapoints(bounds)
+            pd.testing.assert_frame_equal(trimmed, expected)
+
+    def test_trim(self):
+        loader = create_loader(self.create_points())
+        self.assert_trim_matches_mask(loader, TEST_BOUNDS)
+        # Rows stay in order of latitude
+        sorted_lat = loader.trim_datapoints(TEST_BOUNDS[-1])['lat']
+        self.assertTrue(sorted_lat.is_monotonic_increasing)
+
+    def test_trim_time(self):
+        loader = create_loader(self.create_points(time=True))
+        time_ranges = [['2000-01-01', '2000-01-04'], ['2000-01-02', '2000-01-03']]
+        self.assert_trim_matches_mask(loader, [Boundary([bounds.get_lat_min(), bounds.get_lat_max()],
+                                                        [bounds.get_long_min(), bounds.get_long_max()], time_range)
+                                               for bounds in TEST_BOUNDS[::7] for time_range in time_ranges])
+
+    def test_trim_subset(self):
+        # Cellboxes trim from the data already trimmed to their parent
+        loader = create_loader(self.create_points())
+        parent = loader.trim_datapoints(Boundary([-10, 0], [-40, 0]))
+        for bounds in TEST_BOUNDS:
+            trimmed = loader.trim_datapoints(bounds, data=parent)
+            with patch('meshiphi.dataloaders.scalar.abstract_scalar.is_lat_sorted', return_value=False):
+                expected = loader.trim_datapoints(bounds, data=parent)
+            pd.testing.assert_frame_equal(trimmed, expected)
+
+
+class TestHomTables(unittest.TestCase):
+    '''
+    Homogeneity conditions from summed-area tables must be the same as
+    those found from the data within each boundary
+    '''
+    def setUp(self):
+        self.splitting_conds = [{'threshold': threshold, 'upper_bound': 0.85, 'lower_bound': 0.15,
+                                 'split_lock': split_lock}
+                                for threshold in [0.1, 0.5, 0.9] for split_lock in [False, True]]
+
+    def assert_hom_matches_data(self, source, bounds_list):
+        loader = create_loader(source, min_dp=5, hom_tables=True)
+        # Trim cache enabled, so that the data passed in is the loader's own trim
+        cached = create_loader(source, min_dp=5, hom_tables=True, trim_cache_mb=64)
+        reference = create_loader(source, min_dp=5)
+        self.assertIsNotNone(loader.get_hom_tables(bounds_list[0], 0.5))
+        self.assertIsNone(reference.get_hom_tables(bounds_list[0], 0.5))
+        hom_types = set()
+        for bounds in bounds_list:
+            for conds in self.splitting_conds:
+                expected = reference.get_hom_condition(bounds, conds)
+                hom_types.add(expected)
+                self.assertEqual(loader.get_hom_condition(bounds, conds), expected, msg=str(bounds))
+                # Data within bounds passed in, as by cellboxes
+                self.assertEqual(cached.get_hom_condition(bounds, conds, data=cached.trim_datapoints(bounds)),
+                                 expected, msg=str(bounds))
+        # Every condition is tested
+        self.assertEqual(hom_types, {'CLR', 'HOM', 'HET'})
+
+    def test_hom_condition(self):
+        self.assert_hom_matches_data(create_scalar_dataset(), TEST_BOUNDS)
+
+    def test_hom_condition_time(self):
+        self.assert_hom_matches_data(create_scalar_dataset(time=True), 
+                                     [Boundary([bounds.get_lat_min(), bounds.get_lat_max()],
+                                               [bounds.get_long_min(), bounds.get_long_max()],
+                                               ['2000-01-01', '2000-01-04'])
+                                      for bounds in TEST_BOUNDS])
+
+    def test_other_data(self):
+        # Tables are only used for the loader's own trim, not other data of the same size
+        loader = create_loader(create_scalar_dataset(), min_dp=5, hom_tables=True, trim_cache_mb=64)
+        bounds = Boundary([-5, 5], [-5, 5])
+        conds = {'threshold': 0.5, 'upper_bound': 0.85, 'lower_bound': 0.15, 'split_lock': False}
+        trimmed = loader.trim_datapoints(bounds)
+        self.assertEqual(loader.get_hom_condition(bounds, dict(conds), data=trimmed), 'HET')
+        other = trimmed.copy(deep=True)
+        other['dummy'][:] = 1.
+        self.assertEqual(loader.get_hom_condition(bounds, dict(conds), data=other), 'CLR')
+
+    def test_disabled_by_default(self):
+        loader = create_loader(create_scalar_dataset())
+        self.assertIsNone(loader.get_hom_tables(TEST_BOUNDS[0], 0.5))
+
+    def test_partial_time(self):
+        # Tables sum over all time, so can't be used for part of it
+        loader = create_loader(create_scalar_dataset(time=True), hom_tables=True)
+        self.assertIsNone(loader.get_hom_tables(Boundary([-10, 10], [-10, 10], ['2000-01-02', '2000-01-03']), 0.5))
+
+
+
+
+class TestAggTables(unittest.TestCase):
+    '''
+    Values aggregated from summed-area and sparse tables must be the same
+    as those aggregated from the data within each boundary
+    '''
+    def assert_values_match_data(self, source, bounds_list):
+        loader = create_loader(source, agg_tables=True)
+        # Trim cache enabled, so that the data passed in is the loader's own trim
+        cached = create_loader(source, agg_tables=True, trim_cache_mb=64)
+        reference = create_loader(source)
+        for agg_type in ['MIN', 'MAX', 'MEAN', 'STD', 'RMSE', 'COUNT']:
+            self.assertIsNotNone(loader.get_value_from_tables(bounds_list[0], agg_type, True))
+            # Rounding error of the summed variance is magnified by the square
+            # root when the std dev is close to 0
+            atol = 1e-6 if agg_type in ['STD', 'RMSE'] else 1e-12
+            for skipna in [True, False]:
+                for bounds in bounds_list:
+                    expected = reference.get_value(bounds, agg_type=agg_type, skipna=skipna)['dummy']
+                    value = loader.get_value(bounds, agg_type=agg_type, skipna=skipna)['dummy']
+                    np.testing.assert_allclose(value, expected, rtol=1e-9, atol=atol,
+                                               err_msg=f'{agg_type} in {bounds}, skipna={skipna}')
+                    # Data within bounds passed in, as by cellboxes
+                    value = cached.get_value(bounds, data=cached.trim_datapoints(bounds), 
+                                             agg_type=agg_type, skipna=skipna)['dummy']
+                    np.testing.assert_allclose(value, expected, rtol=1e-9, atol=atol,
+                                               err_msg=f'{agg_type} in {bounds}, skipna={skipna}')
+
+    def test_values(self):
+        data = create_scalar_dataset()
+        # Region without any data
+        data['dummy'][:5, 170:190] = np.nan
+        self.assert_values_match_data(data, TEST_BOUNDS + [Boundary([-10, -7], [-10, 5])])
+
+    def test_values_time(self):
+        self.assert_values_match_data(create_scalar_dataset(time=True), 
+                                      [Boundary([bounds.get_lat_min(), bounds.get_lat_max()],
+                                                [bounds.get_long_min(), bounds.get_long_max()],
+                                                ['2000-01-01', '2000-01-04'])
+                                       for bounds in TEST_BOUNDS[::3]])
+
+    def test_other_data(self):
+        # Tables are only used for the loader's own trim, not other data of the same size
+        loader = create_loader(create_scalar_dataset(), agg_tables=True, trim_cache_mb=64)
+        bounds = Boundary([-5, 5], [-5, 5])
+        trimmed = loader.trim_datapoints(bounds)
+        self.assertIsNotNone(loader.get_value_from_tables(bounds, 'MEAN', True, data=trimmed))
+        other = trimmed.copy(deep=True)
+        other['dummy'][:] = 1.
+        self.assertIsNone(loader.get_value_from_tables(bounds, 'MEAN', True, data=other))
+        self.assertEqual(loader.get_value(bounds, data=other)['dummy'], 1.)
+
+    def test_median_not_from_tables(self):
+        loader = create_loader(create_scalar_dataset(), agg_tables=True)
+        self.assertIsNone(loader.get_value_from_tables(TEST_BOUNDS[0], 'MEDIAN', True))
+
+
+
+class FileScalarDataLoader(ScalarDataLoader):
+    '''
+    Scalar dataloader for NetCDF files, passed in the 'paths' param
+    '''
+    def import_data(self, bounds):
+        return self.open_dataset(self.paths)
+
+
+class TestChunks(unittest.TestCase):
+    '''
+    Data opened lazily in chunks must give the same results as data loaded
+    into memory
+    '''
+    def setUp(self):
+        self.directory = tempfile.TemporaryDirectory()
+        data = create_scalar_dataset(time=True)
+        self.paths = []
+        # Split over two files along time, to be opened as one dataset
+        for i, time_slice in enumerate([slice(0, 2), slice(2, 4)]):
+            path = os.path.join(self.directory.name, f'dummy_{i}.nc')
+            data.isel(time=time_slice).to_netcdf(path)
+            self.paths.append(path)
+        self.bounds = [Boundary([bounds.get_lat_min(), bounds.get_lat_max()],
+                                [bounds.get_long_min(), bounds.get_long_max()], time_range)
+                       for bounds in TEST_BOUNDS[::5] 
+                       for time_range in [['2000-01-01', '2000-01-04'], ['2000-01-02', '2000-01-03']]]
+
+    def tearDown(self):
+        self.directory.cleanup()
+
+    def create_loader(self, paths, chunks):
+        bounds = Boundary([-10, 10], [-180, 180], ['2000-01-01', '2000-01-04'])
+        params = {'paths': paths, 'data_name': 'dummy', 'trim_cache_mb': 0, 
+                  'chunks': chunks, 'agg_tables': True}
+        return FileScalarDataLoader(bounds, params)
+
+    def assert_lazy_matches_loaded(self, paths, chunks):
+        lazy = self.create_loader(paths, chunks)
+        loaded = self.create_loader(paths, None)
+        self.assertIsNotNone(lazy.data['dummy'].chunks)
+        splitting_conds = {'threshold': 0.5, 'upper_bound': 0.85, 'lower_bound': 0.15, 'split_lock': False}
+        for bounds in self.bounds:
+            xr.testing.assert_equal(lazy.trim_datapoints(bounds).compute(), 
+                                    loaded.trim_datapoints(bounds).compute())
+            for agg_type in ['MIN', 'MAX', 'MEAN', 'MEDIAN', 'STD', 'COUNT']:
+                np.testing.assert_allclose(lazy.get_value(bounds, agg_type=agg_type)['dummy'],
+                                           loaded.get_value(bounds, agg_type=agg_type)['dummy'],
+                                           atol=1e-6, err_msg=f'{agg_type} in {bounds}')
+            self.assertEqual(lazy.get_hom_condition(bounds, splitting_conds),
+                             loaded.get_hom_condition(bounds, splitting_conds), msg=str(bounds))
+        # Tables span the whole grid, so aren't built for lazily loaded data
+        self.assertIsNone(lazy.get_hom_tables(self.bounds[0], 0.5))
+        self.assertIsNone(lazy.get_value_from_tables(self.bounds[0], 'MEAN', True))
+
+    def test_file_chunks(self):
+        # Chunked as stored in the file
+        self.assert_lazy_matches_loaded(self.paths[:1], {})
+
+    def test_rechunked(self):
+        self.assert_lazy_matches_loaded(self.paths[:1], {'lat': 5, 'long': 50})
+
+    def test_multiple_files(self):
+        self.assert_lazy_matches_loaded(self.paths, {'time': 1, 'lat': 10, 'long': 100})
+
+
+if __name__ == '__main__':
+    unittest.main()
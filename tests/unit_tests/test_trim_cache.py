@@ -0,0 +1,181 @@
+import unittest
+
+import numpy as np
+import xarray as xr
+
+from meshiphi.dataloaders.trim_cache import TrimCache, boundary_key, boundary_key_contains
+from meshiphi.dataloaders.scalar.abstract_scalar import ScalarDataLoader
+from meshiphi.mesh_generation.boundary import Boundary
+
+
+class ArrayScalarDataLoader(ScalarDataLoader):
+    '''
+    Scalar dataloader for a dataset already held in memory, passed in the
+    'source' param
+    '''
+    def import_data(self, bounds):
+        return self.source
+
+
+def create_bounds(i):
+    return Boundary([i, i + 1], [0, 1])
+
+
+class TestTrimCache(unittest.TestCase):
+
+    def setUp(self):
+        # Room for two arrays of 100 float64's
+        self.cache = TrimCache(2 * 800)
+
+    def test_get_put(self):
+        self.assertIsNone(self.cache.get('value', create_bounds(0)))
+        self.cache.put('value', create_bounds(0), 1.)
+        self.assertEqual(self.cache.get('value', create_bounds(0)), 1.)
+        # Entries are separated by kind and args as well as boundary
+        self.assertIsNone(self.cache.get('hom_condition', create_bounds(0)))
+        self.assertIsNone(self.cache.get('value', create_bounds(0), ('MAX',)))
+        self.assertIsNone(self.cache.get('value', create_bounds(1)))
+        self.assertEqual(self.cache.info()['hits'], 1)
+        self.assertEqual(self.cache.info()['misses'], 4)
+
+    def test_boundary_key(self):
+        bounds = Boundary([0, 1], [0, 1], ['2000-01-01', '2000-01-31'])
+        other_time = Boundary([0, 1], [0, 1], ['2000-01-01', '2000-02-28'])
+        self.assertEqual(boundary_key(bounds), boundary_key(Boundary([0, 1], [0, 1], ['2000-01-01', '2000-01-31'])))
+        self.assertNotEqual(boundary_key(bounds), boundary_key(other_time))
+
+    def test_boundary_key_contains(self):
+        outer = boundary_key(Boundary([0, 10], [0, 10], ['2000-01-01', '2000-01-31']))
+        self.assertTrue(boundary_key_contains(outer, boundary_key(Boundary([0, 5], [5, 10], ['2000-01-01', '2000-01-15']))))
+        self.assertFalse(boundary_key_contains(outer, boundary_key(Boundary([0, 5], [5, 11], ['2000-01-01', '2000-01-15']))))
+        self.assertFalse(boundary_key_contains(outer, boundary_key(Boundary([0, 5], [5, 10], ['2000-01-01', '2000-02-15']))))
+        # Antimeridian crossing boundaries are only contained by themselves
+        crossing = boundary_key(Boundary([0, 10], [170, -170]))
+        self.assertTrue(boundary_key_contains(crossing, crossing))
+        self.assertFalse(boundary_key_contains(crossing, boundary_key(Boundary([0, 10], [175, 180]))))
+
+    def test_eviction(self):
+        for i in range(3):
+            self.cache.put('trim', create_bounds(i), np.zeros(100))
+            # Most recently used entries are kept
+            self.cache.get('trim', create_bounds(0))
+        self.assertEqual(len(self.cache), 2)
+        self.assertIsNotNone(self.cache.get('trim', create_bounds(0)))
+        self.assertIsNone(self.cache.get('trim', create_bounds(1)))
+        self.assertIsNotNone(self.cache.get('trim', create_bounds(2)))
+
+    def test_memory_cap(self):
+        for i in range(10):
+            self.cache.put('trim', create_bounds(i), np.zeros(10 * (i + 1)))
+            self.assertLessEqual(self.cache.nbytes, self.cache.max_bytes)
+        self.assertEqual(self.cache.nbytes, sum(value.nbytes for value, _ in self.cache._entries.values()))
+        # Values larger than the cap, or None, are never cached
+        self.cache.put('trim', create_bounds(10), np.zeros(201))
+        self.cache.put('value', create_bounds(11), None)
+        self.assertIsNone(self.cache.get('trim', create_bounds(10)))
+        self.assertIsNone(self.cache.get('value', create_bounds(11)))
+        # Replacing an entry frees the memory of the old one
+        self.cache.clear()
+        self.cache.put('trim', create_bounds(0), np.zeros(100))
+        self.cache.put('trim', create_bounds(0), np.zeros(50))
+        self.assertEqual(self.cache.nbytes, 400)
+        self.assertEqual(self.cache.info(), {'hits': 0, 'misses': 0, 'entries': 1,
+                                             'nbytes': 400, 'max_bytes': 1600})
+
+    def test_contains_trim(self):
+        trims = [np.zeros(100) for _ in range(3)]
+        self.cache.put('trim', create_bounds(0), trims[0])
+        self.cache.put('value', create_bounds(0), trims[1])
+        self.assertTrue(self.cache.contains_trim(trims[0]))
+        # Only trims are recognised, and only the cached object itself
+        self.assertFalse(self.cache.contains_trim(trims[1]))
+        self.assertFalse(self.cache.contains_trim(trims[0].copy()))
+        # Not recognised once evicted or replaced
+        self.cache.put('trim', create_bounds(1), trims[2])
+        self.cache.put('trim', create_bounds(2), np.zeros(100))
+        self.assertFalse(self.cache.contains_trim(trims[0]))
+        self.cache.put('trim', create_bounds(2), np.zeros(100))
+        self.cache.put('trim', create_bounds(1), np.zeros(100))
+        self.assertFalse(self.cache.contains_trim(trims[2]))
+        self.cache.clear()
+        self.assertEqual(len(self.cache._trim_ids), 0)
+
+
+class TestLoaderTrimCache(unittest.TestCase):
+
+    def setUp(self):
+        lat = np.arange(0., 10.)
+        long = np.arange(0., 10.)
+        self.data = xr.Dataset({'dummy': (('lat', 'long'), np.random.RandomState(0).rand(10, 10))},
+                               coords={'lat': lat, 'long': long})
+
+    def create_loader(self, trim_cache_mb):
+        params = {'source': self.data, 'data_name': 'dummy', 'trim_cache_mb': trim_cache_mb}
+        return ArrayScalarDataLoader(Boundary([0, 9], [0, 9]), params)
+
+    def test_trim_cache_info(self):
+        loader = self.create_loader(1)
+        bounds = Boundary([2, 5], [2, 5])
+        trimmed = loader.trim_datapoints(bounds)
+        self.assertIs(loader.trim_datapoints(bounds), trimmed)
+        info = loader.trim_cache_info()
+        self.assertEqual((info['hits'], info['misses'], info['entries']), (1, 1, 1))
+        self.assertEqual(info['max_bytes'], 1024**2)
+        # Only data trimmed by the cache, or the whole dataset, can use it
+        cache = loader.get_trim_cache()
+        self.assertIs(loader.get_trim_cache(trimmed, bounds), cache)
+        self.assertIsNone(loader.get_trim_cache(trimmed.copy(), bounds))
+        # Derived values need the trim for exactly their bounds, trims only
+        # need data containing their bounds
+        inner = Boundary([3, 4], [3, 4])
+        self.assertIsNone(loader.get_trim_cache(trimmed, inner))
+        self.assertIs(loader.get_trim_cache(trimmed, inner, exact=False), cache)
+        self.assertIsNone(loader.get_trim_cache(trimmed, Boundary([3, 6], [3, 4]), exact=False))
+        self.assertIs(loader.get_trim_cache(loader.data, inner, exact=False), cache)
+        self.assertIsNone(loader.get_trim_cache(loader.data, inner))
+        self.assertTrue(loader.is_trim_of(trimmed, bounds))
+        self.assertFalse(loader.is_trim_of(trimmed, inner))
+        # Emptied if the data is replaced
+        loader.data = loader.data.copy()
+        self.assertEqual(loader.trim_cache_info()['entries'], 0)
+
+    def test_values_keyed_on_data(self):
+        loader = self.create_loader(1)
+        bounds = Boundary([4, 7], [4, 7])
+        other_trim = loader.trim_datapoints(Boundary([5, 8], [5, 8]))
+        # Value of data trimmed to other bounds isn't cached under bounds
+        value = loader.get_value(bounds, data=other_trim)['dummy']
+        self.assertEqual(value, float(other_trim['dummy'].sel(lat=[6, 7], long=[6, 7]).mean()))
+        uncached = self.create_loader(0)
+        self.assertEqual(loader.get_value(bounds), uncached.get_value(bounds))
+        xr.testing.assert_identical(loader.trim_datapoints(bounds), uncached.trim_datapoints(bounds))
+        conds = {'threshold': 0.5, 'upper_bound': 0.9, 'lower_bound': 0.1}
+        loader.get_hom_condition(bounds, dict(conds), data=other_trim)
+        self.assertEqual(loader.get_hom_condition(bounds, dict(conds)),
+                         uncached.get_hom_condition(bounds, dict(conds)))
+
+    def test_trims_not_modified(self):
+        loader = self.create_loader(1)
+        uncached = self.create_loader(0)
+        bounds = Boundary([2, 8], [2, 8])
+        trimmed = loader.trim_datapoints(bounds)
+        conds = {'threshold': 0.5, 'upper_bound': 0.9, 'lower_bound': 0.1}
+        loader.get_value(bounds, data=trimmed)
+        loader.get_hom_condition(bounds, dict(conds), data=trimmed)
+        for child_bounds in [Boundary([2, 5], [2, 5]), Boundary([5, 8], [5, 8])]:
+            child = loader.trim_datapoints(child_bounds, data=trimmed)
+            loader.get_value(child_bounds, agg_type='MAX', data=child)
+            loader.get_hom_condition(child_bounds, dict(conds), data=child)
+            xr.testing.assert_identical(child, uncached.trim_datapoints(child_bounds))
+        # Cached trims and the dataset are left as they were trimmed
+        xr.testing.assert_identical(trimmed, uncached.trim_datapoints(bounds))
+        xr.testing.assert_identical(loader.data, uncached.data)
+
+    def test_disabled(self):
+        loader = self.create_loader(0)
+        self.assertIsNone(loader.get_trim_cache())
+        self.assertIsNone(loader.trim_cache_info())
+
+
+if __name__ == '__main__':
+    unittest.main()
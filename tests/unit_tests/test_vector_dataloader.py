@@ -0,0 +1,147 @@
+import unittest
+import time
+from unittest.mock import patch
+
+import numpy as np
+import pandas as pd
+import xarray as xr
+
+from meshiphi.dataloaders.vector.abstract_vector import VectorDataLoader
+from meshiphi.mesh_generation.boundary import Boundary
+
+
+class ArrayVectorDataLoader(VectorDataLoader):
+    '''
+    Vector dataloader for a dataset already held in memory, passed in the
+    'source' param
+    '''
+    def import_data(self, bounds):
+        return self.source
+
+
+def create_vector_dataset(lat_step=1., long_step=2.):
+    '''
+    Smoothly varying, global in longitude, vector field on a regular grid
+    '''
+    rng = np.random.RandomState(0)
+    lat = np.arange(-10., 10. + lat_step, lat_step)
+    long = np.arange(-180., 180., long_step)
+    latv, longv = np.meshgrid(lat, long, indexing='ij')
+    u = np.sin(np.radians(3*longv)) * np.cos(np.radians(9*latv)) + 0.1*rng.rand(*latv.shape)
+    v = np.cos(np.radians(5*longv)) + 0.1*rng.rand(*latv.shape)
+    return xr.Dataset({'u': (('lat', 'long'), u), 'v': (('lat', 'long'), v)},
+                      coords={'lat': lat, 'long': long})
+
+
+def create_loader(source):
+    bounds = Boundary([-10, 10], [-180, 180])
+    # Trim cache disabled, so that each result is calculated from scratch
+    params = {'source': source, 'data_name': 'u,v', 'trim_cache_mb': 0}
+    return ArrayVectorDataLoader(bounds, params)
+
+
+def quadtree_bounds(bounds, depth):
+    '''
+    Bounds of a cellbox and all of its descendants, split to a given depth
+    '''
+    all_bounds = [bounds]
+    if depth == 0:
+        return all_bounds
+    lat_mid = (bounds.get_lat_min() + bounds.get_lat_max()) / 2
+    long_mid = (bounds.get_long_min() + bounds.get_long_max()) / 2
+    for lat_range in [[bounds.get_lat_min(), lat_mid], [lat_mid, bounds.get_lat_max()]]:
+        for long_range in [[bounds.get_long_min(), long_mid], [long_mid, bounds.get_long_max()]]:
+            all_bounds += quadtree_bounds(Boundary(lat_range, long_range), depth - 1)
+    return all_bounds
+
+
+class TestTrimDatapoints(unittest.TestCase):
+    '''
+    Trimming by integer slices of the grid must select the same data as
+    trimming by label
+    '''
+    def test_trim(self):
+        loader = create_loader(create_vector_dataset())
+        grid_index = loader.get_grid_index()
+        self.assertIsNotNone(grid_index)
+        all_bounds = quadtree_bounds(Boundary([-10, 10], [-40, 40]), 2) + \
+                     [Boundary([-10, 10], [170, -170]),    # Crossing antimeridian
+                      Boundary([-10, -5], [-180, -170]),   # On lat_min and long_min edge of data
+                      Boundary([-10.5, -9], [176, 180]),
+                      Boundary([3, 3.5], [3, 3.5])]        # Between grid points
+        for bounds in all_bounds:
+            trimmed = loader.trim_datapoints(bounds)
+            # Without the grid index, data is trimmed with sel/where
+            with patch.object(loader, 'get_grid_index', return_value=None):
+                expected = loader.trim_datapoints(bounds)
+            if expected['u'].size == 0:
+                self.assertEqual(trimmed['u'].size, 0, msg=str(bounds))
+                continue
+            xr.testing.assert_equal(trimmed, expected)
+        self.assertIs(loader.get_grid_index(), grid_index)
+
+
+class TestVectorField(unittest.TestCase):
+    '''
+    Curl and dmag sliced from the grid of the whole dataset must be the same
+    as those calculated from the data within each cellbox
+    '''
+    def setUp(self):
+        self.bounds = quadtree_bounds(Boundary([-10, 10], [-40, 40]), 3) + \
+                      [Boundary([-10, 10], [170, -170]),    # Crossing antimeridian
+                       Boundary([-5, 5], [178, -178]),
+                       Boundary([-10, -5], [-180, -170]),   # Edge of the data
+                       Boundary([5, 10], [170, 180])]
+        self.splitting_conds = [{'curl': {'threshold': 0.01, 'upper_bound': 0.9, 'lower_bound': 0.1}},
+                                {'dmag': {'threshold': 0.3, 'upper_bound': 0.9, 'lower_bound': 0.1}}]
+
+    def assert_matches_per_cell(self, loader):
+        for bounds in self.bounds:
+            data = loader.trim_datapoints(bounds)
+            fast = {'curl': loader.calc_curl(bounds, data=data, collapse=False),
+                    'dmag': loader.calc_dmag(bounds, data=data, collapse=False),
+                    'hom': [loader.get_hom_condition(bounds, conds, data=data)
+                            for conds in self.splitting_conds]}
+            # Without the grid, vectors are gridded from the data within bounds
+            with patch.object(loader, 'get_vector_field', return_value=None):
+                per_cell = {'curl': loader.calc_curl(bounds, data=data, collapse=False),
+                            'dmag': loader.calc_dmag(bounds, data=data, collapse=False),
+                            'hom': [loader.get_hom_condition(bounds, conds, data=data)
+                                    for conds in self.splitting_conds]}
+            np.testing.assert_allclose(fast['curl'], per_cell['curl'], err_msg=f'curl in {bounds}')
+            # Sliced from the grid, dmag is NaN where points are missing from it, 
+            # and is in grid rather than row order
+            def non_nan_sorted(dmag):
+                dmag = np.atleast_1d(dmag)
+                return np.sort(dmag[~np.isnan(dmag)])
+            np.testing.assert_allclose(non_nan_sorted(fast['dmag']), non_nan_sorted(per_cell['dmag']),
+                                       err_msg=f'dmag in {bounds}')
+            self.assertEqual(fast['hom'], per_cell['hom'], msg=str(bounds))
+
+    def test_xr_matches_per_cell(self):
+        loader = create_loader(create_vector_dataset())
+        self.assertIsNotNone(loader.get_vector_field(self.bounds[0]))
+        self.assert_matches_per_cell(loader)
+
+    def test_df_matches_per_cell(self):
+        data = create_vector_dataset().to_dataframe().reset_index()
+        # Points missing from the grid
+        data = data.drop(index=np.random.RandomState(1).choice(len(data), len(data)//10, replace=False))
+        loader = create_loader(data.reset_index(drop=True))
+        self.assertIsNotNone(loader.get_vector_field(self.bounds[0]))
+        self.assert_matches_per_cell(loader)
+
+    def test_scattered_df_not_gridded(self):
+        rng = np.random.RandomState(2)
+        num_points = 6000
+        data = pd.DataFrame({'lat': rng.uniform(-10, 10, num_points),
+                             'long': rng.uniform(-180, 180, num_points),
+                             'u': rng.rand(num_points),
+                             'v': rng.rand(num_points)})
+        loader = create_loader(data)
+        start = time.time()
+        self.assertIsNone(loader.get_vector_field(self.bounds[0]))
+        loader.get_hom_condition(self.bounds[0], self.splitting_conds[0])
+        # Would take tens of seconds and gigabytes of memory if gridded
+        self.assertLess(time.time() - start, 5)
+        self.assert_matches_per_cell(loader)